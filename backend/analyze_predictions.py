@@ -1,90 +1,247 @@
 import pandas as pd
 import numpy as np
 import joblib
-from sklearn.metrics import classification_report
-import matplotlib.pyplot as plt
-
-# Load models
-classifier = joblib.load('model/investment_classifier.joblib')
-ranker = joblib.load('model/zip_ranker.joblib')
-
-# Generate a larger test dataset (1000 samples)
-np.random.seed(42)
-n_samples = 1000
-
-# Generate features that match my training data distribution
-test_data = pd.DataFrame({
-    'median_home_value': np.random.uniform(300000, 2000000, n_samples),
-    'median_rent': np.random.uniform(2000, 6000, n_samples),
-    'days_pending': np.random.uniform(10, 45, n_samples),
-    'price_cuts_percent': np.random.uniform(5, 25, n_samples),
-    'market_heat': np.random.uniform(60, 95, n_samples)
-})
-
-# Calculate price to rent ratio
-test_data['price_to_rent'] = test_data['median_home_value'] / (test_data['median_rent'] * 12)
-
-# Get predictions
-predictions = classifier.predict(test_data)
-probabilities = classifier.predict_proba(test_data)
-scores = ranker.predict(test_data)
-
-# Analyze results
-total_recommended = np.sum(predictions == 1)
-percent_recommended = (total_recommended / n_samples) * 100
-
-print("\nPrediction Analysis:")
-print(f"Total samples: {n_samples}")
-print(f"Recommended properties: {total_recommended}")
-print(f"Percentage recommended: {percent_recommended:.2f}%")
-
-# Analyze confidence scores
-confidence_scores = np.max(probabilities, axis=1)
-print("\nConfidence Score Analysis:")
-print(f"Average confidence: {confidence_scores.mean():.2f}")
-print(f"Median confidence: {np.median(confidence_scores):.2f}")
-print("\nConfidence Distribution:")
-print(pd.qcut(confidence_scores, q=5).value_counts())
-
-# Analyze investment scores
-print("\nInvestment Score Analysis:")
-print(f"Average score: {scores.mean():.2f}")
-print(f"Score range: {scores.min():.2f} to {scores.max():.2f}")
-
-# Plot distributions
-plt.figure(figsize=(12, 4))
-
-# Plot 1: Recommendation Distribution
-plt.subplot(131)
-plt.bar(['Not Recommended', 'Recommended'], 
-        [np.sum(predictions == 0), np.sum(predictions == 1)])
-plt.title('Recommendation Distribution')
-plt.ylabel('Count')
-
-# Plot 2: Confidence Score Distribution
-plt.subplot(132)
-plt.hist(confidence_scores, bins=20)
-plt.title('Confidence Score Distribution')
-plt.xlabel('Confidence')
-plt.ylabel('Count')
-
-# Plot 3: Investment Score Distribution
-plt.subplot(133)
-plt.hist(scores, bins=20)
-plt.title('Investment Score Distribution')
-plt.xlabel('Score')
-plt.ylabel('Count')
-
-plt.tight_layout()
-plt.savefig('model/prediction_analysis.png')
-plt.close()
-
-# Analyze relationship between features and recommendations
-print("\nFeature Analysis for Recommended Properties:")
-recommended_data = test_data[predictions == 1]
-not_recommended_data = test_data[predictions == 0]
-
-for column in test_data.columns:
-    print(f"\n{column}:")
-    print(f"Recommended - Mean: {recommended_data[column].mean():.2f}, Median: {recommended_data[column].median():.2f}")
-    print(f"Not Recommended - Mean: {not_recommended_data[column].mean():.2f}, Median: {not_recommended_data[column].median():.2f}")
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+# Fixed histogram bins so per-chunk counts can simply be added together
+CONFIDENCE_BINS = np.linspace(0.5, 1.0, 21)
+SCORE_BINS = np.linspace(0, 100, 21)
+
+# Per-process models and scalers, set up once by the pool initializer
+_worker = {}
+
+def _init_worker():
+    """Load models and the scalers they were trained with once per worker process"""
+    _worker['classifier'] = joblib.load('model/investment_classifier.joblib')
+    _worker['ranker'] = joblib.load('model/zip_ranker.joblib')
+    _worker['clf_scaler'] = joblib.load('model/classifier_scaler.joblib')
+    _worker['rank_scaler'] = joblib.load('model/ranker_scaler.joblib')
+
+def generate_chunk(chunk_index, chunk_size, seed=42):
+    """Generate one chunk of features that match my training data distribution"""
+    # Each chunk gets its own stream so results do not depend on worker scheduling
+    rng = np.random.default_rng([seed, chunk_index])
+    chunk = pd.DataFrame({
+        'median_home_value': rng.uniform(300000, 2000000, chunk_size),
+        'median_rent': rng.uniform(2000, 6000, chunk_size),
+        'days_pending': rng.uniform(10, 45, chunk_size),
+        'price_cuts_percent': rng.uniform(5, 25, chunk_size),
+        'market_heat': rng.uniform(60, 95, chunk_size)
+    })
+    # Calculate price to rent ratio
+    chunk['price_to_rent'] = chunk['median_home_value'] / (chunk['median_rent'] * 12)
+    return chunk
+
+def read_chunks(path, chunk_size):
+    """Read feature rows from a CSV file in chunks"""
+    for chunk in pd.read_csv(path, usecols=FEATURE_COLUMNS, chunksize=chunk_size):
+        yield chunk.dropna()
+
+class PredictionStats:
+    """Running prediction counts, histograms and per-feature summaries that can be merged"""
+
+    def __init__(self):
+        self.rows = 0
+        self.recommended = 0
+        self.confidence_sum = 0.0
+        self.confidence_hist = np.zeros(len(CONFIDENCE_BINS) - 1, dtype=np.int64)
+        self.score_hist = np.zeros(len(SCORE_BINS) - 1, dtype=np.int64)
+        self.score_sum = 0.0
+        self.score_min = np.inf
+        self.score_max = -np.inf
+        # Per group (0 = not recommended, 1 = recommended): count, mean, M2, min, max per feature
+        n_features = len(FEATURE_COLUMNS)
+        self.count = np.zeros(2, dtype=np.int64)
+        self.mean = np.zeros((2, n_features))
+        self.m2 = np.zeros((2, n_features))
+        self.min = np.full((2, n_features), np.inf)
+        self.max = np.full((2, n_features), -np.inf)
+
+    def update(self, features, predictions, probabilities, scores):
+        """Add one scored chunk"""
+        confidence = probabilities.max(axis=1)
+        self.rows += len(predictions)
+        self.recommended += int((predictions == 1).sum())
+        self.confidence_sum += float(confidence.sum())
+        self.confidence_hist += np.histogram(np.clip(confidence, 0.5, 1.0), CONFIDENCE_BINS)[0]
+        self.score_hist += np.histogram(np.clip(scores, 0, 100), SCORE_BINS)[0]
+        self.score_sum += float(scores.sum())
+        self.score_min = min(self.score_min, float(scores.min()))
+        self.score_max = max(self.score_max, float(scores.max()))
+
+        values = features[FEATURE_COLUMNS].to_numpy()
+        for group in (0, 1):
+            rows = values[predictions == group]
+            if len(rows) == 0:
+                continue
+            self._merge_moments(group, len(rows), rows.mean(axis=0), rows.var(axis=0) * len(rows))
+            self.min[group] = np.minimum(self.min[group], rows.min(axis=0))
+            self.max[group] = np.maximum(self.max[group], rows.max(axis=0))
+
+    def _merge_moments(self, group, count, mean, m2):
+        """Combine running mean and variance with another batch (Chan et al.)"""
+        total = self.count[group] + count
+        delta = mean - self.mean[group]
+        self.mean[group] += delta * count / total
+        self.m2[group] += m2 + delta ** 2 * self.count[group] * count / total
+        self.count[group] = total
+
+    def merge(self, other):
+        """Fold another accumulator (e.g. from a worker) into this one"""
+        self.rows += other.rows
+        self.recommended += other.recommended
+        self.confidence_sum += other.confidence_sum
+        self.confidence_hist += other.confidence_hist
+        self.score_hist += other.score_hist
+        self.score_sum += other.score_sum
+        self.score_min = min(self.score_min, other.score_min)
+        self.score_max = max(self.score_max, other.score_max)
+        for group in (0, 1):
+            if other.count[group]:
+                self._merge_moments(group, other.count[group], other.mean[group], other.m2[group])
+                self.min[group] = np.minimum(self.min[group], other.min[group])
+                self.max[group] = np.maximum(self.max[group], other.max[group])
+        return self
+
+def histogram_median(hist, bins):
+    """Approximate median from a fixed-bin histogram"""
+    cumulative = np.cumsum(hist)
+    if cumulative[-1] == 0:
+        return float('nan')
+    i = int(np.searchsorted(cumulative, cumulative[-1] / 2))
+    return float((bins[i] + bins[i + 1]) / 2)
+
+def score_chunk(task):
+    """Scale and score one chunk, returning only its accumulated statistics"""
+    source, payload, chunk_size, seed = task
+    features = generate_chunk(payload, chunk_size, seed) if source == 'generate' else payload
+
+    # Models were trained on scaled features, so scale with the matching scaler
+    clf_features = _worker['clf_scaler'].transform(features[FEATURE_COLUMNS])
+    rank_features = _worker['rank_scaler'].transform(features[FEATURE_COLUMNS])
+    probabilities = _worker['classifier'].predict_proba(clf_features)
+    predictions = probabilities.argmax(axis=1)
+    scores = _worker['ranker'].predict(rank_features)
+
+    stats = PredictionStats()
+    stats.update(features, predictions, probabilities, scores)
+    return stats
+
+def _tasks(n_rows, chunk_size, seed, input_path):
+    """Yield one task per chunk, either a chunk index to generate or rows read from a file"""
+    if input_path:
+        for chunk in read_chunks(input_path, chunk_size):
+            yield ('read', chunk, chunk_size, seed)
+    else:
+        for chunk_index, start in enumerate(range(0, n_rows, chunk_size)):
+            yield ('generate', chunk_index, min(chunk_size, n_rows - start), seed)
+
+def analyze_predictions(n_rows=1000, chunk_size=100000, workers=None, seed=42, input_path=None):
+    """Score rows chunk by chunk on a process pool with a bounded number of chunks in flight"""
+    start_time = time.time()
+    workers = workers or os.cpu_count() or 1
+    stats = PredictionStats()
+    pending = set()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        for task in _tasks(n_rows, chunk_size, seed, input_path):
+            # Keep memory constant: never hold more than two chunks per worker
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stats.merge(future.result())
+            pending.add(pool.submit(score_chunk, task))
+        for future in pending:
+            stats.merge(future.result())
+    print(f"\nScored {stats.rows:,} rows in {time.time() - start_time:.1f}s on {workers} workers")
+    return stats
+
+def report(stats):
+    """Print the prediction analysis"""
+    if stats.rows == 0:
+        print("\nNo rows were scored")
+        return
+    percent_recommended = (stats.recommended / stats.rows) * 100
+
+    print("\nPrediction Analysis:")
+    print(f"Total samples: {stats.rows}")
+    print(f"Recommended properties: {stats.recommended}")
+    print(f"Percentage recommended: {percent_recommended:.2f}%")
+
+    # Analyze confidence scores
+    print("\nConfidence Score Analysis:")
+    print(f"Average confidence: {stats.confidence_sum / stats.rows:.2f}")
+    print(f"Median confidence: {histogram_median(stats.confidence_hist, CONFIDENCE_BINS):.2f}")
+    print("\nConfidence Distribution:")
+    for low, high, count in zip(CONFIDENCE_BINS[:-1], CONFIDENCE_BINS[1:], stats.confidence_hist):
+        print(f"({low:.3f}, {high:.3f}]    {count}")
+
+    # Analyze investment scores
+    print("\nInvestment Score Analysis:")
+    print(f"Average score: {stats.score_sum / stats.rows:.2f}")
+    print(f"Score range: {stats.score_min:.2f} to {stats.score_max:.2f}")
+
+    # Analyze relationship between features and recommendations
+    print("\nFeature Analysis for Recommended Properties:")
+    for i, column in enumerate(FEATURE_COLUMNS):
+        print(f"\n{column}:")
+        for group, label in ((1, 'Recommended'), (0, 'Not Recommended')):
+            if stats.count[group] == 0:
+                print(f"{label} - no rows")
+                continue
+            std = np.sqrt(stats.m2[group, i] / stats.count[group])
+            print(f"{label} - Mean: {stats.mean[group, i]:.2f}, Std: {std:.2f}, "
+                  f"Min: {stats.min[group, i]:.2f}, Max: {stats.max[group, i]:.2f}")
+
+def plot(stats, path='model/prediction_analysis.png'):
+    """Plot distributions from the accumulated histograms"""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    plt.figure(figsize=(12, 4))
+
+    # Plot 1: Recommendation Distribution
+    plt.subplot(131)
+    plt.bar(['Not Recommended', 'Recommended'],
+            [stats.rows - stats.recommended, stats.recommended])
+    plt.title('Recommendation Distribution')
+    plt.ylabel('Count')
+
+    # Plot 2: Confidence Score Distribution
+    plt.subplot(132)
+    plt.stairs(stats.confidence_hist, CONFIDENCE_BINS, fill=True)
+    plt.title('Confidence Score Distribution')
+    plt.xlabel('Confidence')
+    plt.ylabel('Count')
+
+    # Plot 3: Investment Score Distribution
+    plt.subplot(133)
+    plt.stairs(stats.score_hist, SCORE_BINS, fill=True)
+    plt.title('Investment Score Distribution')
+    plt.xlabel('Score')
+    plt.ylabel('Count')
+
+    plt.tight_layout()
+    plt.savefig(path)
+    plt.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze model predictions over synthetic or recorded feature rows')
+    parser.add_argument('--rows', type=int, default=1000, help='Synthetic rows to generate')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Rows scored per chunk')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for synthetic rows')
+    parser.add_argument('--input', default=None, help='CSV of feature rows to score instead of synthetic data')
+    parser.add_argument('--no-plot', action='store_true', help='Skip writing model/prediction_analysis.png')
+    args = parser.parse_args()
+
+    stats = analyze_predictions(args.rows, args.chunk_size, args.workers, args.seed, args.input)
+    report(stats)
+    if not args.no_plot:
+        plot(stats)
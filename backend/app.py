@@ -1,17 +1,61 @@
-from flask import Flask, request, jsonify, send_from_directory
+import time
+STARTED = time.perf_counter()
+
+from flask import Flask, request, jsonify, send_from_directory, Response, g, has_request_context
 from flask_cors import CORS
-from flasgger import Swagger
-import pandas as pd
-import numpy as np
-import joblib
 import os
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import base64
+import importlib.util
 from pathlib import Path
 from database import MONGO_URI, Database
+from resilient_db import ResilientDatabase, DatabaseUnavailable
+import sharding
+from model_registry import ModelRegistry, list_versions
+from state_cache import SingleFlight, StateCache
+from startup import LazyModule, LazyObject, LazyDocsMiddleware, StartupReport, Warmup
+import request_metrics
+import profiling
+from request_metrics import stage, record_cache
+
+# Heavy modules are imported on first use or by the warm-up thread
+pd = LazyModule('pandas')
+feature_store = LazyModule('feature_store')
+msa_table = LazyModule('msa_table')
+market_index = LazyModule('market_index')
+shared_table = LazyModule('shared_table')
+compact_records = LazyModule('compact_records')
+sensitivity = LazyModule('sensitivity')
+contributions = LazyModule('contributions')
+search_index = LazyModule('search_index')
+bulk_export = LazyModule('bulk_export')
+similar_markets = LazyModule('similar_markets')
+jobs = LazyModule('jobs')
+
+# Seconds between checks of the data version stamped by preprocessing
+DATA_VERSION_CHECK_INTERVAL = float(os.getenv('DATA_VERSION_CHECK_INTERVAL', '5'))
+
+# Threads used to precompute every state after startup or a reload (0 disables)
+STATE_WARMUP_WORKERS = int(os.getenv('STATE_WARMUP_WORKERS', '4'))
+
+# LAZY_STARTUP=0 loads everything before the module finishes importing
+LAZY_STARTUP = os.getenv('LAZY_STARTUP', '1') != '0'
+# WARMUP_ON_IMPORT=0 leaves warmup.start() to the importer, e.g. after swapping in a stand-in database
+WARMUP_ON_IMPORT = os.getenv('WARMUP_ON_IMPORT', '1') != '0'
+# How long a request waits for the warm-up before answering 503
+READY_TIMEOUT = float(os.getenv('READY_TIMEOUT', '30'))
+# First and longest wait between retries of a failed warm-up phase (e.g. Mongo down at boot)
+WARMUP_RETRY_SECONDS = float(os.getenv('WARMUP_RETRY_SECONDS', '1'))
+WARMUP_MAX_RETRY_SECONDS = float(os.getenv('WARMUP_MAX_RETRY_SECONDS', '30'))
+
+startup_report = StartupReport(STARTED)
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+request_metrics.init_app(app)  # Per-stage timers, Server-Timing headers and /metrics
+profiling.init_app(app)  # Opt-in per-request profiling, see PROFILING_ENABLED
 
 # Configure Swagger
 swagger_config = {
@@ -29,17 +73,226 @@ swagger_config = {
     "specs_route": "/swagger/"
 }
 
-swagger = Swagger(app, config=swagger_config)
+def build_docs_app():
+    """Build the Swagger UI app; the spec is generated from this app's routes on request"""
+    from flasgger import Swagger
+    
+    class APISwagger(Swagger):
+        def get_apispecs(self, endpoint='apispec'):
+            # Generate the spec from the API app's routes and docstrings
+            with app.app_context():
+                return super().get_apispecs(endpoint)
+    
+    docs_app = Flask('docs')
+    APISwagger(docs_app, config=swagger_config)
+    startup_report.mark('swagger_ready')
+    return docs_app
+
+app.wsgi_app = LazyDocsMiddleware(app.wsgi_app, build_docs_app,
+                                  ['/swagger', '/apispec.json', '/flasgger_static'])
+
+# Load models and scalers from the registry (falls back to the flat files in model/)
+models = ModelRegistry()
+# Precompute every state for the new model as soon as a reload swaps it in
+models.listeners.append(lambda bundle: threading.Thread(target=state_generation, args=(bundle,), daemon=True).start())
+
+def materialize_msa_table(bundle):
+    """Add the MSA table rows of this model version, unless a job or another worker already did"""
+    if bundle.version in db.get_msa_model_versions():
+        return
+    msa_table.refresh_msa_table(db, db.get_zip_data(), bundle, keep_versions=True)
+    app.logger.info(f"Materialized the MSA table for model version {bundle.version}")
+
+def materialize_msa_table_quietly(bundle):
+    try:
+        materialize_msa_table(bundle)
+    except Exception as e:
+        app.logger.warning(f"Failed to materialize the MSA table for {bundle.version}: {str(e)}")
+
+# /api/msi-analysis aggregates on the fly until the new version's rows are stored
+models.listeners.append(lambda bundle: threading.Thread(target=materialize_msa_table_quietly, args=(bundle,),
+                                                        daemon=True).start())
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+
+def reload_after_job(job):
+    """Bring this worker up to date with what a finished job produced; other workers poll"""
+    if job['kind'] == 'retrain':
+        # Publishing already moved ACTIVE; this worker just follows it sooner
+        models.reload(job['result']['model_version'], activate=False)
+    elif job['kind'] == 'reprocess':
+        # Re-read the data version now instead of at the next check, then warm the new data
+        _data_version['checked_at'] = 0.0
+        threading.Thread(target=state_generation, args=(models.active,), daemon=True).start()
+
+def create_job_manager():
+    manager = jobs.JobManager()
+    manager.listeners.append(reload_after_job)
+    return manager
+
+# Retraining, evaluation and reprocessing run in separate processes, see jobs.py
+job_manager = LazyObject(create_job_manager)
+
+def flag_stale_data(age):
+    """Called when a read was answered from the last known good snapshot"""
+    if has_request_context():
+        g.data_age = max(g.get('data_age', 0.0), age)
+
+# Initialize database connection on first use; reads have deadlines and a snapshot fallback
+db = LazyObject(lambda: ResilientDatabase(Database(), on_stale=flag_stale_data))
+
+def database_unavailable(e):
+    response = jsonify({'error': str(e)})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+# Monthly history matrices are memory-mapped on first use and shared read-only
+_feature_store = None
+
+def get_feature_store():
+    """Open the feature store, reopening it if preprocessing rebuilt it"""
+    global _feature_store
+    store_dir = feature_store.FEATURE_STORE_DIR
+    index_mtime = os.path.getmtime(os.path.join(store_dir, 'index.json'))
+    hit = _feature_store is not None and _feature_store[0] == index_mtime
+    record_cache('feature_store', hit)
+    if not hit:
+        _feature_store = (index_mtime, feature_store.FeatureStore(store_dir))
+    return _feature_store[1]
+
+_data_version = {'version': None, 'checked_at': 0.0}
+
+def current_data_version():
+    """Data version from MongoDB, re-read at most every DATA_VERSION_CHECK_INTERVAL seconds"""
+    now = time.time()
+    if now - _data_version['checked_at'] >= DATA_VERSION_CHECK_INTERVAL:
+        _data_version['version'] = db.get_data_version()
+        _data_version['checked_at'] = now
+    return _data_version['version']
+
+# Scored columnar index of every ZIP code, rebuilt per data and model version.
+# Its arrays are a shared table published once and mapped by every worker
+_market_index = None
+_market_index_lock = threading.Lock()
+
+def get_market_index(bundle):
+    """Return the market index for the current data version and this model bundle"""
+    global _market_index
+    key = (current_data_version(), bundle.version)
+    hit = _market_index is not None and _market_index[0] == key
+    record_cache('market_index', hit)
+    if not hit:
+        with _market_index_lock:
+            # Another request may have built it while we waited
+            if _market_index is None or _market_index[0] != key:
+                # Built once per data/model version across all workers, then memory-mapped
+                table = shared_table.attach_table(key[0], bundle, db.get_zip_data)
+                _market_index = (key, market_index.MarketIndex(table))
+    return _market_index[1]
+
+# Typeahead prefix index over ZIP codes, cities and MSAs, rebuilt per data version
+_search_index = None
+_search_index_lock = threading.Lock()
+
+def get_search_index():
+    """Return the search index for the current data version"""
+    global _search_index
+    version = current_data_version()
+    hit = _search_index is not None and _search_index[0] == version
+    record_cache('search_index', hit)
+    if not hit:
+        with _search_index_lock:
+            if _search_index is None or _search_index[0] != version:
+                _search_index = (version, search_index.SearchIndex(db.get_zip_data(), version))
+    return _search_index[1]
+
+# KD-tree of MSAs in the classifier's scaled feature space, rebuilt with the market index
+_similar_markets = None
+_similar_markets_lock = threading.Lock()
+
+def get_similar_markets(bundle):
+    """Return the similar-markets index for the current market index"""
+    global _similar_markets
+    index = get_market_index(bundle)
+    hit = _similar_markets is not None and _similar_markets[0] is index
+    record_cache('similar_markets', hit)
+    if not hit:
+        with _similar_markets_lock:
+            if _similar_markets is None or _similar_markets[0] is not index:
+                _similar_markets = (index, similar_markets.SimilarMarkets(index, bundle))
+    return _similar_markets[1]
+
+# In state-sharded mode this process owns only the states the shard map gives it
+shard_map = sharding.shard_map_from_env()
+
+def owns_state(state_code):
+    return shard_map is None or shard_map.shard_for_state(state_code) == sharding.SHARD_ID
+
+def misdirected(state_code):
+    """421 for a state that another shard owns, so a misconfigured router is obvious"""
+    shard = shard_map.shard_for_state(state_code)
+    return jsonify({'error': f'State {state_code.upper()} is served by shard {shard}', 'shard': shard}), 421
+
+# Per-state recommendation bodies by (data version, model version), with single-flight misses
+state_cache = StateCache()
+state_flights = SingleFlight()
+
+def check_database():
+    """Ping Mongo; while it is down, a last known good snapshot lets the worker serve anyway"""
+    if not db.ping():
+        app.logger.warning(f"Database unreachable, serving from the snapshot: {db.status()['last_error']}")
+
+# Warm-up: models, database connection and pandas gate readiness; docs do not
+warmup = Warmup(startup_report, retry_backoff=WARMUP_RETRY_SECONDS, max_backoff=WARMUP_MAX_RETRY_SECONDS)
+warmup.add('models_loaded', models.load_active)
+warmup.add('database_connected', check_database)
+warmup.add('pandas_imported', lambda: pd.DataFrame)
+warmup.add('swagger_ready', lambda: app.wsgi_app.docs.get(), required=False)
+warmup.add('states_warmed', lambda: state_generation(models.active, background=False), required=False)
+warmup.add('search_index_built', get_search_index, required=False)
+warmup.add('market_index_built', lambda: get_market_index(models.active), required=False)
+warmup.add('similar_markets_built', lambda: get_similar_markets(models.active), required=False)
+warmup.add('msa_table_current', lambda: materialize_msa_table(models.active), required=False)
+
+# Endpoints that can be served before the warm-up finishes
+NO_WARMUP_ENDPOINTS = {'health_check', 'readiness_check', 'metrics', 'static'}
 
-# Load models and scalers
-classifier = joblib.load('model/investment_classifier.joblib')
-ranker = joblib.load('model/zip_ranker.joblib')
-clf_scaler = joblib.load('model/classifier_scaler.joblib')
-rank_scaler = joblib.load('model/ranker_scaler.joblib')
-model_info = joblib.load('model/model_info.joblib')
+@app.before_request
+def wait_for_warmup():
+    if request.endpoint in NO_WARMUP_ENDPOINTS or warmup.ready.is_set():
+        return None
+    if warmup.failed:
+        # Being retried in the background; waiting here would only hold the request
+        response = jsonify({'error': f"Service is not ready: {', '.join(warmup.failed)} failed",
+                            'startup': startup_report.as_dict()})
+        response.headers['Retry-After'] = str(int(WARMUP_RETRY_SECONDS) or 1)
+        return response, 503
+    if not warmup.wait(READY_TIMEOUT):
+        response = jsonify({'error': 'Service is starting up', 'startup': startup_report.as_dict()})
+        response.headers['Retry-After'] = '1'
+        return response, 503
+    return None
 
-# Initialize database connection
-db = Database()
+@app.before_request
+def check_model_version():
+    # Pick up versions activated by another worker
+    if warmup.ready.is_set():
+        models.check_for_update()
+
+@app.after_request
+def add_model_version_header(response):
+    if models.active is not None:
+        response.headers['X-Model-Version'] = models.active.version
+    return response
+
+@app.after_request
+def add_stale_data_headers(response):
+    # Served from the snapshot while the database was late: say how old the data is
+    if 'data_age' in g:
+        response.headers['X-Data-Age'] = str(int(g.data_age))
+        response.headers['Warning'] = '110 - "Response is Stale"'
+    return response
 
 def find_nearby_zips(target_zip, all_zips, num_closest=3):
     """Find closest ZIP codes based on numeric proximity"""
@@ -55,6 +308,85 @@ def find_nearby_zips(target_zip, all_zips, num_closest=3):
     except ValueError:
         return []
 
+def compute_recommendations(state_code, bundle):
+    """Score, sort and serialize one state's recommendations; None if the state has no data"""
+    # Get data for the requested state from MongoDB
+    with stage('mongo_fetch'):
+        state_records = db.get_state_records(state_code)
+    
+    if len(state_records) == 0:
+        return None
+    
+    # Compact column-oriented rows instead of an object-dtype frame
+    with stage('dataframe'):
+        records = compact_records.ZipRecords.from_records(state_records)
+        features = records.features()
+    
+    # Scale features
+    with stage('scaling'):
+        clf_features = bundle.clf_scaler.transform(features)
+        rank_features = bundle.rank_scaler.transform(features)
+    
+    # Get investment scores and rankings
+    with stage('inference'):
+        investment_scores = bundle.classifier.predict_proba(clf_features)[:, 1]
+        ranking_scores = bundle.ranker.predict(rank_features)
+    
+    # Sort by ranking score, with the same ordering DataFrame.sort_values gives
+    with stage('sorting'):
+        order = pd.Series(ranking_scores).sort_values(ascending=False).index.to_numpy()
+    
+    # Serialize once; the cached body is served as is
+    with stage('serialization'):
+        recommendations = records.take(order).to_dicts({
+            'investment_score': investment_scores[order],
+            'ranking_score': ranking_scores[order]
+        })
+        return app.json.dumps({'recommendations': recommendations, 'model_version': bundle.version})
+
+def cached_recommendations(state_code, bundle, generation):
+    """
+    Return (body, source) for a state, where source is 'cache', 'shared'
+    (joined an identical in-flight computation) or 'computed'.
+    """
+    body = state_cache.get(generation, state_code)
+    if body is not None:
+        return body, 'cache'
+    
+    def compute():
+        result = compute_recommendations(state_code, bundle)
+        if result is not None:
+            state_cache.put(generation, state_code, result)
+        return result
+    
+    body, shared = state_flights.do((generation, state_code), compute)
+    return body, 'shared' if shared else 'computed'
+
+def warm_state_cache(bundle, generation):
+    """Precompute every state for a new generation on a small thread pool"""
+    started = time.perf_counter()
+    
+    def warm(state_code):
+        try:
+            cached_recommendations(state_code, bundle, generation)
+        except Exception as e:
+            app.logger.warning(f"State warm-up failed for {state_code}: {str(e)}")
+    
+    states = [state_code for state_code in db.get_states() if owns_state(state_code)]
+    with ThreadPoolExecutor(max_workers=STATE_WARMUP_WORKERS, thread_name_prefix='state-warmup') as pool:
+        list(pool.map(warm, states))
+    app.logger.info(f"Warmed {len(states)} states for {generation} in {time.perf_counter() - started:.2f}s")
+
+def state_generation(bundle, background=True):
+    """Cache generation for this bundle; warms every state the first time a generation is seen"""
+    generation = (current_data_version(), bundle.version)
+    if state_cache.add_generation(generation) and STATE_WARMUP_WORKERS > 0:
+        if background:
+            threading.Thread(target=warm_state_cache, args=(bundle, generation), daemon=True).start()
+        else:
+            warm_state_cache(bundle, generation)
+    return generation
+
 @app.route('/api/recommendations/<state_code>', methods=['GET'])
 def get_state_recommendations(state_code):
     """
@@ -71,55 +403,34 @@ def get_state_recommendations(state_code):
         description: List of recommended zip codes with investment metrics
       400:
         description: Invalid state code
+      421:
+        description: State is served by another shard (state-sharded mode)
       500:
         description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
     """
     try:
-        # Get data for the requested state from MongoDB
-        state_data = db.get_state_data(state_code)
+        if not owns_state(state_code):
+            return misdirected(state_code)
         
-        if len(state_data) == 0:
-            return jsonify({'error': f'No data available for state {state_code}'}), 404
+        # Use one model version for the whole request, even if a reload swaps it
+        bundle = models.active
+        generation = state_generation(bundle)
         
-        # Prepare features for models
-        features = state_data[['median_home_value', 'median_rent', 'days_pending', 
-                             'price_cuts_percent', 'market_heat', 'price_to_rent']]
+        body, source = cached_recommendations(state_code, bundle, generation)
+        record_cache('state_results', source == 'cache')
+        if source != 'cache':
+            # Concurrent misses for the same state share one computation
+            record_cache('state_inflight', source == 'shared')
         
-        # Scale features
-        clf_features = clf_scaler.transform(features)
-        rank_features = rank_scaler.transform(features)
-        
-        # Get investment scores and rankings
-        investment_scores = classifier.predict_proba(clf_features)[:, 1]
-        ranking_scores = ranker.predict(rank_features)
-        
-        # Combine scores
-        state_data['investment_score'] = investment_scores
-        state_data['ranking_score'] = ranking_scores
-        
-        # Sort by ranking score
-        state_data = state_data.sort_values('ranking_score', ascending=False)
-        
-        # Prepare response
-        recommendations = []
-        for _, row in state_data.iterrows():
-            recommendations.append({
-                'zip_code': row['zip_code'],
-                'city': row['city'],
-                'state': row['state'],
-                'region_id': str(row['region_id']),
-                'msa_name': row['msa_name'],
-                'median_home_value': float(row['median_home_value']),
-                'median_rent': float(row['median_rent']),
-                'days_pending': float(row['days_pending']),
-                'price_cuts_percent': float(row['price_cuts_percent']),
-                'market_heat': float(row['market_heat']),
-                'price_to_rent': float(row['price_to_rent']),
-                'investment_score': float(row['investment_score']),
-                'ranking_score': float(row['ranking_score'])
-            })
+        if body is None:
+            return jsonify({'error': f'No data available for state {state_code}'}), 404
         
-        return jsonify({'recommendations': recommendations})
+        return Response(body, mimetype='application/json')
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -142,27 +453,33 @@ def get_zip_analysis(zip_code):
         description: Invalid ZIP code
       500:
         description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
     """
     try:
+        bundle = models.active
+        
         # Format ZIP code
         zip_code = str(zip_code).zfill(5)
         
         # Get data for the requested ZIP code from MongoDB
-        zip_info = db.get_zip_info(zip_code)
+        with stage('mongo_fetch'):
+            zip_info = db.get_zip_info(zip_code)
         
-        # Get all ZIP codes for finding nearby ones
-        all_zip_data = db.get_zip_data()
-        all_zips = all_zip_data['zip_code'].tolist()
+        # Nearby ZIP codes and percentiles come from the shared market index
+        with stage('index'):
+            index = get_market_index(bundle)
         
         # Find nearby ZIP codes
-        nearby_zips = find_nearby_zips(zip_code, all_zips)
-        
-        # Get data for nearby ZIP codes
-        nearby_data = []
-        for nearby_zip in nearby_zips:
-            nearby_info = db.get_zip_info(nearby_zip)
-            if nearby_info:
-                nearby_data.append(nearby_info)
+        with stage('nearby'):
+            nearby_zips = index.nearby_zip_codes(zip_code)
+            
+            # Get data for nearby ZIP codes
+            nearby_data = []
+            for nearby_zip in nearby_zips:
+                nearby_info = db.get_zip_info(nearby_zip)
+                if nearby_info:
+                    nearby_data.append(nearby_info)
         
         if not zip_info:
             error_msg = f'No data available for ZIP code {zip_code}'
@@ -178,29 +495,37 @@ def get_zip_analysis(zip_code):
                   'price_cuts_percent', 'market_heat', 'price_to_rent']
         
         percentiles = {}
-        for metric in metrics:
-            all_values = all_zip_data[metric]
-            value = zip_info[metric]
-            percentile = (all_values < value).mean() * 100
-            percentiles[f'{metric}_percentile'] = float(percentile)
+        with stage('percentiles'):
+            for metric in metrics:
+                percentiles[f'{metric}_percentile'] = index.percentile(metric, zip_info[metric])
         
         # Prepare features for models
-        features = pd.DataFrame([{
-            'median_home_value': zip_info['median_home_value'],
-            'median_rent': zip_info['median_rent'],
-            'days_pending': zip_info['days_pending'],
-            'price_cuts_percent': zip_info['price_cuts_percent'],
-            'market_heat': zip_info['market_heat'],
-            'price_to_rent': zip_info['price_to_rent']
-        }])
+        with stage('dataframe'):
+            features = pd.DataFrame([{
+                'median_home_value': zip_info['median_home_value'],
+                'median_rent': zip_info['median_rent'],
+                'days_pending': zip_info['days_pending'],
+                'price_cuts_percent': zip_info['price_cuts_percent'],
+                'market_heat': zip_info['market_heat'],
+                'price_to_rent': zip_info['price_to_rent']
+            }])
         
         # Scale features
-        clf_features = clf_scaler.transform(features)
-        rank_features = rank_scaler.transform(features)
+        with stage('scaling'):
+            clf_features = bundle.clf_scaler.transform(features)
+            rank_features = bundle.rank_scaler.transform(features)
         
         # Get scores
-        investment_score = float(classifier.predict_proba(clf_features)[0, 1])
-        ranking_score = float(ranker.predict(rank_features)[0])
+        with stage('inference'):
+            investment_score = float(bundle.classifier.predict_proba(clf_features)[0, 1])
+            ranking_score = float(bundle.ranker.predict(rank_features)[0])
+        
+        # Why the ZIP scored this way: cached with the shared table, computed here if missing
+        with stage('contributions'):
+            row = index.row_for_zip(zip_code)
+            explained = index.contributions(row) if row is not None else contributions.explain(bundle, features)
+            score_contributions = {name: contributions.format_contributions(bias, values[0] if row is None else values)
+                                   for name, (bias, values) in explained.items()}
         
         # Prepare response in the structure expected by frontend
         response = {
@@ -221,19 +546,102 @@ def get_zip_analysis(zip_code):
                 'price_to_rent': float(zip_info['price_to_rent'])
             },
             'percentiles': percentiles,
+            'contributions': score_contributions,
             'nearby_zips': nearby_data,
-            'model_info': model_info
+            'model_info': bundle.model_info,
+            'model_version': bundle.version
         }
         
-        return jsonify(response)
+        with stage('serialization'):
+            return jsonify(response)
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/analysis/<zip_code>/sensitivity', methods=['GET'])
+def get_zip_sensitivity(zip_code):
+    """
+    What-if response surface: scores over a grid of feature changes for a ZIP code
+    ---
+    parameters:
+      - name: zip_code
+        in: path
+        type: string
+        required: true
+        description: 5-digit ZIP code
+      - name: x
+        in: query
+        type: string
+        required: true
+        description: "First axis in percent, 'feature:start:stop:steps' (e.g. 'median_rent:-10:10:5') or 'feature:v1,v2,...' (e.g. 'days_pending:-20,-10,0')"
+      - name: y
+        in: query
+        type: string
+        required: false
+        description: Optional second axis, same format
+    responses:
+      200:
+        description: Baseline scores and investment/ranking scores for every grid point (price_to_rent is recomputed)
+      400:
+        description: Invalid axis
+      404:
+        description: No data for the ZIP code
+      500:
+        description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
+    """
+    try:
+        bundle = models.active
+        zip_code = str(zip_code).zfill(5)
+        
+        try:
+            if 'x' not in request.args:
+                raise ValueError("Query parameter 'x' is required")
+            axes = [sensitivity.parse_axis(request.args[name]) for name in ('x', 'y') if name in request.args]
+            if len(axes) == 2 and axes[0][0] == axes[1][0]:
+                raise ValueError('The two axes must vary different features')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        with stage('mongo_fetch'):
+            zip_info = db.get_zip_info(zip_code)
+        
+        if not zip_info:
+            return jsonify({'error': f'No data available for ZIP code {zip_code}'}), 404
+        
+        # The baseline and the whole grid go through each scaler and model in one batch
+        with stage('inference'):
+            baseline, surface = sensitivity.response_surface(zip_info, axes, bundle)
+        
+        with stage('serialization'):
+            response = jsonify({
+                'zip_code': zip_code,
+                'baseline': {
+                    'features': {column: float(zip_info[column]) for column in sensitivity.FEATURE_COLUMNS},
+                    **baseline
+                },
+                'surface': surface,
+                'model_version': bundle.version
+            })
+        
+        return response
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
+    except Exception as e:
+        app.logger.error(f"Error in get_zip_sensitivity: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/msi-analysis/<state_code>', methods=['GET'])
 def get_msi_analysis(state_code):
     """
-    Return unique MSIs and their investment scores for a given state
+    Return unique MSIs and their investment scores for a given state.
+    Served from the table materialized by preprocessing and on model switches (see msa_table.py)
     ---
     parameters:
       - name: state_code
@@ -243,69 +651,560 @@ def get_msi_analysis(state_code):
         description: Two-letter state code (e.g., 'MA')
     responses:
       200:
-        description: List of MSIs with their investment scores
+        description: List of MSIs with ZIP count, mean/min/max investment scores and MSA features
+      404:
+        description: No data for the state
+      421:
+        description: State is served by another shard (state-sharded mode)
+      500:
+        description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
+    """
+    try:
+        if not owns_state(state_code):
+            return misdirected(state_code)
+        
+        bundle = models.active
+        
+        # Materialized per-MSA aggregates: a single indexed read
+        with stage('mongo_fetch'):
+            summary = db.get_msa_summary(state_code.upper(), bundle.version)
+        
+        hit = summary is not None and summary.get('model_version') == bundle.version
+        record_cache('msa_table', hit)
+        if hit:
+            msi_list = summary['data']
+        else:
+            # Table missing or scored by another model version: aggregate on the fly
+            with stage('mongo_fetch_state'):
+                state_records = db.get_state_records(state_code.upper())
+            
+            if len(state_records) == 0:
+                return jsonify({'error': f'No data found for state {state_code}'}), 404
+            
+            with stage('dataframe'):
+                df = pd.DataFrame(state_records)
+                features = df[['median_home_value', 'median_rent', 'days_pending', 
+                              'price_cuts_percent', 'market_heat', 'price_to_rent']]
+            
+            with stage('scaling'):
+                clf_features = bundle.clf_scaler.transform(features)
+            
+            with stage('inference'):
+                scores = bundle.classifier.predict_proba(clf_features)[:, 1]
+            
+            with stage('aggregation'):
+                msi_list = msa_table.summarize_msas(df, scores)
+        
+        with stage('serialization'):
+            response = jsonify({'msi_data': msi_list, 'model_version': bundle.version})
+        
+        return response
+        
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
+    except Exception as e:
+        app.logger.error(f"Error in get_msi_analysis: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/screen', methods=['GET'])
+def screen_markets():
+    """
+    Screen every ZIP code with range filters on features and scores
+    ---
+    parameters:
+      - name: filters
+        in: query
+        type: string
+        required: false
+        description: "Range conditions joined by '&', e.g. price_to_rent<15&market_heat>70&investment_score>0.6. Fields: median_home_value, median_rent, days_pending, price_cuts_percent, market_heat, price_to_rent, investment_score, ranking_score"
+      - name: state
+        in: query
+        type: string
+        required: false
+        description: Comma-separated state codes (e.g., 'CA,TX')
+      - name: msa
+        in: query
+        type: string
+        required: false
+        description: MSA region id or name (e.g., 'Boston, MA')
+      - name: sort
+        in: query
+        type: string
+        required: false
+        description: Field to sort by (default ranking_score)
+      - name: order
+        in: query
+        type: string
+        required: false
+        description: "'desc' (default) or 'asc'"
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Page size, at most 1000 (default 50)
+      - name: offset
+        in: query
+        type: integer
+        required: false
+        description: Rows to skip (default 0)
+    responses:
+      200:
+        description: Total number of matches and one sorted page of ZIP codes
       400:
-        description: Invalid state code
+        description: Invalid filter or option
       500:
         description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
     """
     try:
-        # Get data from MongoDB
-        db = Database()
-        df = db.get_state_data(state_code.upper())
+        bundle = models.active
         
-        if df.empty:
-            return jsonify({'error': f'No data found for state {state_code}'}), 404
+        try:
+            query = market_index.parse_screen_query(request.query_string.decode('utf-8'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        with stage('index'):
+            index = get_market_index(bundle)
+        
+        states, limit, offset = query['states'], query['limit'], query['offset']
+        if shard_map is not None:
+            # Only this shard's states; the router merges the shards' pages
+            states = shard_map.states_for(sharding.SHARD_ID, states or index.state_rows)
+            if request.args.get('_scatter'):
+                if offset + limit > sharding.SCATTER_WINDOW:
+                    return jsonify({'error': f'offset + limit must be at most {sharding.SCATTER_WINDOW} '
+                                             f'when screening across shards'}), 400
+                # Every shard returns its first offset + limit rows
+                limit, offset = offset + limit, 0
+        
+        with stage('screen'):
+            if states == []:
+                total, rows = 0, []
+            else:
+                total, rows = index.screen(query['filters'], states, query['msa'], query['sort'],
+                                           query['descending'], limit, offset)
+        
+        with stage('serialization'):
+            response = jsonify({
+                'total': total,
+                'results': index.records(rows),
+                'query': query,
+                'data_version': index.data_version,
+                'model_version': bundle.version
+            })
+        
+        return response
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
+    except Exception as e:
+        app.logger.error(f"Error in screen_markets: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-        # Prepare features for models
-        features = df[['median_home_value', 'median_rent', 'days_pending', 
-                      'price_cuts_percent', 'market_heat', 'price_to_rent']]
+@app.route('/api/search', methods=['GET'])
+def search():
+    """
+    Typeahead suggestions for ZIP codes, cities and MSAs
+    ---
+    parameters:
+      - name: q
+        in: query
+        type: string
+        required: true
+        description: Typed prefix, e.g. '021', 'spring' or 'dallas'
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Maximum suggestions, at most 50 (default 10)
+    responses:
+      200:
+        description: Ranked suggestions, each with a type of 'zip', 'city' or 'msa'
+      400:
+        description: Invalid limit
+      500:
+        description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
+    """
+    try:
+        query = request.args.get('q', '')
+        limit = request.args.get('limit', 10, type=int)
+        if not 0 < limit <= search_index.MAX_RESULTS:
+            return jsonify({'error': f'limit must be between 1 and {search_index.MAX_RESULTS}'}), 400
         
-        # Scale features
-        clf_features = clf_scaler.transform(features)
-        
-        # Get investment scores
-        df['investment_score'] = classifier.predict_proba(clf_features)[:, 1]
-        
-        # Group by region_id and aggregate
-        msi_data = df.groupby('region_id').agg({
-            'investment_score': 'mean',  # Average investment score for the MSI
-            'price_to_rent': 'first',
-            'market_heat': 'first',
-            'days_pending': 'first',
-            'price_cuts_percent': 'first'
-        }).reset_index()
-        
-        # Convert to list of dictionaries
-        msi_list = []
-        for _, row in msi_data.iterrows():
+        with stage('index'):
+            index = get_search_index()
+        
+        with stage('search'):
+            results = index.search(query[:100], limit)
+        
+        with stage('serialization'):
+            response = jsonify({'query': query, 'results': results})
+        
+        # Suggestions only change with the data, let clients and proxies reuse them briefly
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
+    except Exception as e:
+        app.logger.error(f"Error in search: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/similar/<zip_or_msa>', methods=['GET'])
+def get_similar_markets_route(zip_or_msa):
+    """
+    The MSAs most similar to a ZIP code's MSA or to an MSA, by distance between their standardized features
+    ---
+    parameters:
+      - name: zip_or_msa
+        in: path
+        type: string
+        required: true
+        description: A ZIP code (e.g. '02108'), an MSA region id (msi_name) or an MSA name
+      - name: k
+        in: query
+        type: integer
+        required: false
+        description: Number of MSAs to return, at most 100 (default 10)
+      - name: state
+        in: query
+        type: string
+        required: false
+        description: Comma-separated state codes; only MSAs with ZIP codes in these states
+      - name: min_score
+        in: query
+        type: number
+        required: false
+        description: Minimum mean investment score of a returned MSA
+      - name: max_score
+        in: query
+        type: number
+        required: false
+        description: Maximum mean investment score of a returned MSA
+    responses:
+      200:
+        description: The queried MSA and its nearest MSAs, nearest first, with their distance
+      400:
+        description: Invalid k or score bounds
+      404:
+        description: Unknown ZIP code or MSA
+      500:
+        description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
+    """
+    try:
+        k = request.args.get('k', 10, type=int)
+        if not 0 < k <= similar_markets.MAX_NEIGHBORS:
+            return jsonify({'error': f'k must be between 1 and {similar_markets.MAX_NEIGHBORS}'}), 400
+        min_score = request.args.get('min_score', type=float)
+        max_score = request.args.get('max_score', type=float)
+        if min_score is not None and max_score is not None and min_score > max_score:
+            return jsonify({'error': 'min_score must not be greater than max_score'}), 400
+        states = [state.strip().upper() for state in request.args.get('state', '').split(',') if state.strip()]
+        
+        bundle = models.active
+        
+        with stage('index'):
+            index = get_market_index(bundle)
+            markets = get_similar_markets(bundle)
+        
+        # A ZIP code stands for its MSA; otherwise look the MSA up by region id or name
+        key = zip_or_msa.strip()
+        row = index.row_for_zip(key) if len(key) == 5 and key.isdigit() else None
+        if row is not None:
+            region_id = int(index.table.column('region_id')[row])
+        else:
+            rows = index.msa_rows.get(key.lower())
+            if rows is None:
+                return jsonify({'error': f'No ZIP code or MSA found for {zip_or_msa}'}), 404
+            region_id = int(index.table.column('region_id')[rows[0]])
+        position = markets.position(region_id)
+        
+        with stage('search'):
+            positions, distances = markets.nearest(position, k, states, min_score, max_score)
+        
+        with stage('serialization'):
+            response = jsonify({
+                'query': {'zip_code': key if row is not None else None, **markets.records([position])[0]},
+                'similar': markets.records(positions, distances),
+                'data_version': index.data_version,
+                'model_version': bundle.version
+            })
+        
+        # Neighbours only change with the data or the model
+        response.headers['Cache-Control'] = 'public, max-age=60'
+        return response
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
+    except Exception as e:
+        app.logger.error(f"Error in get_similar_markets: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export', methods=['GET'])
+def export_dataset():
+    """
+    Stream the scored ZIP or MSA dataset as CSV, NDJSON or Parquet
+    ---
+    parameters:
+      - name: level
+        in: query
+        type: string
+        required: false
+        description: "'zip' (default) for one row per ZIP code or 'msa' for one row per state and MSA"
+      - name: state
+        in: query
+        type: string
+        required: false
+        description: Comma-separated state codes (default all states)
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: "'csv' (default), 'ndjson' or 'parquet'"
+      - name: contributions
+        in: query
+        type: boolean
+        required: false
+        description: Add per-feature score contributions (level=zip only)
+      - name: Range
+        in: header
+        type: string
+        required: false
+        description: "Single byte range to resume a download, e.g. 'bytes=1048576-'"
+    responses:
+      200:
+        description: The whole export, streamed in chunks
+      206:
+        description: The requested byte range
+      400:
+        description: Invalid option or state
+      416:
+        description: Range starts past the end of the export
+      500:
+        description: Server error
+      501:
+        description: Parquet requested but pyarrow is not installed
+      503:
+        description: Database unavailable and no last known good copy to serve
+    """
+    try:
+        bundle = models.active
+        
+        with stage('index'):
+            index = get_market_index(bundle)
+        
+        states = [state.strip().upper() for state in request.args.get('state', '').split(',') if state.strip()]
+        try:
+            export = bulk_export.ExportRequest(
+                index,
+                level=request.args.get('level', 'zip'),
+                states=states or None,
+                contributions=request.args.get('contributions', '').lower() in ('1', 'true', 'yes'),
+                fmt=request.args.get('format', 'csv')
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if export.fmt == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            return jsonify({'error': 'Parquet export needs pyarrow installed'}), 501
+        
+        headers = {
+            'Content-Disposition': f'attachment; filename="{export.filename}"',
+            'Accept-Ranges': 'bytes',
+            'ETag': export.etag,
+            'X-Data-Version': str(index.data_version)
+        }
+        
+        # Resume: a single byte range, honoured if the export has not changed since (If-Range)
+        range_header = request.headers.get('Range')
+        if range_header and request.headers.get('If-Range', export.etag) == export.etag:
+            with stage('export_plan'):
+                total = sum(bulk_export.plan(export))
             try:
-                msi_list.append({
-                    'msi_name': str(row['region_id']),
-                    'investment_score': float(row['investment_score']),
-                    'price_to_rent_ratio': float(row['price_to_rent']),
-                    'market_heat': float(row['market_heat']),
-                    'days_to_pending': float(row['days_pending']),
-                    'price_cuts_percent': float(row['price_cuts_percent'])
-                })
-            except (KeyError, ValueError) as e:
-                app.logger.warning(f"Skipping row due to missing/invalid data: {e}")
-                continue
-        
-        return jsonify({'msi_data': msi_list})
+                byte_range = bulk_export.parse_range(range_header, total)
+            except ValueError:
+                return Response(status=416, headers={**headers, 'Content-Range': f'bytes */{total}'})
+            if byte_range is not None:
+                start, end = byte_range
+                headers['Content-Range'] = f'bytes {start}-{end}/{total}'
+                headers['Content-Length'] = str(end - start + 1)
+                return Response(bulk_export.stream_range(export, start, end), status=206,
+                                mimetype=bulk_export.FORMATS[export.fmt], headers=headers)
         
+        # Full export: streamed chunk by chunk, with a length once an identical export has been sent
+        sizes = bulk_export.get_plan(export)
+        if sizes is not None:
+            headers['Content-Length'] = str(sum(sizes))
+        return Response(bulk_export.stream(export), mimetype=bulk_export.FORMATS[export.fmt], headers=headers)
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
+    except Exception as e:
+        app.logger.error(f"Error in export_dataset: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/history/<zip_code>', methods=['GET'])
+def get_zip_history(zip_code):
+    """
+    Return the monthly history of a metric for the MSA of a ZIP code
+    ---
+    parameters:
+      - name: zip_code
+        in: path
+        type: string
+        required: true
+        description: 5-digit ZIP code
+      - name: metric
+        in: query
+        type: string
+        required: false
+        description: Metric name (default 'median_home_value')
+      - name: start
+        in: query
+        type: string
+        required: false
+        description: First month to include (YYYY-MM)
+      - name: end
+        in: query
+        type: string
+        required: false
+        description: Last month to include (YYYY-MM)
+    responses:
+      200:
+        description: Monthly values for the ZIP code's MSA
+      400:
+        description: Unknown metric
+      404:
+        description: No history for the ZIP code
+      500:
+        description: Server error
+      503:
+        description: Database unavailable and no last known good copy to serve
+    """
+    try:
+        zip_code = str(zip_code).zfill(5)
+        metric = request.args.get('metric', 'median_home_value')
+        
+        try:
+            store = get_feature_store()
+        except FileNotFoundError:
+            return jsonify({'error': 'No history data found'}), 404
+        
+        if metric not in store.metrics:
+            return jsonify({'error': f'Unknown metric {metric}', 'metrics': store.metrics}), 400
+        
+        # Single indexed lookup to resolve the ZIP code's MSA
+        with stage('mongo_fetch'):
+            zip_info = db.get_zip_info(zip_code)
+        if not zip_info:
+            return jsonify({'error': f'No data available for ZIP code {zip_code}'}), 404
+        
+        with stage('history_slice'):
+            history = store.history(zip_info['region_id'], metric,
+                                    request.args.get('start'), request.args.get('end'))
+        if history is None:
+            return jsonify({'error': f'No history available for ZIP code {zip_code}'}), 404
+        
+        months, values = history
+        return jsonify({
+            'zip_code': zip_code,
+            'region_id': str(zip_info['region_id']),
+            'msa_name': zip_info['msa_name'],
+            'metric': metric,
+            'months': months,
+            'values': values
+        })
+    
+    except DatabaseUnavailable as e:
+        return database_unavailable(e)
+    
     except Exception as e:
-        app.logger.error(f"Error in get_msi_analysis: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# Model evaluation charts, in display order, with the text shown next to each
+CHART_ORDER = [
+    'confusion_matrix',
+    'classification_report',
+    'roc_curve',
+    'feature_importance',
+    'prediction_distribution',
+    'score_distribution'
+]
+
+CHART_DESCRIPTIONS = {
+    'confusion_matrix': {
+        'title': 'Confusion Matrix',
+        'description': ('Shows the model\'s prediction accuracy across different investment categories. '
+                      'The diagonal represents correct predictions (True Positives and True Negatives), '
+                      'while off-diagonal elements show misclassifications (False Positives and False Negatives). '
+                      'Brighter colors indicate higher numbers of predictions in each category.')
+    },
+    'feature_importance': {
+        'title': 'Feature Importance',
+        'description': ('Displays the relative importance of each feature in the model\'s decision-making process. '
+                      'Longer bars indicate features that have more influence on predicting investment potential. '
+                      'Price-to-rent ratio and market heat typically show high importance, '
+                      'reflecting their strong correlation with investment success.')
+    },
+    'roc_curve': {
+        'title': 'ROC Curve',
+        'description': ('The Receiver Operating Characteristic curve shows the trade-off between true positive rate '
+                      '(correctly identified good investments) and false positive rate (incorrectly flagged poor investments) '
+                      'at various classification thresholds. The area under the curve (AUC) of 0.89 indicates strong '
+                      'discriminative ability - the model is good at distinguishing between good and poor investment opportunities.')
+    },
+    'classification_report': {
+        'title': 'Classification Report',
+        'description': ('Detailed performance metrics for each investment category:\n'
+                      '• Precision: % of predicted good investments that were actually good (avoiding false recommendations)\n'
+                      '• Recall: % of actual good investments that were correctly identified (finding opportunities)\n'
+                      '• F1-Score: Balanced measure between precision and recall\n'
+                      '• Support: Number of samples in each category')
+    },
+    'prediction_distribution': {
+        'title': 'Prediction Distribution',
+        'description': ('Shows how confidently the model makes its predictions across different ZIP codes. '
+                      'A bimodal distribution (two peaks) suggests the model is good at distinguishing clear cases, '
+                      'while predictions in the middle range (0.4-0.6) indicate areas where more careful analysis is needed.')
+    },
+    'score_distribution': {
+        'title': 'Score Distribution',
+        'description': ('Visualizes the distribution of final investment scores across all analyzed ZIP codes. '
+                      'The shape helps understand market opportunities:\n'
+                      '• Scores > 0.7 (30% of areas): Strong investment potential\n'
+                      '• Scores 0.5-0.7 (45% of areas): Moderate potential, requires careful analysis\n'
+                      '• Scores < 0.5 (25% of areas): Higher risk or lower return potential')
+    }
+}
+
 @app.route('/api/model-evaluation', methods=['GET'])
 def get_model_evaluation():
     """
     Return model evaluation charts and their descriptions
     ---
+    parameters:
+      - name: format
+        in: query
+        type: string
+        required: false
+        description: "'image' (default) for base64 PNGs, 'data' for the numbers behind each chart"
     responses:
       200:
         description: Model evaluation metrics and visualizations
+      404:
+        description: No evaluation results found
       500:
         description: Server error
     """
@@ -313,62 +1212,24 @@ def get_model_evaluation():
     
     if not results_dir.exists():
         return jsonify({'error': 'No evaluation results found'}), 404
+    
+    if request.args.get('format') == 'data':
+        data_file = results_dir / 'evaluation_data.json'
+        if not data_file.exists():
+            return jsonify({'error': 'No evaluation data found, run evaluate_model.py'}), 404
+        with open(data_file) as f:
+            evaluation_data = json.load(f)
+        return jsonify([
+            {
+                'chart': name,
+                'title': CHART_DESCRIPTIONS[name]['title'],
+                'description': CHART_DESCRIPTIONS[name]['description'],
+                'data': evaluation_data[name]
+            }
+            for name in CHART_ORDER if name in evaluation_data
+        ])
         
     charts = []
-    chart_order = [
-        'confusion_matrix',
-        'classification_report',
-        'roc_curve',
-        'feature_importance',
-        'prediction_distribution',
-        'score_distribution'
-    ]
-    
-    descriptions = {
-        'confusion_matrix': {
-            'title': 'Confusion Matrix',
-            'description': ('Shows the model\'s prediction accuracy across different investment categories. '
-                          'The diagonal represents correct predictions (True Positives and True Negatives), '
-                          'while off-diagonal elements show misclassifications (False Positives and False Negatives). '
-                          'Brighter colors indicate higher numbers of predictions in each category.')
-        },
-        'feature_importance': {
-            'title': 'Feature Importance',
-            'description': ('Displays the relative importance of each feature in the model\'s decision-making process. '
-                          'Longer bars indicate features that have more influence on predicting investment potential. '
-                          'Price-to-rent ratio and market heat typically show high importance, '
-                          'reflecting their strong correlation with investment success.')
-        },
-        'roc_curve': {
-            'title': 'ROC Curve',
-            'description': ('The Receiver Operating Characteristic curve shows the trade-off between true positive rate '
-                          '(correctly identified good investments) and false positive rate (incorrectly flagged poor investments) '
-                          'at various classification thresholds. The area under the curve (AUC) of 0.89 indicates strong '
-                          'discriminative ability - the model is good at distinguishing between good and poor investment opportunities.')
-        },
-        'classification_report': {
-            'title': 'Classification Report',
-            'description': ('Detailed performance metrics for each investment category:\n'
-                          '• Precision: % of predicted good investments that were actually good (avoiding false recommendations)\n'
-                          '• Recall: % of actual good investments that were correctly identified (finding opportunities)\n'
-                          '• F1-Score: Balanced measure between precision and recall\n'
-                          '• Support: Number of samples in each category')
-        },
-        'prediction_distribution': {
-            'title': 'Prediction Distribution',
-            'description': ('Shows how confidently the model makes its predictions across different ZIP codes. '
-                          'A bimodal distribution (two peaks) suggests the model is good at distinguishing clear cases, '
-                          'while predictions in the middle range (0.4-0.6) indicate areas where more careful analysis is needed.')
-        },
-        'score_distribution': {
-            'title': 'Score Distribution',
-            'description': ('Visualizes the distribution of final investment scores across all analyzed ZIP codes. '
-                          'The shape helps understand market opportunities:\n'
-                          '• Scores > 0.7 (30% of areas): Strong investment potential\n'
-                          '• Scores 0.5-0.7 (45% of areas): Moderate potential, requires careful analysis\n'
-                          '• Scores < 0.5 (25% of areas): Higher risk or lower return potential')
-        }
-    }
     
     # Get all PNG files in the results directory
     image_files = list(results_dir.glob('*.png'))
@@ -379,14 +1240,14 @@ def get_model_evaluation():
         base_name = image_file.stem.lower().replace(' ', '_')
         
         # Check if we have a description for this chart
-        if base_name in descriptions:
+        if base_name in CHART_DESCRIPTIONS:
             with open(image_file, 'rb') as f:
                 image_data = base64.b64encode(f.read()).decode('utf-8')
                 
             charts.append({
                 'image': image_data,
-                'title': descriptions[base_name]['title'],
-                'description': descriptions[base_name]['description']
+                'title': CHART_DESCRIPTIONS[base_name]['title'],
+                'description': CHART_DESCRIPTIONS[base_name]['description']
             })
     
     # Sort charts according to my predefined order
@@ -394,15 +1255,196 @@ def get_model_evaluation():
         # Get the position in chart_order, or put at the end if not found
         title_key = chart['title'].lower().replace(' ', '_')
         try:
-            return chart_order.index(title_key)
+            return CHART_ORDER.index(title_key)
         except ValueError:
-            return len(chart_order)
+            return len(CHART_ORDER)
     
     return jsonify(sorted(charts, key=get_chart_order))
 
+@app.route('/api/admin/models', methods=['GET', 'POST'])
+def admin_models():
+    """
+    List model versions (GET) or load, warm and swap in a version (POST)
+    ---
+    parameters:
+      - name: X-Admin-Token
+        in: header
+        type: string
+        required: true
+        description: Must match the ADMIN_TOKEN environment variable
+      - name: version
+        in: query
+        type: string
+        required: false
+        description: Version to activate (default is the ACTIVE pointer)
+    responses:
+      200:
+        description: Active version, published versions and reload status
+      202:
+        description: Reload started in the background
+      403:
+        description: Missing or invalid admin token
+      409:
+        description: A reload is already in progress
+    """
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'POST':
+        version = request.args.get('version')
+        try:
+            started = models.reload(version)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 404
+        if not started:
+            return jsonify({'error': 'A reload is already in progress', 'reload': models.reload_status}), 409
+        return jsonify({'reload': models.reload_status}), 202
+    
+    return jsonify({
+        'active_version': models.active.version,
+        'versions': list_versions(models.model_dir),
+        'reload': models.reload_status
+    })
+
+@app.route('/api/admin/jobs', methods=['GET', 'POST'])
+def admin_jobs():
+    """
+    List recent background jobs (GET) or start one (POST)
+    ---
+    parameters:
+      - name: X-Admin-Token
+        in: header
+        type: string
+        required: true
+        description: Must match the ADMIN_TOKEN environment variable
+      - name: kind
+        in: query
+        type: string
+        required: false
+        description: "Job to start: 'retrain', 'evaluate' or 'reprocess' (POST only)"
+      - name: body
+        in: body
+        required: false
+        description: "Job options, e.g. {'search': true, 'folds': 5} for retrain, {'plots': false} for evaluate, {'full': true} for reprocess"
+    responses:
+      200:
+        description: Recent jobs, newest first
+      202:
+        description: Job queued; poll /api/admin/jobs/<job_id>
+      400:
+        description: Unknown job kind or option
+      403:
+        description: Missing or invalid admin token
+      409:
+        description: A job of this kind is already queued or running
+    """
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        kind = body.pop('kind', None) if isinstance(body, dict) else None
+        kind = request.args.get('kind') or kind
+        options = body.get('options', body) if isinstance(body, dict) else body
+        try:
+            job = job_manager.submit(kind, options)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except RuntimeError as e:
+            return jsonify({'error': str(e)}), 409
+        response = jsonify({'job': job})
+        response.headers['Location'] = f"/api/admin/jobs/{job['id']}"
+        return response, 202
+    
+    return jsonify({'jobs': job_manager.list_jobs()})
+
+@app.route('/api/admin/jobs/<job_id>', methods=['GET'])
+def admin_job(job_id):
+    """
+    Poll a background job: state, progress and its log
+    ---
+    parameters:
+      - name: X-Admin-Token
+        in: header
+        type: string
+        required: true
+        description: Must match the ADMIN_TOKEN environment variable
+      - name: job_id
+        in: path
+        type: string
+        required: true
+      - name: log_offset
+        in: query
+        type: integer
+        required: false
+        description: Byte offset to read the log from, e.g. the log_offset of the last poll (default is the end of the log)
+    responses:
+      200:
+        description: Job record with progress, log text and the offset to poll from next
+      400:
+        description: Invalid log_offset
+      403:
+        description: Missing or invalid admin token
+      404:
+        description: Unknown job
+    """
+    if not ADMIN_TOKEN or request.headers.get('X-Admin-Token') != ADMIN_TOKEN:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    try:
+        log_offset = int(request.args.get('log_offset', -1))
+    except ValueError:
+        return jsonify({'error': 'log_offset must be an integer'}), 400
+    
+    job = job_manager.status(job_id, log_offset)
+    if job is None:
+        return jsonify({'error': f'Unknown job {job_id}'}), 404
+    return jsonify({'job': job})
+
+@app.route('/metrics')
+def metrics():
+    """
+    Request, stage and cache metrics for this worker in Prometheus text format
+    ---
+    responses:
+      200:
+        description: Prometheus exposition text
+    """
+    version = models.active.version if models.active is not None else None
+    return Response(request_metrics.render_prometheus(version),
+                    mimetype='text/plain; version=0.0.4')
+
 @app.route('/health')
 def health_check():
-    return jsonify({"status": "healthy"}), 200
+    # Liveness only: answers as soon as the module is imported
+    version = models.active.version if models.active is not None else None
+    response = {"status": "healthy", "model_version": version}
+    if shard_map is not None:
+        response['shard'] = sharding.SHARD_ID
+    return jsonify(response), 200
+
+@app.route('/ready')
+def readiness_check():
+    """
+    Readiness and startup-time report for this worker
+    ---
+    responses:
+      200:
+        description: Models and database are loaded, with database health and snapshot counters
+      503:
+        description: Still warming up, or retrying a failed phase
+    """
+    ready = warmup.ready.is_set()
+    try:
+        database = db.status()
+    except Exception as e:
+        database = {'healthy': False, 'error': str(e)}
+    return jsonify({'ready': ready, 'startup': startup_report.as_dict(), 'database': database}), 200 if ready else 503
+
+startup_report.mark('app_imported')
+if WARMUP_ON_IMPORT:
+    warmup.start(background=LAZY_STARTUP)
+app.logger.info(f"Startup: {startup_report.as_dict()}")
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', debug=True)
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')), debug=os.getenv('FLASK_DEBUG', '1') != '0')
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+import joblib
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from feature_store import FEATURE_STORE_DIR, FeatureStore, build_feature_store
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+# Forward windows (in months) used for the price-change metrics
+FORWARD_HORIZONS = [3, 6, 12]
+
+# Per-process state, set up once by the pool initializer
+_worker = {}
+
+def _init_worker(store_dir, model_dir):
+    """Open the feature store and load the models once per worker process"""
+    _worker['store'] = FeatureStore(store_dir)
+    _worker['classifier'] = joblib.load(os.path.join(model_dir, 'investment_classifier.joblib'))
+    _worker['ranker'] = joblib.load(os.path.join(model_dir, 'zip_ranker.joblib'))
+    _worker['clf_scaler'] = joblib.load(os.path.join(model_dir, 'classifier_scaler.joblib'))
+    _worker['rank_scaler'] = joblib.load(os.path.join(model_dir, 'ranker_scaler.joblib'))
+    # Parallelism comes from the pool, so keep each model single-threaded
+    _worker['classifier'].n_jobs = 1
+    _worker['ranker'].n_jobs = 1
+
+def build_month_features(store, columns):
+    """
+    Stack the six features for every region over a block of months.
+    Returns a (regions, months, features) array and a mask of the rows
+    that pass the same validity rules as the preprocessing loaders.
+    """
+    features = np.stack([np.asarray(store.matrix(name)[:, columns]) for name in FEATURE_COLUMNS], axis=-1)
+    valid = ~np.isnan(features).any(axis=-1)
+    with np.errstate(invalid='ignore'):
+        for name in ['median_home_value', 'median_rent', 'days_pending', 'market_heat']:
+            valid &= features[..., FEATURE_COLUMNS.index(name)] > 0
+    return features, valid
+
+def score_months(columns):
+    """Score every valid (region, month) pair in a block of months"""
+    store = _worker['store']
+    features, valid = build_month_features(store, slice(columns[0], columns[-1] + 1))
+
+    investment_scores = np.full(valid.shape, np.nan, dtype=np.float32)
+    ranking_scores = np.full(valid.shape, np.nan, dtype=np.float32)
+    for offset in range(valid.shape[1]):
+        rows = valid[:, offset]
+        if not rows.any():
+            continue
+        # One batched pass per month through both scalers and models
+        month_features = pd.DataFrame(features[rows, offset].astype(np.float64), columns=FEATURE_COLUMNS)
+        clf_features = _worker['clf_scaler'].transform(month_features)
+        rank_features = _worker['rank_scaler'].transform(month_features)
+        investment_scores[rows, offset] = _worker['classifier'].predict_proba(clf_features)[:, 1]
+        ranking_scores[rows, offset] = _worker['ranker'].predict(rank_features)
+    return columns[0], investment_scores, ranking_scores
+
+def _spearman(a, b):
+    """Spearman correlation over the entries present in both arrays"""
+    both = ~np.isnan(a) & ~np.isnan(b)
+    if both.sum() < 3:
+        return np.nan
+    ranks_a = pd.Series(a[both]).rank().to_numpy()
+    ranks_b = pd.Series(b[both]).rank().to_numpy()
+    return float(np.corrcoef(ranks_a, ranks_b)[0, 1])
+
+def _top_overlap(a, b, fraction=0.2):
+    """Share of the top fraction in one month that is still in the top fraction the next month"""
+    both = ~np.isnan(a) & ~np.isnan(b)
+    n_top = int(both.sum() * fraction)
+    if n_top == 0:
+        return np.nan
+    candidates = np.flatnonzero(both)
+    top_a = set(candidates[np.argsort(-a[both])[:n_top]])
+    top_b = set(candidates[np.argsort(-b[both])[:n_top]])
+    return len(top_a & top_b) / n_top
+
+def summarize_backtest(months, investment_scores, ranking_scores, home_values):
+    """Compute per-month rank stability and forward price-change metrics"""
+    rows = []
+    for m, month in enumerate(months):
+        ranking = ranking_scores[:, m]
+        scored = ~np.isnan(ranking)
+        if not scored.any():
+            continue
+        row = {
+            'month': month,
+            'regions_scored': int(scored.sum()),
+            'mean_investment_score': float(np.nanmean(investment_scores[:, m])),
+            'share_recommended': float(np.nanmean(investment_scores[scored, m] >= 0.5)),
+        }
+        if m + 1 < len(months):
+            row['rank_stability'] = _spearman(ranking, ranking_scores[:, m + 1])
+            row['top_quintile_retention'] = _top_overlap(ranking, ranking_scores[:, m + 1])
+
+        # Forward home value change, split by ranking quintile
+        top_cut, bottom_cut = np.nanquantile(ranking, [0.8, 0.2])
+        for horizon in FORWARD_HORIZONS:
+            if m + horizon >= len(months):
+                continue
+            with np.errstate(divide='ignore', invalid='ignore'):
+                change = home_values[:, m + horizon] / home_values[:, m] - 1
+            change = np.where(scored, change, np.nan)
+            if np.isnan(change).all():
+                continue
+            row[f'forward_{horizon}m_all'] = float(np.nanmean(change))
+            row[f'forward_{horizon}m_top_quintile'] = float(np.nanmean(np.where(ranking >= top_cut, change, np.nan)))
+            row[f'forward_{horizon}m_bottom_quintile'] = float(np.nanmean(np.where(ranking <= bottom_cut, change, np.nan)))
+            row[f'forward_{horizon}m_rank_ic'] = _spearman(ranking, change)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+def run_backtest(store_dir=None, model_dir='model', output_dir='model/results', workers=None):
+    """Score every (region, month) pair in parallel and save the backtest report"""
+    start_time = time.time()
+    store_dir = store_dir or FEATURE_STORE_DIR
+    if not os.path.exists(os.path.join(store_dir, 'index.json')):
+        build_feature_store(os.path.join(os.path.dirname(__file__), 'zillow-data'), store_dir)
+    store = FeatureStore(store_dir)
+    n_regions, n_months = len(store.region_ids), len(store.months)
+
+    # Split the month axis into one contiguous block per task
+    workers = workers or os.cpu_count() or 1
+    n_blocks = min(n_months, workers * 4)
+    blocks = [block.tolist() for block in np.array_split(np.arange(n_months), n_blocks) if len(block)]
+
+    investment_scores = np.full((n_regions, n_months), np.nan, dtype=np.float32)
+    ranking_scores = np.full((n_regions, n_months), np.nan, dtype=np.float32)
+    print(f"Backtesting {n_regions} regions x {n_months} months on {workers} workers...")
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(store_dir, model_dir)) as pool:
+        for first, block_investment, block_ranking in pool.map(score_months, blocks):
+            investment_scores[:, first:first + block_investment.shape[1]] = block_investment
+            ranking_scores[:, first:first + block_ranking.shape[1]] = block_ranking
+
+    home_values = np.asarray(store.matrix('median_home_value'), dtype=np.float64)
+    report = summarize_backtest(store.months, investment_scores, ranking_scores, home_values)
+
+    os.makedirs(output_dir, exist_ok=True)
+    report.to_csv(os.path.join(output_dir, 'backtest_report.csv'), index=False)
+    np.save(os.path.join(output_dir, 'backtest_ranking_scores.npy'), ranking_scores)
+    np.save(os.path.join(output_dir, 'backtest_investment_scores.npy'), investment_scores)
+
+    summary = {
+        'months_scored': int(len(report)),
+        'first_month': report['month'].iloc[0] if len(report) else None,
+        'last_month': report['month'].iloc[-1] if len(report) else None,
+        'pairs_scored': int((~np.isnan(ranking_scores)).sum()),
+        'mean_rank_stability': float(report['rank_stability'].mean()) if 'rank_stability' in report else None,
+        'elapsed_seconds': round(time.time() - start_time, 2)
+    }
+    for horizon in FORWARD_HORIZONS:
+        for column in [f'forward_{horizon}m_top_quintile', f'forward_{horizon}m_bottom_quintile',
+                       f'forward_{horizon}m_rank_ic']:
+            if column in report:
+                summary[f'mean_{column}'] = float(report[column].mean())
+    with open(os.path.join(output_dir, 'backtest_summary.json'), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    print("\nBacktest Summary:")
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    return report, summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backtest the investment models over the full Zillow history')
+    parser.add_argument('--store-dir', default=None, help='Feature store directory')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    args = parser.parse_args()
+    run_backtest(store_dir=args.store_dir, workers=args.workers)
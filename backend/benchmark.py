@@ -0,0 +1,206 @@
+import pandas as pd
+import numpy as np
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from mongo_standin import InMemoryClient
+from database import Database
+from msa_table import refresh_msa_table
+from compact_records import ZipRecords
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+BATCH_SIZES = [1, 10, 100, 1000, 10000, 100000, 1000000]
+
+RESULTS_DIR = 'bench_results'
+
+def load_standin_database(path='data/processed_zip_data.csv'):
+    """Load processed ZIP data into an in-memory Mongo stand-in, the same way preprocessing does"""
+    zip_data = pd.read_csv(path, dtype={'zip_code': str})
+    state_data = {state: zip_data[zip_data['state'] == state].to_dict('records')
+                  for state in zip_data['state'].unique()}
+    db = Database(client=InMemoryClient())
+    db.initialize_collections(zip_data, state_data)
+    refresh_msa_table(db, zip_data)
+    return db, zip_data
+
+def measure(fn, min_time=0.5, min_repeats=5, max_repeats=1000, warmup=1):
+    """Time fn repeatedly and summarize the per-call wall time in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < max_repeats and (len(timings) < min_repeats or time.perf_counter() - started < min_time):
+        t0 = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - t0) * 1000)
+    timings.sort()
+    return {
+        'repeats': len(timings),
+        'min_ms': timings[0],
+        'median_ms': statistics.median(timings),
+        'mean_ms': statistics.fmean(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    }
+
+def bench_scoring(bundle, zip_data, batch_sizes):
+    """Scaler + predict_proba / predict at increasing batch sizes"""
+    results = {}
+    rng = np.random.default_rng(42)
+    for batch_size in batch_sizes:
+        rows = rng.integers(0, len(zip_data), batch_size)
+        features = zip_data[FEATURE_COLUMNS].iloc[rows].reset_index(drop=True)
+        # Large batches take seconds per call, so fewer repeats are enough
+        repeats = {'min_repeats': 3, 'max_repeats': 5} if batch_size >= 100000 else {}
+
+        stats = measure(lambda: bundle.classifier.predict_proba(bundle.clf_scaler.transform(features)), **repeats)
+        stats['rows_per_sec'] = batch_size / (stats['median_ms'] / 1000)
+        results[f'classifier_predict_proba[batch={batch_size}]'] = stats
+
+        stats = measure(lambda: bundle.ranker.predict(bundle.rank_scaler.transform(features)), **repeats)
+        stats['rows_per_sec'] = batch_size / (stats['median_ms'] / 1000)
+        results[f'ranker_predict[batch={batch_size}]'] = stats
+    return results
+
+def pick_states(zip_data):
+    """Smallest, median and largest state by ZIP count"""
+    counts = zip_data['state'].value_counts().sort_values()
+    return {
+        'small': counts.index[0],
+        'medium': counts.index[len(counts) // 2],
+        'large': counts.index[-1]
+    }
+
+def bench_endpoints(app_module, zip_data):
+    """End-to-end endpoint timings through the Flask test client"""
+    client = app_module.app.test_client()
+    results = {}
+
+    for size, state in pick_states(zip_data).items():
+        def call():
+            response = client.get(f'/api/recommendations/{state}')
+            assert response.status_code == 200, response.status_code
+        stats = measure(call)
+        stats['state'] = state
+        stats['zip_count'] = int((zip_data['state'] == state).sum())
+        results[f'get_state_recommendations[{size}]'] = stats
+
+    zips = zip_data['zip_code'].sample(50, random_state=42).tolist()
+    position = {'i': 0}
+    def call_analysis():
+        response = client.get(f"/api/analysis/{zips[position['i'] % len(zips)]}")
+        position['i'] += 1
+        assert response.status_code == 200, response.status_code
+    results['get_zip_analysis'] = measure(call_analysis)
+
+    all_zips = zip_data['zip_code'].tolist()
+    results['find_nearby_zips'] = measure(lambda: app_module.find_nearby_zips(zips[0], all_zips))
+    return results
+
+def bench_serialization(app_module, zip_data):
+    """Compact records -> recommendation list -> JSON for the largest state"""
+    state = pick_states(zip_data)['large']
+    records = ZipRecords.from_frame(zip_data[zip_data['state'] == state])
+    scores = {'investment_score': np.full(len(records), 0.5), 'ranking_score': np.full(len(records), 50.0)}
+    results = {}
+    results['build_recommendations[large]'] = measure(lambda: records.to_dicts(scores))
+    recommendations = records.to_dicts(scores)
+    with app_module.app.app_context():
+        results['jsonify[large]'] = measure(
+            lambda: app_module.jsonify({'recommendations': recommendations}).get_data()
+        )
+    return results
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(batch_sizes=BATCH_SIZES, output=None):
+    """Run the whole suite and write a machine-readable result file"""
+    # The stand-in has to be in place before the warm-up pings the database
+    os.environ['WARMUP_ON_IMPORT'] = '0'
+    import app as app_module
+    import sklearn
+    from resilient_db import ResilientDatabase
+
+    db, zip_data = load_standin_database()
+    app_module.db = ResilientDatabase(db, snapshot_path=None)
+    app_module.warmup.start()
+    # Models load on the warm-up thread
+    if not app_module.warmup.wait(120):
+        raise RuntimeError(f"API warm-up failed: {app_module.startup_report.as_dict()}")
+    bundle = app_module.models.active
+
+    results = {}
+    print("Benchmarking scoring...")
+    results.update(bench_scoring(bundle, zip_data, batch_sizes))
+    print("Benchmarking endpoints...")
+    results.update(bench_endpoints(app_module, zip_data))
+    print("Benchmarking serialization...")
+    results.update(bench_serialization(app_module, zip_data))
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'sklearn': sklearn.__version__,
+            'cpu_count': os.cpu_count(),
+            'model_version': bundle.version
+        },
+        'results': results
+    }
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"bench_{report['meta']['commit'] or 'local'}_"
+                                           f"{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for name, stats in results.items():
+        print(f"{name:55s} median {stats['median_ms']:10.3f} ms   p95 {stats['p95_ms']:10.3f} ms")
+    print(f"\nResults saved to {output}")
+    return report
+
+def compare(baseline_path, current_path, threshold=0.10):
+    """Print median changes between two result files; returns the names that regressed"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    with open(current_path) as f:
+        current = json.load(f)['results']
+
+    regressions = []
+    for name in sorted(set(baseline) & set(current)):
+        before, after = baseline[name]['median_ms'], current[name]['median_ms']
+        change = (after - before) / before if before else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:55s} {before:10.3f} -> {after:10.3f} ms  ({change:+.1%}){flag}")
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark scoring, endpoints and serialization')
+    parser.add_argument('--quick', action='store_true', help='Skip the 100k and 1M batch sizes')
+    parser.add_argument('--output', default=None, help='Result file (default: bench_results/bench_<commit>_<time>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='Compare two result files instead of running the suite')
+    parser.add_argument('--threshold', type=float, default=0.10, help='Median slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(args.compare[0], args.compare[1], args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    sizes = [size for size in BATCH_SIZES if not args.quick or size < 100000]
+    run_benchmarks(sizes, args.output)
@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+import csv
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from shared_table import FEATURE_COLUMNS, SCORE_COLUMNS, NUMERIC_COLUMNS
+from compact_records import metric_values
+from msa_table import summarize_msas
+
+# Rows encoded at a time; memory use is bounded by one chunk whatever the export size
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '5000'))
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet'
+}
+
+ZIP_COLUMNS = ['zip_code', 'city', 'state', 'region_id', 'msa_name'] + NUMERIC_COLUMNS
+CONTRIBUTION_COLUMNS = [f'{name}_{column}' for name in SCORE_COLUMNS for column in ['bias'] + FEATURE_COLUMNS]
+# Same fields as /api/msi-analysis, one row per state and MSA
+MSA_COLUMNS = ['state', 'msi_name', 'msa_name', 'zip_count', 'investment_score', 'min_investment_score',
+               'max_investment_score', 'price_to_rent_ratio', 'market_heat', 'days_to_pending',
+               'price_cuts_percent', 'median_home_value', 'median_rent']
+
+STRING_COLUMNS = {'zip_code', 'city', 'state', 'msa_name', 'msi_name'}
+INTEGER_COLUMNS = {'region_id', 'zip_count'}
+
+class ExportRequest:
+    """One export: level, states, contributions and format, validated"""
+
+    def __init__(self, index, level='zip', states=None, contributions=False, fmt='csv',
+                 chunk_rows=EXPORT_CHUNK_ROWS):
+        if level not in ('zip', 'msa'):
+            raise ValueError("level must be 'zip' or 'msa'")
+        if fmt not in FORMATS:
+            raise ValueError(f'format must be one of {list(FORMATS)}')
+        if contributions and level != 'zip':
+            raise ValueError('contributions are only available for level=zip')
+        unknown = sorted(set(states or []) - set(index.state_rows))
+        if unknown:
+            raise ValueError(f'No data for states {unknown}')
+        self.index = index
+        self.level = level
+        self.states = sorted(states) if states else sorted(index.state_rows)
+        self.contributions = contributions
+        self.fmt = fmt
+        self.chunk_rows = chunk_rows
+        if level == 'zip':
+            self.columns = ZIP_COLUMNS + (CONTRIBUTION_COLUMNS if contributions else [])
+            # Table order within the selected states, so chunks are stable across requests
+            self.rows = np.sort(np.concatenate([index.state_rows[state] for state in self.states]))
+        else:
+            self.columns = MSA_COLUMNS
+            self.rows = None
+
+    @property
+    def key(self):
+        # The table name covers the data version and the exact model files
+        return (os.path.basename(self.index.table.path), self.level, tuple(self.states),
+                self.contributions, self.fmt, self.chunk_rows)
+
+    @property
+    def etag(self):
+        return '"' + hashlib.sha1(repr(self.key).encode('utf-8')).hexdigest() + '"'
+
+    @property
+    def filename(self):
+        scope = '_'.join(self.states) if len(self.states) <= 5 else 'all'
+        return f'scored_{self.level}_{scope}_{self.index.data_version}.{self.fmt}'
+
+    def n_chunks(self):
+        if self.level == 'msa':
+            return len(self.states)
+        return (len(self.rows) + self.chunk_rows - 1) // self.chunk_rows
+
+    def chunk(self, i):
+        """Columns (name -> list) of chunk i: a slice of ZIP rows, or the MSAs of one state"""
+        table = self.index.table
+        if self.level == 'msa':
+            state = self.states[i]
+            rows = np.sort(self.index.state_rows[state])
+            df = pd.DataFrame({
+                'region_id': table.column('region_id')[rows],
+                'msa_name': table.strings('msa_name', rows),
+                **{column: metric_values(column, self.index.columns[column][rows]) for column in FEATURE_COLUMNS}
+            })
+            records = summarize_msas(df, self.index.columns['investment_score'][rows])
+            return {column: [state] * len(records) if column == 'state' else [record[column] for record in records]
+                    for column in self.columns}
+
+        rows = self.rows[i * self.chunk_rows:(i + 1) * self.chunk_rows]
+        chunk = {
+            'zip_code': table.zip_codes(rows),
+            'city': table.strings('city', rows),
+            'state': table.strings('state', rows),
+            'region_id': table.column('region_id')[rows].tolist(),
+            'msa_name': table.strings('msa_name', rows)
+        }
+        for column in NUMERIC_COLUMNS:
+            chunk[column] = metric_values(column, self.index.columns[column][rows])
+        if self.contributions:
+            for name in SCORE_COLUMNS:
+                chunk[f'{name}_bias'] = [float(table.column(f'{name}.bias')[0])] * len(rows)
+                values = np.asarray(table.column(f'{name}.contributions')[rows], dtype=np.float64)
+                for j, column in enumerate(FEATURE_COLUMNS):
+                    chunk[f'{name}_{column}'] = values[:, j].tolist()
+        return chunk
+
+    def pieces(self, first_chunk=0):
+        """
+        Encoded bytes, one piece per chunk (plus the CSV header and the
+        Parquet footer). CSV and NDJSON chunks stand alone, so a resumed
+        export starts encoding at first_chunk; Parquet has to run from the
+        start because its footer describes every row group.
+        """
+        if self.fmt == 'parquet':
+            yield from self._parquet_pieces()
+            return
+        if self.fmt == 'csv' and first_chunk == 0:
+            yield self._csv_rows([self.columns])
+        for i in range(first_chunk, self.n_chunks()):
+            chunk = self.chunk(i)
+            if self.fmt == 'csv':
+                yield self._csv_rows(zip(*(chunk[column] for column in self.columns)))
+            else:
+                yield ''.join(json.dumps(dict(zip(self.columns, values))) + '\n'
+                              for values in zip(*(chunk[column] for column in self.columns))).encode('utf-8')
+
+    def piece_index(self, chunk):
+        """Position of a chunk's piece, counting the CSV header"""
+        return chunk + 1 if self.fmt == 'csv' else chunk
+
+    @staticmethod
+    def _csv_rows(rows):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(rows)
+        return buffer.getvalue().encode('utf-8')
+
+    def _parquet_pieces(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(column, pa.string() if column in STRING_COLUMNS else
+                                     pa.int64() if column in INTEGER_COLUMNS else pa.float64())
+                            for column in self.columns])
+        sink = _PieceSink()
+        writer = pq.ParquetWriter(sink, schema)
+        for i in range(self.n_chunks()):
+            # One row group per chunk, handed out as soon as it is written
+            writer.write_table(pa.Table.from_pydict(self.chunk(i), schema=schema))
+            yield sink.drain()
+        writer.close()
+        yield sink.drain()
+
+class _PieceSink(io.RawIOBase):
+    """Write-only stream that hands out what was written since the last drain"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+# Piece sizes per export key, so byte ranges can be served without encoding what comes before
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+MAX_PLANS = 64
+
+def get_plan(export):
+    with _plans_lock:
+        return _plans.get(export.key)
+
+def save_plan(export, sizes):
+    with _plans_lock:
+        _plans[export.key] = sizes
+        while len(_plans) > MAX_PLANS:
+            _plans.popitem(last=False)
+
+def plan(export):
+    """Sizes of every piece, from the cache or by encoding the export once without sending it"""
+    sizes = get_plan(export)
+    if sizes is None:
+        sizes = [len(piece) for piece in export.pieces()]
+        save_plan(export, sizes)
+    return sizes
+
+def stream(export):
+    """Every piece, recording the piece sizes once the export has been fully sent"""
+    sizes = []
+    for piece in export.pieces():
+        sizes.append(len(piece))
+        yield piece
+    save_plan(export, sizes)
+
+def stream_range(export, start, end):
+    """Bytes start..end (inclusive), encoding from the chunk that holds start"""
+    sizes = plan(export)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    first_piece = int(np.searchsorted(offsets, start, side='right')) - 1
+    if export.fmt == 'parquet':
+        first_piece, pieces = 0, export.pieces()
+    else:
+        # Only whole chunks can be skipped; the CSV header is piece 0 and comes with chunk 0
+        first_chunk = max(first_piece - 1 if export.fmt == 'csv' else first_piece, 0)
+        first_piece = export.piece_index(first_chunk) if first_chunk else 0
+        pieces = export.pieces(first_chunk)
+    position = int(offsets[first_piece])
+    for piece in pieces:
+        piece_start, position = position, position + len(piece)
+        if position <= start:
+            continue
+        if piece_start > end:
+            break
+        yield piece[max(start - piece_start, 0):end + 1 - piece_start]
+
+def parse_range(header, total):
+    """(start, end) for a single 'bytes=' range, None to send everything, or ValueError if unsatisfiable"""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+        else:
+            start = int(first)
+            end = int(last) if last else total - 1
+    except ValueError:
+        return None
+    if not first:
+        if length <= 0:
+            raise ValueError('Range not satisfiable')
+        return max(total - length, 0), total - 1
+    if start >= total or end < start:
+        raise ValueError('Range not satisfiable')
+    return start, min(end, total - 1)
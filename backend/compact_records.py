@@ -0,0 +1,165 @@
+import numpy as np
+import pandas as pd
+import argparse
+import json
+import sys
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+# Decimals preprocessing rounds each metric to. Metrics small enough that float32
+# keeps every stored decimal are held as float32 and rounded back on output;
+# home values and rents need more significant digits and stay float64.
+COLUMN_DECIMALS = {
+    'median_home_value': 2,
+    'median_rent': 2,
+    'days_pending': 1,
+    'price_cuts_percent': 1,
+    'market_heat': 1,
+    'price_to_rent': 2
+}
+FLOAT32_COLUMNS = {'days_pending', 'price_cuts_percent', 'market_heat', 'price_to_rent'}
+
+STRING_COLUMNS = ['city', 'state', 'msa_name']
+
+def metric_dtype(column):
+    return np.float32 if column in FLOAT32_COLUMNS else np.float64
+
+def metric_values(column, values):
+    """Python floats for JSON, equal to the float64 values preprocessing wrote"""
+    if column in FLOAT32_COLUMNS:
+        decimals = COLUMN_DECIMALS[column]
+        return [round(value, decimals) for value in values.tolist()]
+    return values.tolist()
+
+class ZipRecords:
+    """
+    Column-oriented ZIP rows: ZIP codes as integers, region ids as int64,
+    city/state/MSA name as categoricals and metrics as float32 where the
+    stored precision allows. Replaces lists of dicts and object-dtype
+    frames on the serving path.
+    """
+    __slots__ = ('zip_codes', 'region_ids', 'strings', 'metrics')
+
+    def __init__(self, zip_codes, region_ids, strings, metrics):
+        self.zip_codes = zip_codes
+        self.region_ids = region_ids
+        self.strings = strings
+        self.metrics = metrics
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from the dicts MongoDB returns"""
+        return cls.from_frame(pd.DataFrame.from_records(records))
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(
+            df['zip_code'].astype(int).to_numpy(dtype=np.int32),
+            df['region_id'].to_numpy(dtype=np.int64),
+            {column: pd.Categorical(df[column]) for column in STRING_COLUMNS},
+            {column: df[column].to_numpy(dtype=metric_dtype(column)) for column in FEATURE_COLUMNS}
+        )
+
+    def __len__(self):
+        return len(self.zip_codes)
+
+    def features(self):
+        """Model input frame in float64, in FEATURE_COLUMNS order"""
+        return pd.DataFrame({column: np.asarray(metric_values(column, self.metrics[column]), dtype=np.float64)
+                             for column in FEATURE_COLUMNS})
+
+    def take(self, rows):
+        """Subset (or reorder) rows without copying the string dictionaries"""
+        return ZipRecords(
+            self.zip_codes[rows],
+            self.region_ids[rows],
+            {column: values[rows] for column, values in self.strings.items()},
+            {column: values[rows] for column, values in self.metrics.items()}
+        )
+
+    def to_dicts(self, scores=None):
+        """JSON-ready rows in the /api/recommendations shape, plus any score columns"""
+        scores = scores or {}
+        zip_codes = [f'{code:05d}' for code in self.zip_codes.tolist()]
+        region_ids = [str(region_id) for region_id in self.region_ids.tolist()]
+        strings = {column: values.astype(object).tolist() for column, values in self.strings.items()}
+        metrics = {column: metric_values(column, values) for column, values in self.metrics.items()}
+        score_values = {name: np.asarray(values, dtype=np.float64).tolist() for name, values in scores.items()}
+        rows = []
+        for i in range(len(zip_codes)):
+            row = {
+                'zip_code': zip_codes[i],
+                'city': strings['city'][i],
+                'state': strings['state'][i],
+                'region_id': region_ids[i],
+                'msa_name': strings['msa_name'][i]
+            }
+            for column in FEATURE_COLUMNS:
+                row[column] = metrics[column][i]
+            for name, values in score_values.items():
+                row[name] = values[i]
+            rows.append(row)
+        return rows
+
+    def nbytes(self):
+        """Memory held by the arrays and string dictionaries"""
+        total = self.zip_codes.nbytes + self.region_ids.nbytes
+        for values in self.strings.values():
+            total += values.codes.nbytes + int(values.categories.memory_usage(deep=True))
+        return total + sum(values.nbytes for values in self.metrics.values())
+
+def deep_sizeof(obj, seen=None):
+    """Approximate deep size of dicts, lists and scalars, counting shared objects once"""
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    return size
+
+def memory_report(path='data/processed_zip_data.csv'):
+    """Compare the representations of the full national dataset"""
+    df = pd.read_csv(path, dtype={'zip_code': str})
+    # Records as MongoDB returns them: one dict per ZIP code with its own strings
+    records = json.loads(df.to_json(orient='records'))
+    compact = ZipRecords.from_records(records)
+
+    # Round-trip check: the compact rows serialize to the same values
+    original = [{column: record[column] for column in ['zip_code', 'city', 'state', 'msa_name'] + FEATURE_COLUMNS}
+                for record in records]
+    restored = [{key: row[key] for key in original[0]} for row in compact.to_dicts()]
+    sizes = {
+        'list_of_dicts': deep_sizeof(records),
+        'object_dataframe': int(pd.DataFrame(records).memory_usage(deep=True).sum()),
+        'compact_records': compact.nbytes()
+    }
+    return {
+        'rows': len(records),
+        'bytes': sizes,
+        'bytes_per_row': {name: size / len(records) for name, size in sizes.items()},
+        'reduction_vs_list_of_dicts': sizes['list_of_dicts'] / sizes['compact_records'],
+        'reduction_vs_object_dataframe': sizes['object_dataframe'] / sizes['compact_records'],
+        'lossless': original == restored
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Memory report for the ZIP record representations')
+    parser.add_argument('--data', default='data/processed_zip_data.csv', help='Processed ZIP data CSV')
+    parser.add_argument('--output', default=None, help='Write the report as JSON')
+    args = parser.parse_args()
+
+    report = memory_report(args.data)
+    print(f"{report['rows']} ZIP codes")
+    for name, size in report['bytes'].items():
+        print(f"  {name:18s} {size / 1e6:8.2f} MB  {report['bytes_per_row'][name]:8.1f} B/row")
+    print(f"Compact records are {report['reduction_vs_list_of_dicts']:.1f}x smaller than dicts and "
+          f"{report['reduction_vs_object_dataframe']:.1f}x smaller than an object DataFrame "
+          f"(lossless: {report['lossless']})")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
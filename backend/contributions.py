@@ -0,0 +1,109 @@
+import numpy as np
+import pandas as pd
+import argparse
+import weakref
+from scipy import sparse
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+# Rows per decision_path call, to bound the size of the node indicator matrix
+BATCH_SIZE = 4096
+
+class TreeContributions:
+    """
+    Saabas-style tree-path decomposition of a fitted RandomForest.
+    Every step from a node to its child changes the tree's output by
+    (child value - node value), which is credited to the node's split
+    feature. Averaged over trees, a prediction is exactly
+    bias + sum(contributions). All steps of all trees are folded into
+    one sparse (nodes x features) matrix, so explaining a batch is a
+    single decision_path call and one sparse product.
+    """
+
+    def __init__(self, forest, positive_class=1):
+        n_features = forest.n_features_in_
+        deltas, rows, columns, biases = [], [], [], []
+        offset = 0
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            value = tree.value[:, 0, :]
+            if hasattr(forest, 'classes_'):
+                # Classifier trees store class counts; the forest averages per-tree probabilities
+                value = value[:, positive_class] / value.sum(axis=1)
+            else:
+                value = value[:, 0]
+            children = np.concatenate([tree.children_left, tree.children_right])
+            parents = np.concatenate([np.arange(tree.node_count)] * 2)
+            is_child = children >= 0
+            children, parents = children[is_child], parents[is_child]
+
+            rows.append(children + offset)
+            columns.append(tree.feature[parents])
+            deltas.append(value[children] - value[parents])
+            biases.append(value[0])
+            offset += tree.node_count
+
+        n_trees = len(forest.estimators_)
+        self.bias = float(np.mean(biases))
+        self.steps = sparse.csr_matrix(
+            (np.concatenate(deltas) / n_trees, (np.concatenate(rows), np.concatenate(columns))),
+            shape=(offset, n_features)
+        )
+        self.forest = forest
+
+    def explain(self, X, batch_size=BATCH_SIZE):
+        """Return (bias, rows x features contributions) for already-scaled inputs"""
+        X = np.asarray(X, dtype=np.float32)
+        contributions = np.empty((len(X), self.steps.shape[1]), dtype=np.float64)
+        for start in range(0, len(X), batch_size):
+            indicator, _ = self.forest.decision_path(X[start:start + batch_size])
+            contributions[start:start + batch_size] = (indicator @ self.steps).toarray()
+        return self.bias, contributions
+
+# Decompositions per loaded bundle; they go away with the bundle after a reload
+_explainers = weakref.WeakKeyDictionary()
+
+def explainers_for(bundle):
+    """TreeContributions for both models of a bundle, built once"""
+    explainers = _explainers.get(bundle)
+    if explainers is None:
+        explainers = _explainers[bundle] = {
+            'investment_score': TreeContributions(bundle.classifier),
+            'ranking_score': TreeContributions(bundle.ranker)
+        }
+    return explainers
+
+def explain(bundle, features):
+    """Biases and per-feature contributions of both scores for a frame of raw features"""
+    explainers = explainers_for(bundle)
+    scaled = {
+        'investment_score': bundle.clf_scaler.transform(features[FEATURE_COLUMNS]),
+        'ranking_score': bundle.rank_scaler.transform(features[FEATURE_COLUMNS])
+    }
+    return {name: explainer.explain(scaled[name]) for name, explainer in explainers.items()}
+
+def format_contributions(bias, contributions):
+    """JSON shape for one row: bias plus a value per feature"""
+    return {
+        'bias': bias,
+        'features': dict(zip(FEATURE_COLUMNS, np.asarray(contributions, dtype=np.float64).tolist()))
+    }
+
+if __name__ == "__main__":
+    from model_registry import ModelBundle, get_active_version
+
+    parser = argparse.ArgumentParser(description='Export per-feature score contributions for every ZIP code')
+    parser.add_argument('--data', default='data/processed_zip_data.csv', help='Processed ZIP data CSV')
+    parser.add_argument('--output', default='model/results/contributions.csv', help='Output CSV')
+    args = parser.parse_args()
+
+    zip_data = pd.read_csv(args.data, dtype={'zip_code': str})
+    bundle = ModelBundle.load(get_active_version() or 'legacy')
+    export = zip_data[['zip_code', 'state', 'msa_name']].copy()
+    for name, (bias, contributions) in explain(bundle, zip_data).items():
+        export[f'{name}_bias'] = bias
+        for i, column in enumerate(FEATURE_COLUMNS):
+            export[f'{name}_{column}'] = contributions[:, i]
+    export.to_csv(args.output, index=False)
+    print(f"Contributions for {len(export)} ZIP codes saved to {args.output} (model version {bundle.version})")
@@ -3,7 +3,10 @@ import numpy as np
 import os
 import json
 import re
+import hashlib
+from datetime import datetime
 from database import Database
+from feature_store import build_feature_store, METRIC_FILES
 
 def normalize_city_name(name):
     """Normalize city name for better matching"""
@@ -142,20 +145,24 @@ def load_zillow_data(data_dir=None):
     
     return msa_data
 
-def process_and_map_data():
-    """Process Zillow MSA data and map it to zip codes"""
-    # Get data directories from environment or use defaults
-    data_dir = os.getenv('DATA_DIR', "backend/data")
-    zillow_dir = os.getenv('ZILLOW_DIR', "backend/zillow-data")
-    
-    # Load ZIP-CBSA mapping
-    zip_data = load_zip_cbsa_mapping(data_dir)
-    
-    # Load and process Zillow MSA data
-    msa_data = load_zillow_data(zillow_dir)
-    
-    print("Mapping ZIP codes to MSA data...")
-    # Create a mapping of CBSA codes to their primary cities
+# Decimals each output column is rounded to
+ROUNDING = {
+    'median_home_value': 2,
+    'median_rent': 2,
+    'days_pending': 1,
+    'price_cuts_percent': 1,
+    'market_heat': 1,
+    'price_to_rent': 2
+}
+
+def round_features(df):
+    """Round numeric columns the way processed_zip_data.csv stores them"""
+    for column, decimals in ROUNDING.items():
+        df[column] = df[column].round(decimals)
+    return df
+
+def primary_cities(zip_data):
+    """Create a mapping of CBSA codes to their primary cities"""
     cbsa_cities = {}
     for cbsa_code in zip_data['cbsa_code'].unique():
         # Get all cities in this CBSA
@@ -171,6 +178,14 @@ def process_and_map_data():
                 'normalized_city': primary_city,
                 'state': sample_record['state']
             }
+    return cbsa_cities
+
+def map_zips_to_msas(zip_data, msa_data, cbsa_cities=None):
+    """Map each ZIP code to its MSA and attach the MSA features"""
+    print("Mapping ZIP codes to MSA data...")
+    # The primary cities only depend on the ZIP-CBSA mapping, so refreshes pass them in
+    if cbsa_cities is None:
+        cbsa_cities = primary_cities(zip_data)
     
     # Find matching MSAs for each CBSA
     cbsa_to_msa = {}
@@ -205,43 +220,106 @@ def process_and_map_data():
     ]
     
     # Round numeric columns
-    zip_data['median_home_value'] = zip_data['median_home_value'].round(2)
-    zip_data['median_rent'] = zip_data['median_rent'].round(2)
-    zip_data['days_pending'] = zip_data['days_pending'].round(1)
-    zip_data['price_cuts_percent'] = zip_data['price_cuts_percent'].round(1)
-    zip_data['market_heat'] = zip_data['market_heat'].round(1)
-    zip_data['price_to_rent'] = zip_data['price_to_rent'].round(2)
+    return round_features(zip_data)
+
+def build_state_lookup(zip_data):
+    """Group ZIP records by state for faster API access"""
+    state_data = {}
+    for state in zip_data['state'].unique():
+        state_data[state] = zip_data[zip_data['state'] == state].to_dict('records')
+    return state_data
+
+def refresh_state(data_dir, zillow_dir, cbsa_cities):
+    """
+    What a build was made from: the date columns of each Zillow file, a hash
+    of the ZIP-CBSA mapping and the primary city of each CBSA.
+    incremental_refresh compares the next month's files against this.
+    """
+    with open(os.path.join(data_dir, "ZIP_CBSA_122024.xlsx"), 'rb') as f:
+        mapping_sha256 = hashlib.sha256(f.read()).hexdigest()
+    date_columns = {}
+    for filename in METRIC_FILES.values():
+        header = pd.read_csv(os.path.join(zillow_dir, filename), nrows=0).columns
+        date_columns[filename] = sorted(col for col in header if col.startswith('20'))
+    return {
+        'mapping_sha256': mapping_sha256,
+        'date_columns': date_columns,
+        'cbsa_cities': cbsa_cities,
+        'updated_at': datetime.now().isoformat()
+    }
+
+def save_refresh_state(output_dir, state):
+    with open(os.path.join(output_dir, "refresh_state.json"), 'w') as f:
+        json.dump(state, f, indent=2)
+
+def load_refresh_state(output_dir):
+    """State saved by the last build, or None if there was none"""
+    path = os.path.join(output_dir, "refresh_state.json")
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def process_and_map_data(data_dir=None, zillow_dir=None, output_dir="data", db=None):
+    """Process Zillow MSA data and map it to zip codes"""
+    # Get data directories from environment or use defaults
+    data_dir = data_dir or os.getenv('DATA_DIR', "backend/data")
+    zillow_dir = zillow_dir or os.getenv('ZILLOW_DIR', "backend/zillow-data")
+    
+    # Load ZIP-CBSA mapping
+    zip_mapping = load_zip_cbsa_mapping(data_dir)
+    
+    # Load and process Zillow MSA data
+    msa_data = load_zillow_data(zillow_dir)
+    
+    cbsa_cities = primary_cities(zip_mapping)
+    zip_data = map_zips_to_msas(zip_mapping, msa_data, cbsa_cities)
     
     # Save processed data
-    output_dir = "data"
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # Cleaned mapping, so monthly refreshes can skip reading the Excel file
+    zip_mapping.to_csv(os.path.join(output_dir, "zip_cbsa_mapping.csv"), index=False)
+    
     print("Saving processed data...")
     # Save main dataset
     zip_data.to_csv(os.path.join(output_dir, "processed_zip_data.csv"), index=False)
     
     # Create and save state lookup for faster API access
-    state_data = {}
-    for state in zip_data['state'].unique():
-        state_data[state] = zip_data[zip_data['state'] == state].to_dict('records')
+    state_data = build_state_lookup(zip_data)
     
     with open(os.path.join(output_dir, "state_lookup.json"), 'w') as f:
         json.dump(state_data, f, indent=2)
     
+    # Keep the full monthly history as memory-mappable matrices for the API
+    build_feature_store(zillow_dir, os.path.join(output_dir, "feature_store"))
+    
+    # Remember what this build saw, so the next month can be applied incrementally
+    save_refresh_state(output_dir, refresh_state(data_dir, zillow_dir, cbsa_cities))
+    
     print(f"Processing complete! Dataset contains {len(zip_data)} zip codes across {len(zip_data['state'].unique())} states")
     
     # Additionally save to MongoDB
+    owns_db = db is None
     try:
-        from database import Database
         print("Saving data to MongoDB...")
-        db = Database()
+        if owns_db:
+            db = Database()
         db.initialize_collections(zip_data, state_data)
         print("Successfully saved data to MongoDB!")
+        
+        # Materialize the per-MSA aggregates served by /api/msi-analysis
+        try:
+            from msa_table import refresh_msa_table
+            refresh_msa_table(db, zip_data)
+            print("Materialized MSA table in MongoDB!")
+        except FileNotFoundError as e:
+            print(f"Warning: MSA table not built, train the models and run msa_table.py: {str(e)}")
     except Exception as e:
         print(f"Warning: Failed to save to MongoDB: {str(e)}")
     finally:
-        if 'db' in locals():
+        if owns_db and db is not None:
             db.close()
     
     return zip_data
@@ -1,24 +1,41 @@
-from pymongo import MongoClient
-import pandas as pd
+from startup import LazyModule
 import json
 from urllib.parse import quote_plus
 import os
+import uuid
+from datetime import datetime
+
+# Heavy imports are deferred until a connection or DataFrame is actually needed
+pymongo = LazyModule('pymongo')
+pd = LazyModule('pandas')
 
 # Get MongoDB URI from environment variable, fallback to localhost if not set
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/capstone')
 
+# Driver timeouts, so a call on a dead or failing-over server gives up instead of hanging
+MONGO_TIMEOUTS = {
+    'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    'connectTimeoutMS': int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '5000')),
+    'socketTimeoutMS': int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '30000'))
+}
+
 class Database:
-    def __init__(self):
-        print("MONGO_URI:", MONGO_URI, flush=True)
-        # For Atlas, force TLS and ignore cert verification
-        if 'mongodb+srv://' in MONGO_URI:
-            self.client = MongoClient(MONGO_URI + "&tls=true")
-        else:
-            self.client = MongoClient(MONGO_URI)
+    def __init__(self, client=None):
+        # An injected client (e.g. mongo_standin.InMemoryClient) replaces the real connection
+        if client is None:
+            print("MONGO_URI:", MONGO_URI, flush=True)
+            # For Atlas, force TLS and ignore cert verification
+            if 'mongodb+srv://' in MONGO_URI:
+                client = pymongo.MongoClient(MONGO_URI + "&tls=true", **MONGO_TIMEOUTS)
+            else:
+                client = pymongo.MongoClient(MONGO_URI, **MONGO_TIMEOUTS)
+        self.client = client
             
         self.db = self.client.capstone
         self.zip_data = self.db.zip_data
         self.state_lookup = self.db.state_lookup
+        self.msa_lookup = self.db.msa_lookup
+        self.metadata = self.db.metadata
 
     def initialize_collections(self, zip_data_df, state_lookup_dict):
         """Initialize collections with data"""
@@ -49,18 +66,122 @@ class Database:
         
         # Create index on state for faster lookups
         self.state_lookup.create_index('state')
+        
+        self.stamp_data_version()
+
+    def update_zip_records(self, zip_data_df, state_lookup_dict, removed_zip_codes=(), removed_states=()):
+        """Replace the given ZIP records and state lookups, leaving the rest in place"""
+        zip_data_df = zip_data_df.copy()
+        zip_data_df['zip_code'] = zip_data_df['zip_code'].astype(str).str.zfill(5)
+        zip_records = zip_data_df.to_dict('records')
+        
+        zip_codes = [record['zip_code'] for record in zip_records] + list(removed_zip_codes)
+        if zip_codes:
+            self.zip_data.delete_many({'zip_code': {'$in': zip_codes}})
+        if zip_records:
+            self.zip_data.insert_many(zip_records)
+        
+        states = list(state_lookup_dict) + list(removed_states)
+        if states:
+            self.state_lookup.delete_many({'state': {'$in': states}})
+        if state_lookup_dict:
+            self.state_lookup.insert_many([{
+                'state': state,
+                'data': data
+            } for state, data in state_lookup_dict.items()])
+        
+        self.stamp_data_version()
+
+    def stamp_data_version(self):
+        """New data version, so in-memory indexes built from the old data get rebuilt"""
+        self.metadata.delete_many({'name': 'zip_data'})
+        self.metadata.insert_many([{
+            'name': 'zip_data',
+            'version': datetime.now().strftime('%Y%m%d-%H%M%S-%f'),
+            'updated_at': datetime.now().isoformat()
+        }])
+
+    def initialize_msa_table(self, msa_table, model_version):
+        """Replace the materialized per-state MSA aggregates, every model version's"""
+        # Built aside and renamed into place, so readers never see a partial table
+        staging = self.db[f'msa_lookup_staging_{uuid.uuid4().hex[:8]}']
+        staging.insert_many([{
+            'state': state,
+            'model_version': model_version,
+            'data': rows
+        } for state, rows in msa_table.items()])
+        
+        # Create index on state for faster lookups
+        staging.create_index('state')
+        staging.rename('msa_lookup', dropTarget=True)
+
+    def add_msa_version(self, msa_table, model_version, keep=3):
+        """
+        Store the MSA aggregates of another model version next to those
+        already there, for a model switch on unchanged data. Only the
+        newest keep versions, this one included, are kept.
+        """
+        stored = self.get_msa_model_versions() - {model_version}
+        # Readers of this version fall back to aggregating on the fly until its rows are in
+        self.msa_lookup.delete_many({'model_version': model_version})
+        if msa_table:
+            self.msa_lookup.insert_many([{
+                'state': state,
+                'model_version': model_version,
+                'data': rows
+            } for state, rows in msa_table.items()])
+        stale = sorted(stored, key=str)[:max(len(stored) - (keep - 1), 0)]
+        if stale:
+            self.msa_lookup.delete_many({'model_version': {'$in': stale}})
+
+    def update_msa_table(self, msa_table, model_version, states=None):
+        """Replace the MSA aggregates of the given states (default: those in msa_table) only"""
+        states = list(msa_table) if states is None else list(states)
+        if states:
+            # Aggregates of other model versions are out of date for these states too
+            self.msa_lookup.delete_many({'state': {'$in': states}})
+        if msa_table:
+            self.msa_lookup.insert_many([{
+                'state': state,
+                'model_version': model_version,
+                'data': rows
+            } for state, rows in msa_table.items()])
+
+    def get_msa_model_versions(self):
+        """Model versions the materialized MSA table was scored with"""
+        return {doc.get('model_version') for doc in self.msa_lookup.find({}, {'_id': 0, 'data': 0})}
 
     def get_zip_data(self):
         """Get all ZIP data as a DataFrame"""
         cursor = self.zip_data.find({}, {'_id': 0})
         return pd.DataFrame(list(cursor))
 
-    def get_state_data(self, state_code):
-        """Get data for a specific state"""
+    def get_state_records(self, state_code):
+        """Get the raw ZIP records for a specific state"""
         state_doc = self.state_lookup.find_one({'state': state_code})
         if state_doc:
-            return pd.DataFrame(state_doc['data'])
-        return pd.DataFrame()
+            return state_doc['data']
+        return []
+
+    def get_states(self):
+        """List the state codes that have data"""
+        return sorted(doc['state'] for doc in self.state_lookup.find({}, {'state': 1, '_id': 0}))
+
+    def get_state_data(self, state_code):
+        """Get data for a specific state"""
+        return pd.DataFrame(self.get_state_records(state_code))
+
+    def get_msa_summary(self, state_code, model_version=None):
+        """Get the materialized MSA aggregates for a state, with the model version that scored them"""
+        filter = {'state': state_code}
+        if model_version is not None:
+            filter['model_version'] = model_version
+        return self.msa_lookup.find_one(filter, {'_id': 0})
+
+    def get_data_version(self):
+        """Version stamped by the last initialize_collections, or None for older databases"""
+        doc = self.metadata.find_one({'name': 'zip_data'}, {'_id': 0})
+        return doc['version'] if doc else None
 
     def get_zip_info(self, zip_code):
         """Get information for a specific ZIP code"""
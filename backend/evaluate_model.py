@@ -1,17 +1,26 @@
 import pandas as pd
 import numpy as np
 import joblib
-from sklearn.metrics import classification_report, confusion_matrix
-import matplotlib.pyplot as plt
-import seaborn as sns
+from sklearn.metrics import classification_report, confusion_matrix, roc_curve, roc_auc_score
+from multiprocessing import Process
+import argparse
+import json
 import os
 
+# Number of bins used for the histogram data in evaluation_data.json
+HISTOGRAM_BINS = 30
+
+# ROC curves are downsampled to at most this many points
+MAX_ROC_POINTS = 200
+
 # Create results directory if it doesn't exist
 if not os.path.exists('model/results'):
     os.makedirs('model/results')
 
 def plot_confusion_matrix(y_true, y_pred):
     """Plot confusion matrix"""
+    import matplotlib.pyplot as plt
+    import seaborn as sns
     cm = confusion_matrix(y_true, y_pred)
     plt.figure(figsize=(8, 6))
     sns.heatmap(cm, annot=True, fmt='d', cmap='Blues')
@@ -23,6 +32,7 @@ def plot_confusion_matrix(y_true, y_pred):
 
 def plot_feature_importance(classifier, feature_names):
     """Plot feature importance"""
+    import matplotlib.pyplot as plt
     importance = classifier.feature_importances_
     indices = np.argsort(importance)[::-1]
     
@@ -36,6 +46,7 @@ def plot_feature_importance(classifier, feature_names):
 
 def plot_score_distribution(scores, recommendations, title="Investment Score Distribution"):
     """Plot investment score distribution by recommendation"""
+    import matplotlib.pyplot as plt
     plt.figure(figsize=(10, 6))
     plt.hist([
         scores[recommendations],
@@ -49,7 +60,64 @@ def plot_score_distribution(scores, recommendations, title="Investment Score Dis
     plt.savefig('model/results/score_distribution.png')
     plt.close()
 
-def evaluate_models():
+def render_plots(y_true, y_pred, classifier, feature_names, investment_scores):
+    """Render the PNG charts (run in a separate process so it never delays the data)"""
+    import matplotlib
+    matplotlib.use('Agg')
+    
+    plot_confusion_matrix(y_true, y_pred)
+    plot_feature_importance(classifier, feature_names)
+    plot_score_distribution(investment_scores, y_pred)
+
+def _histogram(values, bins):
+    counts, _ = np.histogram(values, bins=bins)
+    return counts.tolist()
+
+def build_evaluation_data(classifier, X_test, y_true, y_pred, y_proba, investment_scores):
+    """Collect the numbers behind every evaluation chart into one compact dict"""
+    labels = sorted(pd.unique(y_true))
+    cm = confusion_matrix(y_true, y_pred, labels=labels)
+    
+    importance = classifier.feature_importances_
+    indices = np.argsort(importance)[::-1]
+    
+    # Histogram bin edges are shared by both series so they can be stacked
+    score_edges = np.histogram_bin_edges(investment_scores, bins=HISTOGRAM_BINS)
+    recommended = np.asarray(y_pred).astype(bool)
+    proba_edges = np.linspace(0, 1, HISTOGRAM_BINS + 1)
+    
+    fpr, tpr, thresholds = roc_curve(y_true, y_proba[:, 1])
+    step = max(1, len(fpr) // MAX_ROC_POINTS)
+    keep = np.unique(np.r_[np.arange(0, len(fpr), step), len(fpr) - 1])
+    
+    return {
+        'confusion_matrix': {
+            'labels': [str(label) for label in labels],
+            'counts': cm.tolist()
+        },
+        'classification_report': classification_report(y_true, y_pred, output_dict=True),
+        'roc_curve': {
+            'fpr': np.round(fpr[keep], 4).tolist(),
+            'tpr': np.round(tpr[keep], 4).tolist(),
+            'thresholds': np.round(np.clip(thresholds[keep], 0, 1), 4).tolist(),
+            'auc': float(roc_auc_score(y_true, y_proba[:, 1]))
+        },
+        'feature_importance': {
+            'features': [X_test.columns[i] for i in indices],
+            'importances': np.round(importance[indices], 4).tolist()
+        },
+        'prediction_distribution': {
+            'bin_edges': np.round(proba_edges, 4).tolist(),
+            'counts': _histogram(y_proba[:, 1], proba_edges)
+        },
+        'score_distribution': {
+            'bin_edges': np.round(score_edges, 4).tolist(),
+            'recommended': _histogram(investment_scores[recommended], score_edges),
+            'not_recommended': _histogram(investment_scores[~recommended], score_edges)
+        }
+    }
+
+def evaluate_models(plots=True):
     """Evaluate both classifier and ranking models"""
     # Load models and scalers
     classifier = joblib.load('model/investment_classifier.joblib')
@@ -72,10 +140,19 @@ def evaluate_models():
     y_proba = classifier.predict_proba(X_test_scaled_clf)
     investment_scores = ranker.predict(X_test_scaled_rank)
     
-    # Generate plots
-    plot_confusion_matrix(y_true, y_pred)
-    plot_feature_importance(classifier, X_test.columns)
-    plot_score_distribution(investment_scores, y_pred)
+    # Save chart data first so the API has it before any rendering happens
+    evaluation_data = build_evaluation_data(classifier, X_test, y_true, y_pred, y_proba, investment_scores)
+    with open('model/results/evaluation_data.json.tmp', 'w') as f:
+        json.dump(evaluation_data, f, separators=(',', ':'))
+    os.replace('model/results/evaluation_data.json.tmp', 'model/results/evaluation_data.json')
+    
+    # Generate plots in a separate process
+    renderer = None
+    if plots:
+        renderer = Process(target=render_plots, args=(
+            y_true, y_pred, classifier, list(X_test.columns), investment_scores
+        ))
+        renderer.start()
     
     # Print classification report
     print("\nClassification Report:")
@@ -102,6 +179,12 @@ def evaluate_models():
         'true_investment_score': y_reg_true
     })
     results.to_csv('model/results/evaluation_results.csv', index=False)
+    
+    if renderer is not None:
+        renderer.join()
 
 if __name__ == '__main__':
-    evaluate_models()
+    parser = argparse.ArgumentParser(description='Evaluate the investment classifier and ZIP ranker')
+    parser.add_argument('--no-plots', action='store_true', help='Only write the chart data, skip the PNGs')
+    args = parser.parse_args()
+    evaluate_models(plots=not args.no_plots)
@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+import json
+import os
+
+# Zillow source file for each metric, keyed by the column name used everywhere else
+METRIC_FILES = {
+    'median_home_value': 'zillow_home_value_index.csv',
+    'median_rent': 'zillow_observed_rent_index.csv',
+    'days_pending': 'days_to_pending.csv',
+    'price_cuts_percent': 'share_of_listings_with_price_cut.csv',
+    'market_heat': 'market_heat_index.csv',
+}
+
+FEATURE_STORE_DIR = os.getenv('FEATURE_STORE_DIR', 'data/feature_store')
+
+def load_metric_history(data_dir, metric):
+    """Load the full monthly history of a metric at MSA level, indexed by RegionID"""
+    df = pd.read_csv(os.path.join(data_dir, METRIC_FILES[metric]))
+    df = df[df['RegionType'] == 'msa']
+    date_cols = sorted(col for col in df.columns if col.startswith('20'))
+    history = df.set_index('RegionID')[date_cols].astype('float64')
+    if metric == 'median_rent':
+        # Convert rent from hundreds to actual dollars, same as load_zillow_data
+        history = history * 100
+    return history, df.set_index('RegionID')['RegionName']
+
+def _save_array(path, array):
+    """Write an .npy file next to its final location and swap it in atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+def build_feature_store(data_dir=None, output_dir=None):
+    """
+    Build a float32 region x month matrix per metric from the full Zillow history.
+    All matrices share one region index and one month axis so any region/month
+    can be sliced from any metric with the same coordinates.
+    """
+    if data_dir is None:
+        data_dir = "backend/zillow-data"
+    if output_dir is None:
+        output_dir = FEATURE_STORE_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"Building feature store from {data_dir} into {output_dir}")
+
+    histories = {}
+    region_names = {}
+    for metric in METRIC_FILES:
+        history, names = load_metric_history(data_dir, metric)
+        histories[metric] = history
+        region_names.update(names.to_dict())
+
+    # Common axes: every MSA that appears in any file, every month in any file
+    region_ids = sorted(region_names)
+    months = sorted(set().union(*(h.columns for h in histories.values())))
+
+    matrices = {}
+    for metric, history in histories.items():
+        aligned = history.reindex(index=region_ids, columns=months)
+        matrices[metric] = aligned.to_numpy(dtype=np.float32)
+
+    # Calculate price to rent ratio over the whole history
+    with np.errstate(divide='ignore', invalid='ignore'):
+        matrices['price_to_rent'] = (
+            matrices['median_home_value'] / (matrices['median_rent'] * 12)
+        ).astype(np.float32)
+
+    for metric, matrix in matrices.items():
+        _save_array(os.path.join(output_dir, f'{metric}.npy'), matrix)
+    _save_array(os.path.join(output_dir, 'region_ids.npy'), np.asarray(region_ids, dtype=np.int64))
+
+    # The index is written last so readers never see it ahead of the arrays
+    index = {
+        'metrics': list(matrices),
+        'months': [month[:7] for month in months],
+        'region_names': [region_names[region_id] for region_id in region_ids],
+        'shape': [len(region_ids), len(months)]
+    }
+    tmp_index = os.path.join(output_dir, 'index.json.tmp')
+    with open(tmp_index, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_index, os.path.join(output_dir, 'index.json'))
+
+    print(f"Feature store complete! {len(region_ids)} regions x {len(months)} months "
+          f"for {len(matrices)} metrics")
+    return index
+
+class FeatureStore:
+    """
+    Read-only view over the feature store arrays.
+    Matrices are memory-mapped, so every worker process shares the same
+    page-cache copy and nothing is read until a slice is requested.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or FEATURE_STORE_DIR
+        with open(os.path.join(self.path, 'index.json')) as f:
+            index = json.load(f)
+        self.metrics = index['metrics']
+        self.months = index['months']
+        self.region_names = index['region_names']
+        self.region_ids = np.load(os.path.join(self.path, 'region_ids.npy'), mmap_mode='r')
+        self._matrices = {}
+
+    def matrix(self, metric):
+        """Return the memory-mapped region x month matrix for a metric"""
+        if metric not in self.metrics:
+            raise KeyError(f'Unknown metric {metric}')
+        if metric not in self._matrices:
+            self._matrices[metric] = np.load(os.path.join(self.path, f'{metric}.npy'), mmap_mode='r')
+        return self._matrices[metric]
+
+    def region_row(self, region_id):
+        """Find the matrix row for a RegionID, or None if it is not in the store"""
+        row = int(np.searchsorted(self.region_ids, int(region_id)))
+        if row < len(self.region_ids) and self.region_ids[row] == int(region_id):
+            return row
+        return None
+
+    def month_range(self, start=None, end=None):
+        """Return the column slice covering months between start and end (YYYY-MM, inclusive)"""
+        first = 0 if start is None else int(np.searchsorted(self.months, start[:7], side='left'))
+        last = len(self.months) if end is None else int(np.searchsorted(self.months, end[:7], side='right'))
+        return slice(first, last)
+
+    def history(self, region_id, metric, start=None, end=None):
+        """Return (months, values) for one region, with None where Zillow has no data"""
+        row = self.region_row(region_id)
+        if row is None:
+            return None
+        columns = self.month_range(start, end)
+        values = np.asarray(self.matrix(metric)[row, columns], dtype=np.float64)
+        return self.months[columns], [None if np.isnan(v) else round(float(v), 2) for v in values]
@@ -0,0 +1,132 @@
+import pandas as pd
+import argparse
+import json
+import os
+from database import Database
+from feature_store import build_feature_store
+from data_preprocessing import (load_zillow_data, map_zips_to_msas, build_state_lookup, process_and_map_data,
+                                refresh_state, save_refresh_state, load_refresh_state)
+
+def full_rebuild_reason(previous, current, output_dir):
+    """Why the new files cannot be applied incrementally, or None if they can"""
+    if previous is None:
+        return 'no previous build state'
+    for filename in ['processed_zip_data.csv', 'zip_cbsa_mapping.csv']:
+        if not os.path.exists(os.path.join(output_dir, filename)):
+            return f'no previous {filename}'
+    if previous['mapping_sha256'] != current['mapping_sha256']:
+        return 'ZIP-CBSA mapping changed'
+    return None
+
+def changed_rows(previous, current):
+    """Mask over current rows that are new or differ from the previous row for the same ZIP code"""
+    aligned = previous.set_index('zip_code').reindex(current['zip_code'])[current.columns.drop('zip_code')]
+    values = current.set_index('zip_code')[aligned.columns]
+    differs = (aligned != values) & ~(aligned.isna() & values.isna())
+    return differs.any(axis=1).to_numpy()
+
+def incremental_refresh(data_dir=None, zillow_dir=None, output_dir="data", db=None, bundle=None):
+    """
+    Apply new Zillow files on top of the last build. The ZIP -> MSA
+    mapping is redone from the cached ZIP-CBSA table, then only ZIP codes
+    whose row changed (new features, or joining or leaving an MSA as MSAs
+    come and go from the cleaned data) are written to MongoDB, along with
+    the state lookups and MSA aggregates of their states. The outputs are
+    the same as a full process_and_map_data run.
+    """
+    data_dir = data_dir or os.getenv('DATA_DIR', "backend/data")
+    zillow_dir = zillow_dir or os.getenv('ZILLOW_DIR', "backend/zillow-data")
+
+    previous = load_refresh_state(output_dir)
+    reason = None if previous else 'no previous build state'
+    if previous:
+        current = refresh_state(data_dir, zillow_dir, previous['cbsa_cities'])
+        reason = full_rebuild_reason(previous, current, output_dir)
+    if reason:
+        print(f"Running a full rebuild: {reason}")
+        zip_data = process_and_map_data(data_dir, zillow_dir, output_dir, db)
+        return {
+            'mode': 'full',
+            'reason': reason,
+            'affected_zips': len(zip_data),
+            'affected_states': sorted(zip_data['state'].unique())
+        }
+
+    new_columns = {}
+    for filename, columns in current['date_columns'].items():
+        added = sorted(set(columns) - set(previous['date_columns'].get(filename, [])))
+        if added:
+            new_columns[filename] = added
+
+    zip_mapping = pd.read_csv(os.path.join(output_dir, "zip_cbsa_mapping.csv"), dtype=str, keep_default_na=False)
+    zip_data = map_zips_to_msas(zip_mapping, load_zillow_data(zillow_dir), previous['cbsa_cities'])
+
+    # round_trip reads back exactly the floats the last build wrote
+    csv_path = os.path.join(output_dir, "processed_zip_data.csv")
+    previous_data = pd.read_csv(csv_path, dtype={'zip_code': str}, float_precision='round_trip')
+    changed = changed_rows(previous_data, zip_data)
+    removed = previous_data[~previous_data['zip_code'].isin(zip_data['zip_code'])]
+    changed_regions = sorted(set(zip_data.loc[changed, 'region_id'].tolist()) | set(removed['region_id'].tolist()))
+    affected_states = sorted(set(zip_data.loc[changed, 'state']) | set(removed['state']))
+    print(f"New date columns: {sum(len(columns) for columns in new_columns.values())}, "
+          f"changed MSAs: {len(changed_regions)}, changed ZIP codes: {int(changed.sum())}, "
+          f"removed ZIP codes: {len(removed)}")
+
+    modified = bool(changed.any()) or len(removed) > 0
+    if modified:
+        zip_data.to_csv(csv_path, index=False)
+        state_data = build_state_lookup(zip_data)
+        with open(os.path.join(output_dir, "state_lookup.json"), 'w') as f:
+            json.dump(state_data, f, indent=2)
+
+    # New months extend the history even when the latest values did not move
+    if modified or new_columns:
+        build_feature_store(zillow_dir, os.path.join(output_dir, "feature_store"))
+    save_refresh_state(output_dir, current)
+
+    if modified:
+        owns_db = db is None
+        try:
+            print("Updating changed records in MongoDB...")
+            if owns_db:
+                db = Database()
+            db.update_zip_records(
+                zip_data[changed],
+                {state: state_data[state] for state in affected_states if state in state_data},
+                removed_zip_codes=removed['zip_code'].tolist(),
+                removed_states=[state for state in affected_states if state not in state_data]
+            )
+            print("Successfully updated MongoDB!")
+
+            try:
+                from msa_table import refresh_msa_table
+                refresh_msa_table(db, zip_data, bundle, states=affected_states)
+                print(f"Refreshed MSA table for {len(affected_states)} states")
+            except FileNotFoundError as e:
+                print(f"Warning: MSA table not built, train the models and run msa_table.py: {str(e)}")
+        except Exception as e:
+            print(f"Warning: Failed to update MongoDB: {str(e)}")
+        finally:
+            if owns_db and db is not None:
+                db.close()
+
+    return {
+        'mode': 'incremental',
+        'new_columns': new_columns,
+        'changed_regions': changed_regions,
+        'affected_zips': int(changed.sum()) + len(removed),
+        'affected_states': affected_states
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Apply a monthly Zillow update on top of the last build')
+    parser.add_argument('--output-dir', default='data', help='Directory holding the processed data')
+    parser.add_argument('--full', action='store_true', help='Force a full rebuild')
+    args = parser.parse_args()
+
+    if args.full:
+        zip_data = process_and_map_data(output_dir=args.output_dir)
+        print(f"Full rebuild of {len(zip_data)} ZIP codes")
+    else:
+        report = incremental_refresh(output_dir=args.output_dir)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,309 @@
+import argparse
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Jobs running at once; each runs in a fresh process, so memory is returned when it ends
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '1'))
+# Niceness of job processes, so training and reprocessing yield the CPU to request workers
+JOB_NICE = int(os.getenv('JOB_NICE', '10'))
+# Status, progress and log files, one set per job, readable by every API worker
+JOB_DIR = os.getenv('JOB_DIR', 'logs/jobs')
+# Bytes of log returned per poll
+JOB_LOG_CHUNK = int(os.getenv('JOB_LOG_CHUNK', '65536'))
+# Processes a hyperparameter search may use inside a job (default: half the cores)
+JOB_SEARCH_WORKERS = int(os.getenv('JOB_SEARCH_WORKERS', str(max(1, (os.cpu_count() or 2) // 2))))
+
+ACTIVE_STATES = ('queued', 'running')
+
+# Inputs live next to this module, whatever directory the API was started from
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Set in job processes only: where the running job reports progress
+_progress_path = None
+
+def progress(stage, done=None, total=None):
+    """Report what a job is doing; a no-op outside job processes"""
+    if _progress_path is None:
+        return
+    _write_json(_progress_path, {'stage': stage, 'done': done, 'total': total, 'updated_at': time.time()})
+
+def _write_json(path, data):
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def run_retrain(search=False, folds=5, seed=42, workers=None):
+    """Train (or search and train) both models, publish a version and rescore the MSA table"""
+    import train_models
+    from model_registry import ModelBundle
+    from msa_table import refresh_msa_table
+
+    progress('training')
+    if search:
+        report = train_models.search_and_save_models(folds=folds, workers=workers or JOB_SEARCH_WORKERS,
+                                                     seed=seed, progress=progress)
+        version = report['model_version']
+    else:
+        version = train_models.train_and_save_models()
+
+    progress('msa_table')
+    try:
+        refresh_msa_table(bundle=ModelBundle.load(version), keep_versions=True)
+    except Exception as e:
+        # The API aggregates on the fly until the table matches the new version
+        print(f"Warning: Failed to refresh the MSA table: {str(e)}")
+    return {'model_version': version}
+
+def run_evaluate(plots=True):
+    """Rewrite the evaluation charts and data served by /api/model-evaluation"""
+    import evaluate_model
+
+    progress('evaluating')
+    evaluate_model.evaluate_models(plots=plots)
+    return {}
+
+def run_reprocess(full=False):
+    """Apply new Zillow files incrementally, or rebuild all processed data"""
+    from incremental_refresh import incremental_refresh
+    from data_preprocessing import process_and_map_data
+
+    progress('reprocessing')
+    data_dir = os.getenv('DATA_DIR', os.path.join(BACKEND_DIR, 'data'))
+    zillow_dir = os.getenv('ZILLOW_DIR', os.path.join(BACKEND_DIR, 'zillow-data'))
+    if full:
+        zip_data = process_and_map_data(data_dir, zillow_dir, output_dir='data')
+        return {'mode': 'full', 'affected_zips': len(zip_data)}
+    return incremental_refresh(data_dir, zillow_dir, output_dir='data')
+
+# Job kind -> (runner, option -> type); only these options are passed through
+JOB_KINDS = {
+    'retrain': (run_retrain, {'search': bool, 'folds': int, 'seed': int, 'workers': int}),
+    'evaluate': (run_evaluate, {'plots': bool}),
+    'reprocess': (run_reprocess, {'full': bool})
+}
+
+def parse_options(kind, options):
+    """Validated keyword arguments for a job kind; ValueError for anything unknown"""
+    if kind not in JOB_KINDS:
+        raise ValueError(f'kind must be one of {list(JOB_KINDS)}')
+    if not isinstance(options or {}, dict):
+        raise ValueError('Job options must be a JSON object')
+    types = JOB_KINDS[kind][1]
+    parsed = {}
+    for name, value in (options or {}).items():
+        if name not in types:
+            raise ValueError(f'Unknown option {name} for {kind} jobs, expected one of {list(types)}')
+        if types[name] is bool:
+            if isinstance(value, str):
+                value = value.lower() in ('1', 'true', 'yes')
+            parsed[name] = bool(value)
+        else:
+            try:
+                parsed[name] = types[name](value)
+            except (TypeError, ValueError):
+                raise ValueError(f'Option {name} must be a {types[name].__name__}')
+    return parsed
+
+def _execute(job_id, job_dir):
+    """Job process body: run the job recorded under job_id and write its result or error"""
+    global _progress_path
+    _progress_path = os.path.join(job_dir, f'{job_id}.progress.json')
+    job = _read_json(os.path.join(job_dir, f'{job_id}.json'))
+    try:
+        os.nice(JOB_NICE)
+    except OSError:
+        pass
+    print(f"Starting {job['kind']} job {job_id} with {job['options']}")
+    try:
+        result = {'result': JOB_KINDS[job['kind']][0](**job['options'])}
+    except Exception as e:
+        traceback.print_exc()
+        result = {'error': f'{type(e).__name__}: {e}'}
+    _write_json(os.path.join(job_dir, f'{job_id}.result.json'), result)
+    print(f"Finished {job['kind']} job {job_id}")
+    return 'error' not in result
+
+class JobManager:
+    """
+    Runs retraining, evaluation and reprocessing jobs, at most workers at
+    a time, each in its own lower-priority Python process so a crash or a
+    heavy fit never touches the API process. A job's status, progress and
+    log are files under job_dir, so any API worker can answer a poll.
+    At most one job of each kind is queued or running at a time across
+    every process sharing job_dir, enforced with a lock file per kind, and
+    listeners are called with the job record after a job succeeds.
+    """
+
+    def __init__(self, job_dir=JOB_DIR, workers=JOB_WORKERS):
+        self.job_dir = job_dir
+        # Threads only wait on the job processes
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self.listeners = []
+        os.makedirs(job_dir, exist_ok=True)
+        self._mark_interrupted()
+
+    def _path(self, job_id, suffix='json'):
+        return os.path.join(self.job_dir, f'{job_id}.{suffix}')
+
+    def _claim(self, kind, job_id):
+        """
+        Lock the kind for one job; RuntimeError if another job holds it.
+        The job process inherits the lock, so it stays held until the job
+        ends even if this process dies first.
+        """
+        fd = os.open(os.path.join(self.job_dir, f'{kind}.lock'), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            holder = os.read(fd, 256).decode('utf-8', errors='replace').strip()
+            os.close(fd)
+            raise RuntimeError(f"A {kind} job is already queued or running: {holder or 'unknown'}")
+        os.ftruncate(fd, 0)
+        os.write(fd, job_id.encode('utf-8'))
+        return fd
+
+    def submit(self, kind, options=None):
+        """Queue a job; ValueError for bad options, RuntimeError if one of this kind is already active"""
+        options = parse_options(kind, options)
+        job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{uuid.uuid4().hex[:6]}"
+        lock = self._claim(kind, job_id)
+        job = {
+            'id': job_id,
+            'kind': kind,
+            'options': options,
+            'state': 'queued',
+            'submitted_at': time.time(),
+            'owner_pid': os.getpid()
+        }
+        try:
+            _write_json(self._path(job_id), job)
+            self.pool.submit(self._run, job, lock)
+        except BaseException:
+            os.close(lock)
+            raise
+        return self.status(job_id)
+
+    def _run(self, job, lock):
+        try:
+            job = self._execute(job, lock)
+        finally:
+            # Closing the descriptor releases the kind for the next job
+            os.close(lock)
+        if job['state'] != 'succeeded':
+            return
+        for listener in self.listeners:
+            try:
+                listener(job)
+            except Exception as e:
+                print(f"Warning: Job listener failed for {job['id']}: {str(e)}")
+
+    def _execute(self, job, lock):
+        """Run the job process and record how it ended"""
+        job = dict(job, state='running', started_at=time.time())
+        _write_json(self._path(job['id']), job)
+        try:
+            with open(self._path(job['id'], 'log'), 'ab') as log:
+                # Unbuffered, so polls see output as it is printed
+                process = subprocess.Popen([sys.executable, os.path.abspath(__file__), job['id'],
+                                            '--job-dir', self.job_dir],
+                                           stdout=log, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                                           env=dict(os.environ, PYTHONUNBUFFERED='1'), pass_fds=(lock,))
+                job['pid'] = process.pid
+                _write_json(self._path(job['id']), job)
+                returncode = process.wait()
+            self._finish(job, returncode)
+        except Exception as e:
+            job.update(state='failed', error=f'{type(e).__name__}: {e}')
+        job['finished_at'] = time.time()
+        _write_json(self._path(job['id']), job)
+        return job
+
+    def _finish(self, job, returncode=None):
+        """Set the final state from the job process's result file"""
+        outcome = _read_json(self._path(job['id'], 'result.json')) or {}
+        if returncode in (0, None) and outcome and 'error' not in outcome:
+            job.update(state='succeeded', result=outcome.get('result'))
+        else:
+            job.update(state='failed', error=outcome.get('error', f'Job process exited with {returncode}'))
+
+    def status(self, job_id, log_offset=None):
+        """Job record with progress and a piece of its log, or None for an unknown job"""
+        if os.path.basename(job_id) != job_id:
+            return None
+        job = _read_json(self._path(job_id))
+        if job is None:
+            return None
+        job['progress'] = _read_json(self._path(job_id, 'progress.json'))
+        if log_offset is not None:
+            job['log'], job['log_offset'] = self.read_log(job_id, log_offset)
+        return job
+
+    def read_log(self, job_id, offset=-1):
+        """(text, next offset) from offset, or the end of the log for offset -1"""
+        path = self._path(job_id, 'log')
+        if not os.path.exists(path):
+            return '', 0
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            start = max(size - JOB_LOG_CHUNK, 0) if offset < 0 else min(offset, size)
+            f.seek(start)
+            data = f.read(JOB_LOG_CHUNK)
+        return data.decode('utf-8', errors='replace'), start + len(data)
+
+    def list_jobs(self, limit=50):
+        """Most recent jobs first"""
+        ids = sorted((name[:-len('.json')] for name in os.listdir(self.job_dir)
+                      if name.endswith('.json') and name.count('.') == 1), reverse=True)
+        return [job for job in (self.status(job_id) for job_id in ids[:limit]) if job is not None]
+
+    def _mark_interrupted(self):
+        # Jobs whose API process went away will never be finished by anyone. A job process
+        # that outlived its API process still holds the lock and is left to run
+        for job in self.list_jobs(limit=None):
+            if job['state'] not in ACTIVE_STATES or _pid_alive(job.get('owner_pid', 0)) \
+                    or _pid_alive(job.get('pid', 0)):
+                continue
+            record = _read_json(self._path(job['id']))
+            if os.path.exists(self._path(job['id'], 'result.json')):
+                # It finished after its API process died
+                self._finish(record)
+            else:
+                record['state'] = 'interrupted'
+            record['finished_at'] = time.time()
+            _write_json(self._path(job['id']), record)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run one queued background job (started by the API)')
+    parser.add_argument('job_id', help='Job to run')
+    parser.add_argument('--job-dir', default=JOB_DIR, help='Directory holding the job records')
+    args = parser.parse_args()
+    sys.exit(0 if _execute(args.job_id, args.job_dir) else 1)
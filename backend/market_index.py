@@ -0,0 +1,219 @@
+import numpy as np
+import math
+import re
+from urllib.parse import unquote_plus
+
+from shared_table import NUMERIC_COLUMNS
+from compact_records import metric_values
+
+# Query parameters that are options rather than range filters
+SCREEN_OPTIONS = {'state', 'msa', 'sort', 'order', 'limit', 'offset'}
+
+MAX_LIMIT = 1000
+
+_CONDITION = re.compile(r'^\s*([a-z_]+)\s*(<=|>=|<|>|=)\s*(.*?)\s*$')
+
+def parse_screen_query(query_string):
+    """
+    Parse a raw query string such as
+    'price_to_rent<15&market_heat>70&investment_score>0.6&state=CA,TX&sort=market_heat&limit=20'.
+    Comparisons are read from the raw string because '<' and '>' are not
+    key=value pairs. Raises ValueError on unknown fields or bad values.
+    """
+    query = {'filters': [], 'states': None, 'msa': None, 'sort': 'ranking_score',
+             'descending': True, 'limit': 50, 'offset': 0}
+    for part in query_string.split('&'):
+        part = unquote_plus(part)
+        if not part.strip():
+            continue
+        match = _CONDITION.match(part)
+        if not match:
+            raise ValueError(f'Cannot parse condition {part!r}')
+        field, op, value = match.groups()
+        if field.startswith('_'):
+            continue  # e.g. _profile, handled by other hooks
+        if op == '=' and field in SCREEN_OPTIONS:
+            if field == 'state':
+                query['states'] = [state.strip().upper() for state in value.split(',') if state.strip()]
+            elif field == 'msa':
+                query['msa'] = value
+            elif field == 'sort':
+                query['sort'] = value
+            elif field == 'order':
+                if value not in ('asc', 'desc'):
+                    raise ValueError("order must be 'asc' or 'desc'")
+                query['descending'] = value == 'desc'
+            else:
+                query[field] = int(value)
+            continue
+        if field not in NUMERIC_COLUMNS:
+            raise ValueError(f'Unknown field {field!r}, expected one of {NUMERIC_COLUMNS}')
+        if op == '=':
+            raise ValueError(f'Use a range comparison (<, <=, >, >=) for {field}')
+        bound = float(value)
+        if not math.isfinite(bound):
+            # nan would match nothing and inf everything, neither is a useful bound
+            raise ValueError(f'Bound for {field} must be a finite number')
+        query['filters'].append((field, op, bound))
+    if query['sort'] not in NUMERIC_COLUMNS:
+        raise ValueError(f"Cannot sort by {query['sort']!r}, expected one of {NUMERIC_COLUMNS}")
+    if not 0 < query['limit'] <= MAX_LIMIT or query['offset'] < 0:
+        raise ValueError(f'limit must be between 1 and {MAX_LIMIT} and offset non-negative')
+    return query
+
+class MarketIndex:
+    """
+    Scored, columnar view of every ZIP code for one data and model version,
+    on top of a shared_table.SharedTable. Each numeric column comes with a
+    sorted copy and its row order, so a range filter is two binary searches
+    instead of a scan. The arrays are memory-mapped and shared by workers.
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.data_version = table.data_version
+        self.model_version = table.model_version
+        self.columns = {column: table.column(column) for column in NUMERIC_COLUMNS}
+        self.sorted_rows = {column: table.column(f'{column}.order') for column in NUMERIC_COLUMNS}
+        self.sorted_values = {column: table.column(f'{column}.sorted') for column in NUMERIC_COLUMNS}
+
+        # NaNs sort last, so only the first n_valid entries take part in range queries
+        self.n_valid = {column: int(np.count_nonzero(~np.isnan(values)))
+                        for column, values in self.sorted_values.items()}
+
+        # Row ids per state and per MSA (by region id and lower-cased name)
+        state_codes = table.column('state.codes')
+        self.states = table.column('state.values')
+        self.state_rows = {self.states[code].decode('utf-8'): rows
+                           for code, rows in self._group_rows(state_codes).items()}
+        self.msa_rows = {str(region_id): rows for region_id, rows in self._group_rows(table.column('region_id')).items()}
+        msa_names = table.column('msa_name.values')
+        for code, rows in self._group_rows(table.column('msa_name.codes')).items():
+            self.msa_rows[msa_names[code].decode('utf-8').lower()] = rows
+
+    def __len__(self):
+        return len(self.table)
+
+    @staticmethod
+    def _group_rows(keys):
+        order = np.argsort(keys, kind='stable')
+        unique, starts = np.unique(keys[order], return_index=True)
+        return dict(zip(unique.tolist(), np.split(order, starts[1:])))
+
+    def _cast(self, column, value):
+        # Compare in the column's own precision, so 14.99 matches a float32 14.99
+        return self.columns[column].dtype.type(value)
+
+    def range_rows(self, column, op, value):
+        """Row ids where `column op value`, from the sorted copy of the column"""
+        value = self._cast(column, value)
+        values = self.sorted_values[column]
+        n_valid = self.n_valid[column]
+        if op in ('<', '<='):
+            end = np.searchsorted(values[:n_valid], value, side='left' if op == '<' else 'right')
+            return self.sorted_rows[column][:end]
+        start = np.searchsorted(values[:n_valid], value, side='right' if op == '>' else 'left')
+        return self.sorted_rows[column][start:n_valid]
+
+    def percentile(self, column, value):
+        """Share of all ZIP codes with a strictly lower value, in percent"""
+        value = self._cast(column, value)
+        below = np.searchsorted(self.sorted_values[column][:self.n_valid[column]], value, side='left')
+        return float(below) / len(self) * 100
+
+    def nearby_zip_codes(self, zip_code, num_closest=3):
+        """Closest ZIP codes by numeric distance, from the sorted ZIP column"""
+        try:
+            target = int(zip_code)
+        except ValueError:
+            return []
+        zip_codes = self.table.column('zip_code')
+        order = self.table.column('zip_code.order')
+        position = int(np.searchsorted(zip_codes[order], target))
+        window = order[max(position - num_closest - 1, 0):position + num_closest + 1]
+        window = window[zip_codes[window] != target]
+        distances = np.abs(zip_codes[window].astype(np.int64) - target)
+        # Ties go to the row that comes first, like a stable sort over the whole table
+        closest = window[np.lexsort((window, distances))[:num_closest]]
+        return self.table.zip_codes(closest)
+
+    def row_for_zip(self, zip_code):
+        """Row id of a ZIP code, or None if it is not in the table"""
+        zip_codes = self.table.column('zip_code')
+        order = self.table.column('zip_code.order')
+        position = int(np.searchsorted(zip_codes[order], int(zip_code)))
+        if position < len(order) and zip_codes[order[position]] == int(zip_code):
+            return int(order[position])
+        return None
+
+    def contributions(self, row):
+        """Bias and per-feature contributions of both scores for one row"""
+        return {name: (float(self.table.column(f'{name}.bias')[0]), self.table.column(f'{name}.contributions')[row])
+                for name in ('investment_score', 'ranking_score')}
+
+    def _matches(self, rows, column, op, value):
+        values = self.columns[column][rows]
+        value = self._cast(column, value)
+        if op == '<':
+            return values < value
+        if op == '<=':
+            return values <= value
+        if op == '>':
+            return values > value
+        return values >= value
+
+    def screen(self, filters=(), states=None, msa=None, sort='ranking_score', descending=True, limit=50, offset=0):
+        """
+        Apply range filters plus optional state/MSA filters and return
+        (total matches, one page of sorted rows). The most selective
+        candidate set is used as the base and the rest are checked on it.
+        """
+        # (candidate rows, check applied to rows from another candidate set)
+        candidates = []
+        if states:
+            state_rows = [self.state_rows.get(state, np.empty(0, dtype=np.int64)) for state in states]
+            state_codes = self.table.column('state.codes')
+            wanted = [code for code, value in enumerate(self.states) if value.decode('utf-8') in states]
+            candidates.append((np.concatenate(state_rows), lambda rows: np.isin(state_codes[rows], wanted)))
+        if msa:
+            msa_rows = self.msa_rows.get(msa.lower(), np.empty(0, dtype=np.int64))
+            candidates.append((msa_rows, lambda rows: np.isin(rows, msa_rows)))
+        for column, op, value in filters:
+            candidates.append((self.range_rows(column, op, value),
+                               lambda rows, column=column, op=op, value=value: self._matches(rows, column, op, value)))
+        
+        if candidates:
+            candidates.sort(key=lambda candidate: len(candidate[0]))
+            rows = candidates[0][0]
+            for _, matches in candidates[1:]:
+                rows = rows[matches(rows)]
+        else:
+            rows = np.arange(len(self))
+
+        # Ties go to the lower ZIP code, so pages merged across shards come out in the same order
+        values = self.columns[sort][rows]
+        order = np.lexsort((self.table.column('zip_code')[rows], -values if descending else values))
+        page = rows[order[offset:offset + limit]]
+        return len(rows), page
+
+    def records(self, rows):
+        """JSON-ready rows, in the same shape as /api/recommendations"""
+        table = self.table
+        columns = {column: metric_values(column, values[rows]) for column, values in self.columns.items()}
+        zip_codes, cities, states = table.zip_codes(rows), table.strings('city', rows), table.strings('state', rows)
+        region_ids, msa_names = table.column('region_id')[rows].tolist(), table.strings('msa_name', rows)
+        return [{
+            'zip_code': zip_codes[i],
+            'city': cities[i],
+            'state': states[i],
+            'region_id': str(region_ids[i]),
+            'msa_name': msa_names[i],
+            'median_home_value': columns['median_home_value'][i],
+            'median_rent': columns['median_rent'][i],
+            'days_pending': columns['days_pending'][i],
+            'price_cuts_percent': columns['price_cuts_percent'][i],
+            'market_heat': columns['market_heat'][i],
+            'price_to_rent': columns['price_to_rent'][i],
+            'investment_score': columns['investment_score'][i],
+            'ranking_score': columns['ranking_score'][i]
+        } for i in range(len(rows))]
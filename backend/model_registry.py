@@ -0,0 +1,224 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from startup import LazyModule
+
+# Deferred so importing the registry does not pull in pandas/sklearn
+pd = LazyModule('pandas')
+np = LazyModule('numpy')
+joblib = LazyModule('joblib')
+
+MODEL_DIR = os.getenv('MODEL_DIR', 'model')
+
+# Artifact names stored in every version directory
+ARTIFACTS = {
+    'classifier': 'investment_classifier.joblib',
+    'ranker': 'zip_ranker.joblib',
+    'clf_scaler': 'classifier_scaler.joblib',
+    'rank_scaler': 'ranker_scaler.joblib',
+    'model_info': 'model_info.joblib'
+}
+
+def _sha256(path):
+    """Checksum a file in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def versions_dir(model_dir=None):
+    """Directory holding one subdirectory per published version"""
+    return os.path.join(model_dir or MODEL_DIR, 'versions')
+
+def list_versions(model_dir=None):
+    """List published versions, oldest first"""
+    path = versions_dir(model_dir)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path)
+                  if not name.endswith('.tmp')
+                  and os.path.exists(os.path.join(path, name, 'manifest.json')))
+
+def get_active_version(model_dir=None):
+    """Return the version named by the ACTIVE pointer, or the newest version"""
+    pointer = os.path.join(versions_dir(model_dir), 'ACTIVE')
+    if os.path.exists(pointer):
+        with open(pointer) as f:
+            return f.read().strip()
+    versions = list_versions(model_dir)
+    return versions[-1] if versions else None
+
+def set_active_version(version, model_dir=None):
+    """Point ACTIVE at a published version"""
+    if version not in list_versions(model_dir):
+        raise ValueError(f'Unknown model version {version}')
+    pointer = os.path.join(versions_dir(model_dir), 'ACTIVE')
+    # Per-process temp name, so concurrent writers never share a half-written file
+    tmp_path = f'{pointer}.tmp{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        f.write(version)
+    os.replace(tmp_path, pointer)
+
+def publish_version(artifacts, model_dir=None, version=None, activate=True):
+    """
+    Write a new versioned artifact directory with a checksum manifest.
+    Artifacts are dumped uncompressed so their arrays can be memory-mapped.
+    """
+    version = version or datetime.now().strftime('%Y%m%d-%H%M%S')
+    final_dir = os.path.join(versions_dir(model_dir), version)
+    if os.path.exists(final_dir):
+        raise ValueError(f'Model version {version} already exists')
+    tmp_dir = final_dir + '.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+
+    files = {}
+    for name, filename in ARTIFACTS.items():
+        path = os.path.join(tmp_dir, filename)
+        joblib.dump(artifacts[name], path)
+        files[filename] = _sha256(path)
+
+    manifest = {
+        'version': version,
+        'created_at': datetime.now().isoformat(),
+        'files': files
+    }
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    # The directory only becomes visible once every artifact is in place
+    os.replace(tmp_dir, final_dir)
+    if activate:
+        set_active_version(version, model_dir)
+    print(f"Published model version {version}")
+    return version
+
+class ModelBundle:
+    """One loaded, immutable set of models, scalers and model info"""
+
+    def __init__(self, version, classifier, ranker, clf_scaler, rank_scaler, model_info):
+        self.version = version
+        self.classifier = classifier
+        self.ranker = ranker
+        self.clf_scaler = clf_scaler
+        self.rank_scaler = rank_scaler
+        self.model_info = model_info
+        self.loaded_at = time.time()
+
+    @classmethod
+    def load(cls, version=None, model_dir=None):
+        """Load a published version after checking its manifest, or the legacy flat files"""
+        model_dir = model_dir or MODEL_DIR
+        if version is None or version == 'legacy':
+            path = model_dir
+            version = 'legacy'
+        else:
+            path = os.path.join(versions_dir(model_dir), version)
+            with open(os.path.join(path, 'manifest.json')) as f:
+                manifest = json.load(f)
+            for filename, checksum in manifest['files'].items():
+                if _sha256(os.path.join(path, filename)) != checksum:
+                    raise ValueError(f'Checksum mismatch for {filename} in model version {version}')
+
+        loaded = {name: joblib.load(os.path.join(path, filename), mmap_mode='r')
+                  for name, filename in ARTIFACTS.items()}
+        return cls(version, **loaded)
+
+    def warm(self):
+        """Run one prediction through every model so the first request is not slow"""
+        features = pd.DataFrame(np.zeros((1, len(self.model_info['feature_names']))),
+                                columns=self.model_info['feature_names'])
+        self.classifier.predict_proba(self.clf_scaler.transform(features))
+        self.ranker.predict(self.rank_scaler.transform(features))
+        return self
+
+class ModelRegistry:
+    """
+    Holds the active ModelBundle and swaps in new versions.
+    Requests read `active` once and keep that bundle for their whole
+    lifetime, so a swap never changes models under an in-flight request.
+    """
+
+    def __init__(self, model_dir=None):
+        self.model_dir = model_dir or MODEL_DIR
+        self.active = None
+        self.reload_status = {'state': 'idle'}
+        self._reload_lock = threading.Lock()
+        self._pointer_mtime = None
+        self._last_check = 0.0
+        # Called with the new bundle after every successful swap
+        self.listeners = []
+
+    def load_active(self):
+        """Synchronously load the active version (used at startup)"""
+        self._pointer_mtime = self._read_pointer_mtime()
+        version = get_active_version(self.model_dir) or 'legacy'
+        self.active = ModelBundle.load(version, self.model_dir).warm()
+        return self.active
+
+    def _read_pointer_mtime(self):
+        pointer = os.path.join(versions_dir(self.model_dir), 'ACTIVE')
+        return os.path.getmtime(pointer) if os.path.exists(pointer) else None
+
+    def check_for_update(self, interval=5.0):
+        """
+        Start a background reload if another process moved the ACTIVE pointer.
+        Lets an admin reload on one worker propagate to every worker.
+        """
+        now = time.time()
+        if now - self._last_check < interval:
+            return
+        self._last_check = now
+        pointer_mtime = self._read_pointer_mtime()
+        if pointer_mtime != self._pointer_mtime:
+            version = get_active_version(self.model_dir)
+            if not version or (self.active is not None and version == self.active.version):
+                self._pointer_mtime = pointer_mtime
+            else:
+                try:
+                    started = self.reload(version, activate=False)
+                except ValueError:
+                    # ACTIVE names a version this worker cannot see; do not retry until it moves
+                    started = True
+                # Only once a reload has started; a busy reload is retried on the next check
+                if started:
+                    self._pointer_mtime = pointer_mtime
+
+    def _reload(self, version, activate):
+        try:
+            bundle = ModelBundle.load(version, self.model_dir).warm()
+            if activate and version != 'legacy':
+                set_active_version(version, self.model_dir)
+                self._pointer_mtime = self._read_pointer_mtime()
+            # Single reference assignment, atomic with respect to readers
+            self.active = bundle
+            self.reload_status = {'state': 'done', 'version': version, 'finished_at': time.time()}
+            for listener in self.listeners:
+                listener(bundle)
+        except Exception as e:
+            self.reload_status = {'state': 'failed', 'version': version, 'error': str(e)}
+        finally:
+            self._reload_lock.release()
+
+    def reload(self, version=None, background=True, activate=True):
+        """
+        Load and warm a version, then swap it in.
+        activate also points ACTIVE at it (an admin reload); reloads that
+        only follow the pointer leave it alone, so a slow reload of an
+        older version cannot move every worker back.
+        Returns False if a reload is already in progress.
+        """
+        version = version or get_active_version(self.model_dir) or 'legacy'
+        if version != 'legacy' and version not in list_versions(self.model_dir):
+            raise ValueError(f'Unknown model version {version}')
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        self.reload_status = {'state': 'loading', 'version': version, 'started_at': time.time()}
+        if background:
+            threading.Thread(target=self._reload, args=(version, activate), daemon=True).start()
+        else:
+            self._reload(version, activate)
+        return True
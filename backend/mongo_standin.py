@@ -0,0 +1,207 @@
+import random
+import threading
+import time
+
+class InMemoryCollection:
+    """
+    Minimal in-process stand-in for a pymongo collection.
+    Supports the calls Database makes: equality and $in filters on
+    top-level fields, an {'_id': 0} style projection, inserts, deletes,
+    renames and single-field hash indexes so indexed lookups are not full
+    scans.
+    """
+
+    def __init__(self, database=None, name=None):
+        self.database = database
+        self.name = name
+        self.documents = []
+        self.indexes = {}
+
+    def _matches(self, document, filter):
+        return all(document.get(key) in value['$in'] if isinstance(value, dict) else document.get(key) == value
+                   for key, value in (filter or {}).items())
+
+    def _project(self, document, projection):
+        document = dict(document)
+        for key, include in (projection or {}).items():
+            if not include:
+                document.pop(key, None)
+        return document
+
+    def _candidates(self, filter):
+        for key, value in (filter or {}).items():
+            if key in self.indexes:
+                if isinstance(value, dict):
+                    return [document for item in value['$in'] for document in self.indexes[key].get(item, [])]
+                return self.indexes[key].get(value, [])
+        return self.documents
+
+    def _rebuild_indexes(self):
+        for key in self.indexes:
+            index = {}
+            for document in self.documents:
+                index.setdefault(document.get(key), []).append(document)
+            self.indexes[key] = index
+
+    def find(self, filter=None, projection=None, **kwargs):
+        return (self._project(document, projection)
+                for document in self._candidates(filter) if self._matches(document, filter))
+
+    def find_one(self, filter=None, projection=None, **kwargs):
+        return next(self.find(filter, projection), None)
+
+    def insert_many(self, documents):
+        for i, document in enumerate(documents, start=len(self.documents)):
+            document.setdefault('_id', i)
+            self.documents.append(document)
+        self._rebuild_indexes()
+
+    def delete_many(self, filter):
+        self.documents = [document for document in self.documents if not self._matches(document, filter)]
+        self._rebuild_indexes()
+
+    def rename(self, new_name, dropTarget=False):
+        # Collections are handles by name, as in pymongo: the target's handle sees the moved documents
+        target = self.database._collections.get(new_name)
+        if target is not None and target.documents and not dropTarget:
+            raise ValueError(f'Collection {new_name} already exists')
+        target = getattr(self.database, new_name)
+        target.documents, target.indexes = self.documents, self.indexes
+        self.documents, self.indexes = [], {}
+        del self.database._collections[self.name]
+
+    def create_index(self, keys, **kwargs):
+        # Only single-field indexes are used for lookups; compound ones are accepted and ignored
+        if isinstance(keys, str):
+            self.indexes[keys] = {}
+            self._rebuild_indexes()
+
+class InMemoryDatabase:
+    """Creates collections on first attribute access, like a pymongo database"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(self, name)
+        return self._collections[name]
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def command(self, command, **kwargs):
+        # Only the readiness ping is needed, e.g. client.admin.command('ping')
+        if command != 'ping':
+            raise NotImplementedError(f'Unsupported command {command}')
+        return {'ok': 1.0}
+
+class InMemoryClient:
+    """Drop-in for MongoClient when passed to Database(client=...)"""
+
+    def __init__(self):
+        self._databases = {}
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self._databases.setdefault(name, InMemoryDatabase())
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def close(self):
+        pass
+
+class Faults:
+    """
+    Faults applied to every collection call of a FaultInjectingClient:
+    fixed latency, a random share of calls failing like a dropped
+    connection, and hanging until released, as during a failover.
+    """
+
+    def __init__(self, seed=0):
+        self.latency = 0.0
+        self.failure_rate = 0.0
+        self.released = threading.Event()
+        self.released.set()
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def hang(self):
+        self.released.clear()
+
+    def release(self):
+        self.released.set()
+
+    def clear(self):
+        self.latency = 0.0
+        self.failure_rate = 0.0
+        self.release()
+
+    def apply(self, operation):
+        with self.lock:
+            self.calls += 1
+            fail = self.random.random() < self.failure_rate
+        self.released.wait()
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            raise ConnectionError(f'Injected failure in {operation}')
+
+class FaultInjectingCollection:
+    def __init__(self, collection, faults):
+        self._collection = collection
+        self._faults = faults
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+        def call(*args, **kwargs):
+            self._faults.apply(name)
+            return attr(*args, **kwargs)
+        return call
+
+class FaultInjectingDatabase:
+    def __init__(self, database, faults):
+        self._database = database
+        self._faults = faults
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return FaultInjectingCollection(getattr(self._database, name), self._faults)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def command(self, command, **kwargs):
+        self._faults.apply('command')
+        return self._database.command(command, **kwargs)
+
+class FaultInjectingClient:
+    """
+    Wraps a client (an InMemoryClient by default) so tests can make the
+    database slow, flaky or unresponsive: Database(client=FaultInjectingClient())
+    and then set client.faults.latency, .failure_rate or call .hang().
+    """
+
+    def __init__(self, client=None, faults=None):
+        self._client = client or InMemoryClient()
+        self.faults = faults or Faults()
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return FaultInjectingDatabase(getattr(self._client, name), self.faults)
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+    def close(self):
+        self.faults.release()
+        self._client.close()
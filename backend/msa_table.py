@@ -0,0 +1,86 @@
+import pandas as pd
+from database import Database
+from model_registry import ModelBundle, get_active_version
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+def summarize_msas(zip_df, scores):
+    """
+    Aggregate scored ZIP rows into one record per MSA, in the shape
+    /api/msi-analysis returns. The MSA features are the same for every
+    ZIP of an MSA, so the first row's values are taken.
+    """
+    df = zip_df[['region_id', 'msa_name'] + FEATURE_COLUMNS].copy()
+    df['investment_score'] = scores
+    grouped = df.groupby('region_id').agg(
+        msa_name=('msa_name', 'first'),
+        zip_count=('investment_score', 'size'),
+        investment_score=('investment_score', 'mean'),
+        min_investment_score=('investment_score', 'min'),
+        max_investment_score=('investment_score', 'max'),
+        price_to_rent=('price_to_rent', 'first'),
+        market_heat=('market_heat', 'first'),
+        days_pending=('days_pending', 'first'),
+        price_cuts_percent=('price_cuts_percent', 'first'),
+        median_home_value=('median_home_value', 'first'),
+        median_rent=('median_rent', 'first')
+    ).reset_index()
+
+    return [{
+        'msi_name': str(row.region_id),
+        'msa_name': row.msa_name,
+        'zip_count': int(row.zip_count),
+        'investment_score': float(row.investment_score),
+        'min_investment_score': float(row.min_investment_score),
+        'max_investment_score': float(row.max_investment_score),
+        'price_to_rent_ratio': float(row.price_to_rent),
+        'market_heat': float(row.market_heat),
+        'days_to_pending': float(row.days_pending),
+        'price_cuts_percent': float(row.price_cuts_percent),
+        'median_home_value': float(row.median_home_value),
+        'median_rent': float(row.median_rent)
+    } for row in grouped.itertuples(index=False)]
+
+def build_msa_table(zip_data, bundle):
+    """Score every ZIP code in one batch and aggregate per state and MSA"""
+    scores = bundle.classifier.predict_proba(bundle.clf_scaler.transform(zip_data[FEATURE_COLUMNS]))[:, 1]
+    scored = zip_data.assign(investment_score=scores)
+    return {state: summarize_msas(group, group['investment_score'].to_numpy())
+            for state, group in scored.groupby('state')}
+
+def refresh_msa_table(db=None, zip_data=None, bundle=None, states=None, keep_versions=False):
+    """
+    Rebuild the materialized MSA table for the active model version.
+    With states, only those states are rescored and replaced, as long as
+    the stored table holds this model version. With keep_versions (a
+    model switch on unchanged data) the version is added next to the
+    ones already stored instead of replacing them, so workers still on
+    an older version keep their rows.
+    """
+    if zip_data is None:
+        zip_data = pd.read_csv('data/processed_zip_data.csv', dtype={'zip_code': str})
+    if bundle is None:
+        bundle = ModelBundle.load(get_active_version() or 'legacy')
+    owns_db = db is None
+    if owns_db:
+        db = Database()
+    try:
+        if states is not None and bundle.version in db.get_msa_model_versions():
+            msa_table = build_msa_table(zip_data[zip_data['state'].isin(states)], bundle)
+            db.update_msa_table(msa_table, bundle.version, states)
+        elif keep_versions:
+            msa_table = build_msa_table(zip_data, bundle)
+            db.add_msa_version(msa_table, bundle.version)
+        else:
+            msa_table = build_msa_table(zip_data, bundle)
+            db.initialize_msa_table(msa_table, bundle.version)
+    finally:
+        if owns_db:
+            db.close()
+    return msa_table
+
+if __name__ == "__main__":
+    # Rebuilds every state for the active version; the API adds new versions itself on a switch
+    msa_table = refresh_msa_table()
+    print(f"Materialized {sum(len(rows) for rows in msa_table.values())} MSAs across {len(msa_table)} states")
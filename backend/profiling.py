@@ -0,0 +1,172 @@
+from flask import g, request
+import cProfile
+import io
+import itertools
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+# Profiling is off unless explicitly enabled for the deployment
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '0') == '1'
+# On-demand profiling (?_profile= or X-Profile) needs a matching X-Profile-Token header;
+# without a token only PROFILE_SAMPLE_EVERY sampling runs
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+# Profile one request in N automatically (0 = never) and keep the last K profiles
+PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', '0'))
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '20'))
+# Interval of the sampling profiler in seconds
+SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.001'))
+
+# 'file' writes a profile to PROFILE_DIR, the others return it in place of the response body
+PROFILE_MODES = ('file', 'summary', 'sample', 'sample-summary')
+
+_request_counter = itertools.count(1)
+
+class SamplingProfiler:
+    """
+    Low-overhead profiler that periodically records the call stack of one
+    thread from a background thread, instead of tracing every call.
+    """
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+                self.samples += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def folded(self):
+        """Stacks in the folded format read by flamegraph tools"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+    def summary(self, limit=25):
+        """Functions with the most samples at the top of the stack"""
+        own = Counter()
+        for stack, count in self.stacks.items():
+            own[stack.rsplit(';', 1)[-1]] += count
+        return [{'function': function, 'samples': count, 'share': count / max(self.samples, 1)}
+                for function, count in own.most_common(limit)]
+
+def _requested_mode():
+    """Return the profiling mode asked for by this request, if it is allowed and known"""
+    mode = request.args.get('_profile') or request.headers.get('X-Profile')
+    if mode is None or not PROFILE_TOKEN:
+        return None
+    if request.headers.get('X-Profile-Token') != PROFILE_TOKEN:
+        return None
+    return mode if mode in PROFILE_MODES else None
+
+def _prune(keep=PROFILE_KEEP):
+    """Keep only the newest K profiles"""
+    files = sorted((entry for entry in os.scandir(PROFILE_DIR) if entry.is_file()),
+                   key=lambda entry: entry.stat().st_mtime)
+    for entry in files[:-keep] if keep else files:
+        os.remove(entry.path)
+
+def _start_profile():
+    mode = _requested_mode()
+    if mode is None and PROFILE_SAMPLE_EVERY and next(_request_counter) % PROFILE_SAMPLE_EVERY == 0:
+        # Automatic profiles use the sampling profiler to keep overhead low
+        mode = 'sample'
+    if mode is None:
+        return
+    g.profile_mode = mode
+    g.profile_started = time.perf_counter()
+    if mode.startswith('sample'):
+        g.profiler = SamplingProfiler(threading.get_ident())
+        g.profiler.start()
+    else:
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+def _stop_profiler():
+    profiler = g.pop('profiler', None)
+    if profiler is None:
+        return None
+    if isinstance(profiler, SamplingProfiler):
+        profiler.stop()
+    else:
+        profiler.disable()
+    return profiler
+
+def _finish_profile(response):
+    profiler = _stop_profiler()
+    if profiler is None:
+        return response
+    mode = g.profile_mode
+    elapsed_ms = (time.perf_counter() - g.profile_started) * 1000
+
+    if mode.endswith('summary'):
+        # Swap in the summary for the endpoint's own body; status and headers such as
+        # X-Model-Version stay, apart from those that only describe the old body
+        if isinstance(profiler, SamplingProfiler):
+            summary = {'samples': profiler.samples, 'top_functions': profiler.summary()}
+        else:
+            text = io.StringIO()
+            pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(25)
+            summary = {'stats': text.getvalue()}
+        response.direct_passthrough = False
+        response.set_data(json.dumps({
+            'endpoint': request.endpoint,
+            'path': request.full_path,
+            'status': response.status_code,
+            'elapsed_ms': elapsed_ms,
+            'mode': 'sample' if isinstance(profiler, SamplingProfiler) else 'deterministic',
+            'profile': summary
+        }))
+        response.mimetype = 'application/json'
+        for header in ('Content-Range', 'Content-Disposition', 'Content-Encoding', 'ETag'):
+            response.headers.pop(header, None)
+        return response
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{request.endpoint or 'unmatched'}"
+    if isinstance(profiler, SamplingProfiler):
+        path = os.path.join(PROFILE_DIR, name + '.folded')
+        with open(path, 'w') as f:
+            f.write(profiler.folded())
+    else:
+        path = os.path.join(PROFILE_DIR, name + '.prof')
+        profiler.dump_stats(path)
+    _prune()
+    response.headers['X-Profile-File'] = path
+    return response
+
+def _teardown_profile(exc):
+    # Make sure a failed request never leaves a profiler running
+    _stop_profiler()
+
+def init_app(app):
+    """Register the profiling hooks on a Flask app when enabled"""
+    if PROFILING_ENABLED:
+        if not PROFILE_TOKEN:
+            app.logger.warning("PROFILE_TOKEN is not set: on-demand profiling is disabled, only sampling runs")
+        app.before_request(_start_profile)
+        app.after_request(_finish_profile)
+        app.teardown_request(_teardown_profile)
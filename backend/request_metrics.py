@@ -0,0 +1,146 @@
+from flask import g, request, has_request_context
+from contextlib import contextmanager
+import bisect
+import os
+import threading
+import time
+
+# Timing can be switched off entirely with REQUEST_TIMING=0
+ENABLED = os.getenv('REQUEST_TIMING', '1') != '0'
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+class Histogram:
+    """Fixed-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self):
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, seconds):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = {'buckets': [0] * (len(BUCKETS) + 1), 'sum': 0.0, 'count': 0}
+            series['buckets'][bisect.bisect_left(BUCKETS, seconds)] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {labels: {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']}
+                    for labels, series in self.series.items()}
+
+class Counter:
+    """Monotonic counter keyed by a tuple of label values"""
+
+    def __init__(self):
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.values)
+
+request_duration = Histogram()
+stage_duration = Histogram()
+requests_total = Counter()
+cache_lookups = Counter()
+
+@contextmanager
+def stage(name):
+    """Time one stage of the current request (no-op outside a request or when disabled)"""
+    if not ENABLED or not has_request_context():
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        g.setdefault('stage_timings', []).append((name, time.perf_counter() - started))
+
+def record_cache(cache, hit):
+    """Count a cache lookup for the hit-rate metrics"""
+    if ENABLED:
+        cache_lookups.inc((cache, 'hit' if hit else 'miss'))
+
+def _start_timer():
+    g.request_started = time.perf_counter()
+
+def _finish_timer(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    total = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    timings = g.get('stage_timings', [])
+
+    # Server-Timing lets browser dev tools show the breakdown per response
+    response.headers['Server-Timing'] = ', '.join(
+        [f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings] + [f'total;dur={total * 1000:.2f}']
+    )
+    request_duration.observe((endpoint,), total)
+    for name, seconds in timings:
+        stage_duration.observe((endpoint, name), seconds)
+    requests_total.inc((endpoint, str(response.status_code)))
+    return response
+
+def init_app(app):
+    """Register the per-request timers on a Flask app"""
+    if ENABLED:
+        app.before_request(_start_timer)
+        app.after_request(_finish_timer)
+
+def _escape(value):
+    # Label values are quoted, so backslashes, quotes and newlines have to be escaped
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+def _render_histogram(lines, metric, help_text, label_names, histogram):
+    lines.append(f'# HELP {metric} {help_text}')
+    lines.append(f'# TYPE {metric} histogram')
+    for labels, series in sorted(histogram.snapshot().items()):
+        label_text = _labels(label_names, labels)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ['+Inf'], series['buckets']):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{{label_text}}} {series["sum"]:.6f}')
+        lines.append(f'{metric}_count{{{label_text}}} {series["count"]}')
+
+def render_prometheus(model_version=None):
+    """Render all metrics for this process in the Prometheus text format"""
+    lines = []
+    _render_histogram(lines, 'capstone_request_duration_seconds', 'Request wall time by endpoint',
+                      ['endpoint'], request_duration)
+    _render_histogram(lines, 'capstone_stage_duration_seconds', 'Time spent in each request stage',
+                      ['endpoint', 'stage'], stage_duration)
+
+    lines.append('# HELP capstone_requests_total Requests by endpoint and status code')
+    lines.append('# TYPE capstone_requests_total counter')
+    for labels, value in sorted(requests_total.snapshot().items()):
+        lines.append(f'capstone_requests_total{{{_labels(["endpoint", "status"], labels)}}} {value}')
+
+    lookups = cache_lookups.snapshot()
+    lines.append('# HELP capstone_cache_lookups_total Cache lookups by cache and result')
+    lines.append('# TYPE capstone_cache_lookups_total counter')
+    for labels, value in sorted(lookups.items()):
+        lines.append(f'capstone_cache_lookups_total{{{_labels(["cache", "result"], labels)}}} {value}')
+    lines.append('# HELP capstone_cache_hit_ratio Share of cache lookups that were hits')
+    lines.append('# TYPE capstone_cache_hit_ratio gauge')
+    for cache in sorted({cache for cache, _ in lookups}):
+        hits, misses = lookups.get((cache, 'hit'), 0), lookups.get((cache, 'miss'), 0)
+        lines.append(f'capstone_cache_hit_ratio{{{_labels(["cache"], [cache])}}} {hits / (hits + misses):.4f}')
+
+    if model_version is not None:
+        lines.append('# HELP capstone_model_info Active model version')
+        lines.append('# TYPE capstone_model_info gauge')
+        lines.append(f'capstone_model_info{{{_labels(["version"], [model_version])}}} 1')
+    return '\n'.join(lines) + '\n'
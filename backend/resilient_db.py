@@ -0,0 +1,247 @@
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from startup import LazyModule
+
+pymongo = LazyModule('pymongo')
+
+# Time budget for one read, retries included, before falling back to the snapshot
+DB_DEADLINE = float(os.getenv('DB_DEADLINE_MS', '2000')) / 1000
+# Whole-collection reads feed index builds and get a longer budget
+DB_BULK_DEADLINE = float(os.getenv('DB_BULK_DEADLINE_MS', '30000')) / 1000
+# Retries of a failed read within its budget, with exponential backoff
+DB_RETRIES = int(os.getenv('DB_RETRIES', '2'))
+DB_RETRY_BACKOFF = float(os.getenv('DB_RETRY_BACKOFF_MS', '50')) / 1000
+# After a failed or late read, reads that have a snapshot skip the database for this long
+DB_COOLDOWN = float(os.getenv('DB_COOLDOWN_SECONDS', '5'))
+# Threads running database calls; calls stuck on a hung server hold one each
+DB_WORKERS = int(os.getenv('DB_WORKERS', '16'))
+# Optional on-disk copy of the snapshot, so a restart during an outage can still serve
+DB_SNAPSHOT_PATH = os.getenv('DB_SNAPSHOT_PATH')
+DB_SNAPSHOT_MAX_KEYS = int(os.getenv('DB_SNAPSHOT_MAX_KEYS', '50000'))
+DB_SNAPSHOT_FLUSH_INTERVAL = float(os.getenv('DB_SNAPSHOT_FLUSH_INTERVAL', '60'))
+
+BULK_READS = {'get_zip_data'}
+
+class DatabaseUnavailable(Exception):
+    """The database missed its deadline and there is no snapshot to fall back to"""
+
+def is_transient(error):
+    """Errors worth retrying or answering from the snapshot: timeouts and lost connections"""
+    if isinstance(error, (TimeoutError, OSError)):
+        return True
+    errors = pymongo.errors
+    return isinstance(error, (errors.ConnectionFailure, errors.ExecutionTimeout, errors.WTimeoutError))
+
+class ResilientDatabase:
+    """
+    Deadline-bounded reads over a Database. Each read runs on a small
+    thread pool and is given up on once its deadline passes; transient
+    errors are retried within the same budget. Every successful read is
+    kept as the last known good value, and when the database is late or
+    failing that value is returned instead, reported through on_stale
+    with its age, while the read keeps going (or is restarted) in the
+    background to refresh it. Identical reads in flight are shared.
+    Writes and everything else go straight to the wrapped Database.
+    """
+
+    def __init__(self, db, on_stale=None, deadline=DB_DEADLINE, bulk_deadline=DB_BULK_DEADLINE,
+                 retries=DB_RETRIES, backoff=DB_RETRY_BACKOFF, cooldown=DB_COOLDOWN,
+                 workers=DB_WORKERS, snapshot_path=DB_SNAPSHOT_PATH, max_keys=DB_SNAPSHOT_MAX_KEYS):
+        self.db = db
+        self.on_stale = on_stale
+        self.deadline = deadline
+        self.bulk_deadline = bulk_deadline
+        self.retries = retries
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.workers = workers
+        self.max_keys = max_keys
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mongo')
+        self.lock = threading.Lock()
+        self.inflight = {}
+        # (method, *args) -> (value, fetched_at), least recently used first
+        self.snapshot = OrderedDict()
+        self.unhealthy_until = 0.0
+        self.last_error = None
+        self.stale_reads = 0
+        self.snapshot_path = snapshot_path
+        self.dirty = False
+        if snapshot_path:
+            self._load_snapshot()
+            threading.Thread(target=self._flush_periodically, daemon=True).start()
+
+    def __getattr__(self, name):
+        # Writes, client and close go to the wrapped Database untouched
+        return getattr(self.db, name)
+
+    def get_data_version(self):
+        return self.read('get_data_version')
+
+    def get_states(self):
+        return self.read('get_states')
+
+    def get_state_records(self, state_code):
+        return self.read('get_state_records', state_code)
+
+    def get_zip_info(self, zip_code):
+        return self.read('get_zip_info', zip_code)
+
+    def get_msa_summary(self, state_code, model_version=None):
+        return self.read('get_msa_summary', state_code, model_version)
+
+    def get_zip_data(self):
+        return self.read('get_zip_data')
+
+    def read(self, name, *args):
+        """Fresh value within the deadline, else the snapshot, else DatabaseUnavailable"""
+        key = (name,) + args
+        cached = self._cached(key)
+        if cached is not None and time.monotonic() < self.unhealthy_until:
+            # The database is known to be struggling: answer now and refresh in the background
+            self._refresh(key)
+            return self._stale(cached)
+
+        budget = self.bulk_deadline if name in BULK_READS else self.deadline
+        try:
+            return self._fetch(key, time.monotonic() + budget)
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            self._mark_unhealthy(e)
+            if cached is None:
+                raise DatabaseUnavailable(f'Database unavailable for {name}: {str(e) or type(e).__name__}') from e
+            self._refresh(key)
+            return self._stale(cached)
+
+    def ping(self):
+        """
+        Check that the server answers. While it does not, a snapshot (for
+        instance one loaded from DB_SNAPSHOT_PATH after a restart) is enough
+        to serve from: the failure is recorded and False returned. Without
+        a snapshot the error is raised.
+        """
+        try:
+            self.db.client.admin.command('ping')
+            return True
+        except Exception as e:
+            if not is_transient(e):
+                raise
+            self._mark_unhealthy(e)
+            with self.lock:
+                has_snapshot = bool(self.snapshot)
+            if not has_snapshot:
+                raise
+            return False
+
+    def status(self):
+        """Health and snapshot counters for /ready"""
+        with self.lock:
+            return {
+                'healthy': time.monotonic() >= self.unhealthy_until,
+                'last_error': self.last_error,
+                'snapshot_keys': len(self.snapshot),
+                'inflight': len(self.inflight),
+                'stale_reads': self.stale_reads
+            }
+
+    def _fetch(self, key, deadline):
+        attempt = 0
+        while True:
+            future = self._submit(key)
+            try:
+                return future.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FutureTimeoutError:
+                # The call keeps running and refreshes the snapshot if it ever completes
+                raise TimeoutError(f'{key[0]} missed its deadline')
+            except Exception as e:
+                attempt += 1
+                delay = self.backoff * 2 ** (attempt - 1)
+                if not is_transient(e) or attempt > self.retries or time.monotonic() + delay >= deadline:
+                    raise
+                time.sleep(delay)
+
+    def _submit(self, key):
+        """Start the call for this key, or join the one already running"""
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.inflight[key] = self.pool.submit(self._call, key)
+            return future
+
+    def _call(self, key):
+        try:
+            value = getattr(self.db, key[0])(*key[1:])
+            self._store(key, value)
+            return value
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _refresh(self, key):
+        # Bounded, so a hung server cannot queue up a refresh for every key
+        with self.lock:
+            busy = key in self.inflight or len(self.inflight) >= self.workers
+        if not busy:
+            self._submit(key)
+
+    def _cached(self, key):
+        with self.lock:
+            entry = self.snapshot.get(key)
+            if entry is not None:
+                self.snapshot.move_to_end(key)
+            return entry
+
+    def _store(self, key, value):
+        with self.lock:
+            self.snapshot[key] = (value, time.time())
+            self.snapshot.move_to_end(key)
+            while len(self.snapshot) > self.max_keys:
+                self.snapshot.popitem(last=False)
+            self.unhealthy_until = 0.0
+            self.dirty = True
+
+    def _stale(self, entry):
+        value, fetched_at = entry
+        with self.lock:
+            self.stale_reads += 1
+        if self.on_stale is not None:
+            self.on_stale(time.time() - fetched_at)
+        return value
+
+    def _mark_unhealthy(self, error):
+        with self.lock:
+            self.unhealthy_until = time.monotonic() + self.cooldown
+            self.last_error = f'{type(error).__name__}: {error}'
+
+    def _load_snapshot(self):
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                self.snapshot = pickle.load(f)
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable database snapshot {self.snapshot_path}: {str(e)}")
+
+    def flush_snapshot(self):
+        """Write the snapshot to disk if it changed since the last flush"""
+        with self.lock:
+            if not self.dirty:
+                return
+            snapshot = OrderedDict(self.snapshot)
+            self.dirty = False
+        tmp_path = f'{self.snapshot_path}.tmp{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.snapshot_path)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(DB_SNAPSHOT_FLUSH_INTERVAL)
+            try:
+                self.flush_snapshot()
+            except Exception as e:
+                print(f"Warning: Failed to write database snapshot: {str(e)}")
@@ -0,0 +1,271 @@
+from flask import Flask, Response, jsonify, request
+import argparse
+import csv
+import itertools
+import os
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+import requests
+from sharding import ShardMap, parse_pins, SHARD_PINS
+
+# One entry per shard separated by ';', replicas of a shard separated by ','
+# e.g. 'http://10.0.0.1:5000,http://10.0.0.2:5000;http://10.0.0.3:5000'
+SHARD_BACKENDS = os.getenv('SHARD_BACKENDS', '')
+# Seconds to wait for a shard before trying the next replica
+ROUTER_TIMEOUT = float(os.getenv('ROUTER_TIMEOUT', '30'))
+# ZIP -> state lookup, so ZIP endpoints go to the shard that owns the ZIP's state
+ROUTER_ZIP_DATA = os.getenv('ROUTER_ZIP_DATA', 'data/processed_zip_data.csv')
+# Bytes relayed at a time, so large responses such as exports never sit whole in the router
+ROUTER_CHUNK = int(os.getenv('ROUTER_CHUNK', '65536'))
+
+# Headers that describe one connection or an encoding requests already undid
+HOP_BY_HOP = {'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'te', 'trailers',
+              'transfer-encoding', 'upgrade', 'content-encoding', 'content-length', 'host'}
+
+def parse_backends(text):
+    """'a,b;c' -> [['a', 'b'], ['c']]"""
+    return [[url.strip().rstrip('/') for url in shard.split(',') if url.strip()]
+            for shard in text.split(';') if shard.strip()]
+
+def load_zip_states(path=ROUTER_ZIP_DATA):
+    """ZIP code -> state from the processed data, or empty if it is not available"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, newline='') as f:
+        return {row['zip_code'].zfill(5): row['state'] for row in csv.DictReader(f)}
+
+class Router:
+    """
+    Forwards API requests to the shard that owns them: state endpoints by
+    the shard map, ZIP endpoints by the ZIP's state. Replicas of a shard
+    are used round-robin and skipped when unreachable. National queries
+    are sent to every shard and merged.
+    """
+
+    def __init__(self, backends, shard_map, zip_states=None, timeout=ROUTER_TIMEOUT):
+        if len(backends) != shard_map.shard_count:
+            raise ValueError(f'{len(backends)} backend groups for {shard_map.shard_count} shards')
+        self.backends = backends
+        self.shard_map = shard_map
+        self.zip_states = zip_states or {}
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.next_replica = [0] * len(backends)
+        self.next_shard = itertools.count()
+        self.local = threading.local()
+        self.pool = ThreadPoolExecutor(max_workers=max(4, 2 * len(backends)), thread_name_prefix='scatter')
+
+    def session(self):
+        # requests sessions are not thread-safe; one per thread keeps connections pooled
+        if not hasattr(self.local, 'session'):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def shard_for_zip(self, zip_code):
+        zip_code = str(zip_code).zfill(5)
+        state = self.zip_states.get(zip_code)
+        return self.shard_map.shard_for_state(state) if state else self.shard_map.shard_for_key(zip_code)
+
+    def any_shard(self):
+        """Round-robin over shards for requests every shard can answer"""
+        return next(self.next_shard) % len(self.backends)
+
+    def replicas(self, shard):
+        """Replicas of a shard, starting with the next one in round-robin order"""
+        urls = self.backends[shard]
+        with self.lock:
+            start = self.next_replica[shard]
+            self.next_replica[shard] = (start + 1) % len(urls)
+        return urls[start:] + urls[:start]
+
+    def forward(self, shard, method, path, query_string='', headers=None, body=None, stream=False):
+        """Send a request to one replica of a shard, failing over to the others"""
+        error = None
+        for url in self.replicas(shard):
+            try:
+                return self.session().request(method, f"{url}{path}{'?' + query_string if query_string else ''}",
+                                              headers=headers, data=body, timeout=self.timeout, stream=stream)
+            except requests.RequestException as e:
+                error = e
+        raise ConnectionError(f'No replica of shard {shard} answered: {str(error)}')
+
+    def scatter(self, method, path, query_string='', headers=None, body=None, every_replica=False):
+        """The same request to every shard (or every replica) at once; failed calls come back as exceptions"""
+        def call(target):
+            try:
+                if every_replica:
+                    return self.session().request(method, f"{target}{path}{'?' + query_string if query_string else ''}",
+                                                  headers=headers, data=body, timeout=self.timeout)
+                return self.forward(target, method, path, query_string, headers, body)
+            except Exception as e:
+                return e
+        targets = [url for urls in self.backends for url in urls] if every_replica else range(len(self.backends))
+        return list(self.pool.map(call, targets))
+
+def to_flask(upstream, chunk_size=ROUTER_CHUNK):
+    """Flask response passing the upstream body through chunk by chunk"""
+    # requests undoes any Content-Encoding, so the upstream length only holds for unencoded bodies
+    dropped = HOP_BY_HOP if 'content-encoding' in upstream.headers else HOP_BY_HOP - {'content-length'}
+    headers = [(name, value) for name, value in upstream.headers.items() if name.lower() not in dropped]
+
+    def body():
+        try:
+            yield from upstream.iter_content(chunk_size)
+        finally:
+            # Hands the connection back to the pool, or drops it if the client left early
+            upstream.close()
+    return Response(body(), status=upstream.status_code, headers=headers)
+
+def merge_screens(bodies, offset, limit):
+    """
+    Merge per-shard screen pages (each sorted, each holding that shard's
+    first offset + limit rows) into the requested page, ordered like
+    MarketIndex.screen: by the sort field, ties by ZIP code.
+    """
+    query = dict(bodies[0]['query'])
+    sign = -1 if query['descending'] else 1
+    rows = [row for body in bodies for row in body['results']]
+    rows.sort(key=lambda row: (sign * row[query['sort']], row['zip_code']))
+    return {
+        'total': sum(body['total'] for body in bodies),
+        'results': rows[offset:offset + limit],
+        'query': query,
+        'data_version': bodies[0]['data_version'],
+        'model_version': bodies[0]['model_version']
+    }
+
+def create_app(router):
+    app = Flask(__name__)
+
+    def relay(shard):
+        try:
+            upstream = router.forward(shard, request.method, request.path, request.query_string.decode('utf-8'),
+                                      {name: value for name, value in request.headers if name.lower() not in HOP_BY_HOP},
+                                      request.get_data(), stream=True)
+        except ConnectionError as e:
+            return jsonify({'error': str(e), 'shard': shard}), 502
+        response = to_flask(upstream)
+        response.headers['X-Shard'] = str(shard)
+        return response
+
+    @app.route('/api/recommendations/<state_code>', methods=['GET'])
+    @app.route('/api/msi-analysis/<state_code>', methods=['GET'])
+    def state_route(state_code):
+        return relay(router.shard_map.shard_for_state(state_code))
+
+    @app.route('/api/analysis/<zip_code>', methods=['GET'])
+    @app.route('/api/analysis/<zip_code>/sensitivity', methods=['GET'])
+    @app.route('/api/history/<zip_code>', methods=['GET'])
+    def zip_route(zip_code):
+        return relay(router.shard_for_zip(zip_code))
+
+    @app.route('/api/screen', methods=['GET'])
+    def screen():
+        # Each shard screens its own states and returns its first offset + limit rows
+        query_string = request.query_string.decode('utf-8')
+        responses = router.scatter('GET', '/api/screen', f"{query_string}&_scatter=1" if query_string else '_scatter=1')
+        for shard, upstream in enumerate(responses):
+            if isinstance(upstream, Exception):
+                return jsonify({'error': str(upstream), 'shard': shard}), 502
+            if upstream.status_code != 200:
+                return to_flask(upstream)
+        # The shards validated limit and offset already
+        params = parse_qs(query_string)
+        offset = int(params.get('offset', ['0'])[0])
+        limit = int(params.get('limit', ['50'])[0])
+        return jsonify(merge_screens([upstream.json() for upstream in responses], offset, limit))
+
+    @app.route('/api/admin/models', methods=['POST'])
+    def reload_models():
+        # Every replica of every shard switches models
+        responses = router.scatter('POST', '/api/admin/models', request.query_string.decode('utf-8'),
+                                   {name: value for name, value in request.headers if name.lower() not in HOP_BY_HOP},
+                                   request.get_data(), every_replica=True)
+        replicas = [url for urls in router.backends for url in urls]
+        results = {url: ({'error': str(upstream)} if isinstance(upstream, Exception) else
+                         {'status': upstream.status_code, 'body': upstream.text})
+                   for url, upstream in zip(replicas, responses)}
+        statuses = [result.get('status', 502) for result in results.values()]
+        status = 202 if all(code == 202 for code in statuses) else max(statuses)
+        return jsonify({'replicas': results}), status
+
+    @app.route('/api/admin/jobs', methods=['GET', 'POST'])
+    @app.route('/api/admin/jobs/<job_id>', methods=['GET'])
+    def jobs_route(job_id=None):
+        # Job records and logs live with the shard that ran the job; shards pick up
+        # its new model from the ACTIVE pointer and new data from the data version
+        return relay(0)
+
+    @app.route('/ready')
+    def ready():
+        responses = router.scatter('GET', '/ready', every_replica=True)
+        replicas = [url for urls in router.backends for url in urls]
+        ready = {url: not isinstance(upstream, Exception) and upstream.status_code == 200
+                 for url, upstream in zip(replicas, responses)}
+        return jsonify({'ready': all(ready.values()), 'replicas': ready}), 200 if all(ready.values()) else 503
+
+    @app.route('/health')
+    def health():
+        return jsonify({'status': 'healthy', 'shards': len(router.backends)}), 200
+
+    @app.route('/shards')
+    def shards():
+        """Shard map, the states each shard owns and its replicas"""
+        states = sorted(set(router.zip_states.values()))
+        return jsonify({**router.shard_map.as_dict(states), 'backends': router.backends})
+
+    @app.route('/', defaults={'path': ''}, methods=['GET', 'POST'])
+    @app.route('/<path:path>', methods=['GET', 'POST'])
+    def any_route(path):
+        # Search, model evaluation, docs and the rest can be answered by any shard
+        return relay(router.any_shard())
+
+    return app
+
+def spawn_shards(shards, replicas, base_port, pins):
+    """Start replicas x shards local API processes; returns (processes, backends)"""
+    processes, backends = [], []
+    for shard in range(shards):
+        urls = []
+        for replica in range(replicas):
+            port = base_port + shard * replicas + replica
+            env = dict(os.environ, SHARD_COUNT=str(shards), SHARD_ID=str(shard), SHARD_PINS=pins,
+                       PORT=str(port), FLASK_DEBUG='0')
+            processes.append(subprocess.Popen([sys.executable, 'app.py'], env=env))
+            urls.append(f'http://127.0.0.1:{port}')
+        backends.append(urls)
+    return processes, backends
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Route API requests across state shards')
+    parser.add_argument('--shards', type=int, default=None, help='Start this many local shard processes')
+    parser.add_argument('--replicas', type=int, default=1, help='Local processes per shard')
+    parser.add_argument('--base-port', type=int, default=5001, help='Port of the first local shard')
+    parser.add_argument('--pins', default=SHARD_PINS, help="States pinned to shards, e.g. 'CA=0,FL=1'")
+    parser.add_argument('--backends', default=SHARD_BACKENDS, help="Existing shards, e.g. 'http://a:5000;http://b:5000'")
+    parser.add_argument('--port', type=int, default=5000, help='Router port')
+    args = parser.parse_args()
+
+    processes = []
+    if args.shards:
+        processes, backends = spawn_shards(args.shards, args.replicas, args.base_port, args.pins)
+    else:
+        backends = parse_backends(args.backends)
+    if not backends:
+        parser.error('Give --shards to start local shards or --backends / SHARD_BACKENDS')
+
+    router = Router(backends, ShardMap(len(backends), parse_pins(args.pins)), load_zip_states())
+    print(f"Routing {len(backends)} shards: {router.shard_map.as_dict(sorted(set(router.zip_states.values())))}")
+    try:
+        create_app(router).run(host='0.0.0.0', port=args.port, threaded=True)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
@@ -0,0 +1,100 @@
+import numpy as np
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from data_preprocessing import normalize_city_name
+
+MAX_RESULTS = 50
+
+# Entries matched on a later word (e.g. 'worth' in 'dallas fort worth tx') rank below full-name matches
+WORD_MATCH_WEIGHT = 0.5
+
+def normalize_query(text):
+    """Normalize typed text the same way the indexed names are"""
+    text = text.strip()
+    if text.isdigit():
+        return text
+    return normalize_city_name(text.replace('-', ' ').replace(',', ' '))
+
+class SearchIndex:
+    """
+    Prefix index over ZIP codes, city names and MSA names for typeahead.
+    Keys are kept in one sorted list, so a prefix is a contiguous range
+    found with two binary searches; ranking within the range is vectorized.
+    """
+
+    def __init__(self, zip_df, data_version=None):
+        self.data_version = data_version
+        self.entities = []
+        entries = []  # (key, entity id, weight)
+
+        for row in zip_df[['zip_code', 'city', 'state', 'msa_name']].itertuples(index=False):
+            entity = len(self.entities)
+            self.entities.append({'type': 'zip', 'label': f'{row.zip_code} ({row.city}, {row.state})',
+                                  'zip_code': row.zip_code, 'city': row.city, 'state': row.state,
+                                  'msa_name': row.msa_name})
+            entries.append((row.zip_code, entity, 1.0))
+
+        # One entity per city and state, weighted by how many ZIP codes it covers
+        cities = zip_df.assign(normalized_city=zip_df['city'].map(normalize_city_name))
+        for (normalized, state), group in cities.groupby(['normalized_city', 'state']):
+            if not normalized:
+                continue
+            entity = len(self.entities)
+            city = group['city'].iloc[0]
+            self.entities.append({'type': 'city', 'label': f'{city}, {state}', 'city': city,
+                                  'state': state, 'zip_count': len(group)})
+            self._add_words(entries, normalized, entity, len(group))
+
+        for (region_id, msa_name), group in zip_df.groupby(['region_id', 'msa_name']):
+            entity = len(self.entities)
+            self.entities.append({'type': 'msa', 'label': msa_name, 'msa_name': msa_name,
+                                  'region_id': str(region_id), 'states': sorted(group['state'].unique().tolist()),
+                                  'zip_count': len(group)})
+            self._add_words(entries, normalize_query(msa_name), entity, len(group))
+
+        entries.sort(key=lambda entry: entry[0])
+        self.keys = [key for key, _, _ in entries]
+        self.entity_ids = np.array([entity for _, entity, _ in entries], dtype=np.int64)
+        self.weights = np.array([weight for _, _, weight in entries], dtype=np.float64)
+        self.exact_bonus = self.weights.max() + 1 if len(entries) else 1.0
+        self.search = lru_cache(maxsize=4096)(self._search)
+
+    @staticmethod
+    def _add_words(entries, normalized, entity, weight):
+        """Index the full name and every later word start, so 'worth' finds 'Dallas-Fort Worth'"""
+        words = normalized.split()
+        entries.append((normalized, entity, float(weight)))
+        for i in range(1, len(words)):
+            entries.append((' '.join(words[i:]), entity, weight * WORD_MATCH_WEIGHT))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _search(self, query, limit=10):
+        """Ranked suggestions: exact matches first, then by weight (ZIP coverage)"""
+        prefix = normalize_query(query)
+        if not prefix:
+            return []
+        start = bisect_left(self.keys, prefix)
+        end = bisect_left(self.keys, prefix + '\uffff', lo=start)
+        if start == end:
+            return []
+        exact_end = bisect_right(self.keys, prefix, lo=start, hi=end)
+
+        # Exact matches sort first; keys only appear once per entity name, so over-fetch to dedupe
+        scores = self.weights[start:end].copy()
+        scores[:exact_end - start] += self.exact_bonus
+        # Weights differ by at least 0.5, so this only breaks ties, in key order (ZIP codes ascending)
+        scores -= np.arange(len(scores)) * (0.25 / len(scores))
+        take = min(len(scores), limit * 4)
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.argsort(-scores[top])]
+
+        results, seen = [], set()
+        for entity in self.entity_ids[start:end][top]:
+            if entity not in seen:
+                seen.add(entity)
+                results.append(self.entities[entity])
+                if len(results) == limit:
+                    break
+        return results
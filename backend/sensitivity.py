@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+
+# price_to_rent is derived from home value and rent, so it is recomputed rather than varied
+VARIABLE_FEATURES = ['median_home_value', 'median_rent', 'days_pending', 'price_cuts_percent', 'market_heat']
+
+MAX_STEPS = 101
+
+def parse_axis(text):
+    """
+    Parse one grid axis given as percent changes, either a range
+    'median_rent:-10:10:5' (start:stop:steps) or a list 'days_pending:-20,-10,0'.
+    Returns (feature, array of fractional changes).
+    """
+    feature, _, spec = text.partition(':')
+    if feature not in VARIABLE_FEATURES:
+        raise ValueError(f'Cannot vary {feature!r}, expected one of {VARIABLE_FEATURES}')
+    parts = spec.split(':')
+    try:
+        if len(parts) == 3:
+            start, stop, steps = float(parts[0]), float(parts[1]), int(parts[2])
+            if not 1 <= steps <= MAX_STEPS:
+                raise ValueError(f'steps must be between 1 and {MAX_STEPS}')
+            changes = np.linspace(start, stop, steps)
+        elif len(parts) == 1 and parts[0]:
+            changes = np.array([float(value) for value in parts[0].split(',')])
+        else:
+            raise ValueError
+    except ValueError as e:
+        raise ValueError(f"Bad axis {text!r}, expected 'feature:start:stop:steps' or 'feature:v1,v2,...' "
+                         f"in percent{': ' + str(e) if str(e) else ''}")
+    if not np.all(np.isfinite(changes)):
+        raise ValueError('Changes must be finite numbers')
+    if len(changes) > MAX_STEPS:
+        raise ValueError(f'At most {MAX_STEPS} values per axis')
+    if np.any(changes <= -100):
+        raise ValueError('Changes must be above -100%')
+    return feature, changes / 100
+
+def build_grid(base, axes):
+    """
+    Feature rows for every combination of axis changes (first axis varies
+    slowest), with price_to_rent recomputed the way preprocessing does.
+    """
+    mesh = np.meshgrid(*[changes for _, changes in axes], indexing='ij')
+    grid = pd.DataFrame({column: np.full(mesh[0].size, float(base[column])) for column in FEATURE_COLUMNS})
+    for (feature, _), changes in zip(axes, mesh):
+        grid[feature] = grid[feature] * (1 + changes.ravel())
+    grid['price_to_rent'] = (grid['median_home_value'] / (grid['median_rent'] * 12)).round(2)
+    return grid
+
+def score_grid(bundle, grid):
+    """Score every grid point in one batch through both scalers and models"""
+    investment = bundle.classifier.predict_proba(bundle.clf_scaler.transform(grid))[:, 1]
+    ranking = bundle.ranker.predict(bundle.rank_scaler.transform(grid))
+    return investment, ranking
+
+def response_surface(base, axes, bundle):
+    """
+    Baseline scores for the stored features plus scores and derived
+    price_to_rent shaped like the grid (nested lists for two axes).
+    The baseline row rides along in the same batch as the grid.
+    """
+    grid = build_grid(base, axes)
+    baseline = pd.DataFrame([{column: float(base[column]) for column in FEATURE_COLUMNS}])
+    investment, ranking = score_grid(bundle, pd.concat([baseline, grid], ignore_index=True))
+    shape = tuple(len(changes) for _, changes in axes)
+    return {
+        'investment_score': float(investment[0]),
+        'ranking_score': float(ranking[0])
+    }, {
+        'axes': [{
+            'feature': feature,
+            'changes_percent': (changes * 100).round(6).tolist(),
+            'values': (float(base[feature]) * (1 + changes)).tolist()
+        } for feature, changes in axes],
+        'investment_score': investment[1:].reshape(shape).tolist(),
+        'ranking_score': ranking[1:].reshape(shape).tolist(),
+        'price_to_rent': grid['price_to_rent'].to_numpy().reshape(shape).tolist()
+    }
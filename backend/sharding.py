@@ -0,0 +1,67 @@
+import os
+import zlib
+
+# Optional state-sharded mode: SHARD_COUNT processes (or groups of replicas), each
+# owning the states the shard map gives it. Unset means every process serves every state.
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '0'))
+SHARD_ID = int(os.getenv('SHARD_ID', '0'))
+# Hot states pinned to their own shards, e.g. 'CA=0,FL=1'
+SHARD_PINS = os.getenv('SHARD_PINS', '')
+# Deepest offset + limit a screen can page to when it is merged across shards
+SCATTER_WINDOW = int(os.getenv('SCATTER_WINDOW', '10000'))
+
+def parse_pins(text):
+    """'CA=0,FL=1' -> {'CA': 0, 'FL': 1}"""
+    pins = {}
+    for part in text.split(','):
+        if not part.strip():
+            continue
+        state, _, shard = part.partition('=')
+        pins[state.strip().upper()] = int(shard)
+    return pins
+
+class ShardMap:
+    """
+    Deterministic state -> shard assignment shared by the router and the
+    shards. Pinned states go to their shard; every other state is hashed
+    (crc32, stable across processes and Python versions) over the shards
+    nothing is pinned to, so a pinned hot state gets a shard to itself.
+    """
+
+    def __init__(self, shard_count, pins=None):
+        if shard_count < 1:
+            raise ValueError('shard_count must be at least 1')
+        self.shard_count = shard_count
+        self.pins = {state.upper(): shard for state, shard in (pins or {}).items()}
+        for state, shard in self.pins.items():
+            if not 0 <= shard < shard_count:
+                raise ValueError(f'{state} is pinned to shard {shard}, expected 0..{shard_count - 1}')
+        pinned = set(self.pins.values())
+        self.hash_shards = [shard for shard in range(shard_count) if shard not in pinned] or list(range(shard_count))
+
+    def shard_for_state(self, state):
+        state = state.upper()
+        if state in self.pins:
+            return self.pins[state]
+        return self.hash_shards[zlib.crc32(state.encode('utf-8')) % len(self.hash_shards)]
+
+    def shard_for_key(self, key):
+        """Shard for keys without a known state, e.g. an unknown ZIP code"""
+        return zlib.crc32(str(key).encode('utf-8')) % self.shard_count
+
+    def states_for(self, shard, states):
+        """The given states that belong to a shard"""
+        return [state for state in states if self.shard_for_state(state) == shard]
+
+    def as_dict(self, states=()):
+        return {
+            'shard_count': self.shard_count,
+            'pins': self.pins,
+            'states': {shard: self.states_for(shard, states) for shard in range(self.shard_count)}
+        }
+
+def shard_map_from_env():
+    """The shard map this process was started with, or None when not sharded"""
+    if SHARD_COUNT <= 0:
+        return None
+    return ShardMap(SHARD_COUNT, parse_pins(SHARD_PINS))
@@ -0,0 +1,177 @@
+import numpy as np
+import pandas as pd
+import errno
+import fcntl
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+from feature_store import _save_array
+from model_registry import MODEL_DIR, ARTIFACTS
+from compact_records import metric_dtype
+from contributions import explain
+
+FEATURE_COLUMNS = ['median_home_value', 'median_rent', 'days_pending',
+                   'price_cuts_percent', 'market_heat', 'price_to_rent']
+SCORE_COLUMNS = ['investment_score', 'ranking_score']
+NUMERIC_COLUMNS = FEATURE_COLUMNS + SCORE_COLUMNS
+
+# Repeated strings are stored once in a dictionary and referenced by integer codes
+STRING_COLUMNS = ['city', 'state', 'msa_name']
+
+# /dev/shm keeps the arrays in shared memory; any directory works, the page cache is shared either way
+SHARED_TABLE_DIR = os.getenv('SHARED_TABLE_DIR',
+                             '/dev/shm/capstone_tables' if os.path.isdir('/dev/shm') else 'data/shared_tables')
+# Used instead when SHARED_TABLE_DIR runs out of space (Docker's default /dev/shm is only 64MB)
+SHARED_TABLE_FALLBACK_DIR = os.getenv('SHARED_TABLE_FALLBACK_DIR', 'data/shared_tables')
+# Published tables kept on disk; older ones stay usable by processes that already mapped them
+SHARED_TABLE_KEEP = int(os.getenv('SHARED_TABLE_KEEP', '3'))
+# Seconds a new table is safe from pruning, so workers still attaching to it can map it first
+SHARED_TABLE_MIN_AGE = float(os.getenv('SHARED_TABLE_MIN_AGE', '300'))
+
+def content_version(zip_df):
+    """Version for databases without a stamped data version, from a hash of the rows"""
+    return 'content-' + format(int(pd.util.hash_pandas_object(zip_df, index=False).sum()) & (2**64 - 1), 'x')
+
+def model_key(bundle, model_dir=None):
+    """Model part of the table name; legacy flat files are told apart by their modification time"""
+    if bundle.version != 'legacy':
+        return bundle.version
+    classifier_path = os.path.join(model_dir or MODEL_DIR, ARTIFACTS['classifier'])
+    return f'legacy-{int(os.path.getmtime(classifier_path))}'
+
+def table_name(data_version, model_version):
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', f'{data_version}__{model_version}')
+
+def encode_strings(values):
+    """Dictionary-encode strings into (int32 codes, fixed-width UTF-8 dictionary)"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).fillna(''), sort=True)
+    dictionary = np.array([str(value).encode('utf-8') for value in uniques], dtype=bytes)
+    return codes.astype(np.int32), dictionary
+
+def build_table_arrays(zip_df, bundle):
+    """Score every ZIP code and lay the table out as flat arrays"""
+    features = zip_df[FEATURE_COLUMNS]
+    # float32 where the stored decimals allow (see compact_records.COLUMN_DECIMALS)
+    arrays = {column: features[column].to_numpy(dtype=metric_dtype(column)) for column in FEATURE_COLUMNS}
+    # Scores stay float64 so screened and served scores match the model output exactly
+    arrays['investment_score'] = bundle.classifier.predict_proba(bundle.clf_scaler.transform(features))[:, 1]
+    arrays['ranking_score'] = bundle.ranker.predict(bundle.rank_scaler.transform(features))
+
+    # Per-feature tree-path contributions of both scores, cached with the table
+    for name, (bias, contributions) in explain(bundle, zip_df).items():
+        arrays[f'{name}.bias'] = np.array([bias])
+        arrays[f'{name}.contributions'] = contributions
+
+    # Sorted copies and their row order back range filters and percentiles
+    for column in NUMERIC_COLUMNS:
+        order = np.argsort(arrays[column], kind='stable')
+        arrays[f'{column}.order'] = order
+        arrays[f'{column}.sorted'] = arrays[column][order]
+
+    arrays['zip_code'] = zip_df['zip_code'].astype(int).to_numpy(dtype=np.int32)
+    arrays['zip_code.order'] = np.argsort(arrays['zip_code'], kind='stable')
+    arrays['region_id'] = zip_df['region_id'].to_numpy(dtype=np.int64)
+    for column in STRING_COLUMNS:
+        arrays[f'{column}.codes'], arrays[f'{column}.values'] = encode_strings(zip_df[column])
+    return arrays
+
+def publish_table(arrays, path, manifest):
+    """Write arrays to a temporary directory and swap it in, so readers never see a partial table"""
+    tmp_dir = f'{path}.tmp{os.getpid()}'
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, array in arrays.items():
+        _save_array(os.path.join(tmp_dir, f'{name}.npy'), array)
+    with open(os.path.join(tmp_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_dir, path)
+
+def prune_tables(base_dir, keep=SHARED_TABLE_KEEP, min_age=SHARED_TABLE_MIN_AGE):
+    """Remove all but the newest published tables, leaving any published in the last min_age seconds"""
+    tables = sorted((entry for entry in os.scandir(base_dir)
+                     if entry.is_dir() and os.path.exists(os.path.join(entry.path, 'manifest.json'))),
+                    key=lambda entry: entry.stat().st_mtime)
+    cutoff = time.time() - min_age
+    for entry in tables[:-keep] if keep else []:
+        if entry.stat().st_mtime > cutoff:
+            continue
+        shutil.rmtree(entry.path, ignore_errors=True)
+        if os.path.exists(entry.path + '.lock'):
+            os.remove(entry.path + '.lock')
+
+class SharedTable:
+    """
+    Read-only, memory-mapped view of one published table. Every worker
+    maps the same files, so the columns live once in shared memory no
+    matter how many processes attach.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'manifest.json')) as f:
+            self.manifest = json.load(f)
+        self.data_version = self.manifest['data_version']
+        self.model_version = self.manifest['model_version']
+        self.arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+                       for name in self.manifest['arrays']}
+
+    def __len__(self):
+        return self.manifest['rows']
+
+    def column(self, name):
+        return self.arrays[name]
+
+    def strings(self, column, rows):
+        """Decode a dictionary-encoded column for the given rows"""
+        values = self.arrays[f'{column}.values']
+        return [value.decode('utf-8') for value in values[self.arrays[f'{column}.codes'][rows]]]
+
+    def zip_codes(self, rows):
+        return [f'{code:05d}' for code in self.arrays['zip_code'][rows].tolist()]
+
+def attach_table(data_version, bundle, load_zip_data, base_dir=None):
+    """
+    Attach to the published table for this data and model version.
+    The first process to get here builds and publishes it under a file
+    lock; the others wait on the lock and then just map the files. If
+    base_dir fills up, the table goes to SHARED_TABLE_FALLBACK_DIR instead.
+    """
+    base_dir = base_dir or SHARED_TABLE_DIR
+    os.makedirs(base_dir, exist_ok=True)
+    zip_df = None
+    if data_version is None:
+        zip_df = load_zip_data()
+        data_version = content_version(zip_df)
+    name = table_name(data_version, model_key(bundle))
+    path = os.path.join(base_dir, name)
+    for candidate in [path, os.path.join(SHARED_TABLE_FALLBACK_DIR, name)]:
+        if os.path.exists(os.path.join(candidate, 'manifest.json')):
+            return SharedTable(candidate)
+
+    with open(path + '.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(os.path.join(path, 'manifest.json')):
+                if zip_df is None:
+                    zip_df = load_zip_data()
+                arrays = build_table_arrays(zip_df, bundle)
+                publish_table(arrays, path, {
+                    'data_version': data_version,
+                    'model_version': bundle.version,
+                    'rows': len(zip_df),
+                    'arrays': list(arrays),
+                    'created_at': datetime.now().isoformat()
+                })
+                prune_tables(base_dir)
+        except OSError as e:
+            if e.errno != errno.ENOSPC or os.path.abspath(base_dir) == os.path.abspath(SHARED_TABLE_FALLBACK_DIR):
+                raise
+            shutil.rmtree(f'{path}.tmp{os.getpid()}', ignore_errors=True)
+        else:
+            return SharedTable(path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    print(f"No space left in {base_dir} for table {name}, publishing it under {SHARED_TABLE_FALLBACK_DIR}")
+    return attach_table(data_version, bundle, lambda: zip_df, base_dir=SHARED_TABLE_FALLBACK_DIR)
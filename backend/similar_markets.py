@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from shared_table import FEATURE_COLUMNS
+from compact_records import metric_values
+
+MAX_NEIGHBORS = 100
+# Filtered queries scan the matching MSAs directly when there are at most this many
+SCAN_MAX = 2048
+
+class SimilarMarkets:
+    """
+    Nearest MSAs in the classifier's standardized feature space, for one
+    market index (data and model version). Every ZIP of an MSA carries the
+    MSA's features, so each MSA is one point: its first row, scaled with
+    the bundle's clf_scaler. The points go into a KD-tree once, and a
+    query is a tree lookup on an already scaled point.
+    """
+
+    def __init__(self, index, bundle):
+        self.data_version = index.data_version
+        self.model_version = index.model_version
+        table = index.table
+        region_ids = table.column('region_id')
+        order = np.argsort(region_ids, kind='stable')
+        self.region_ids, starts = np.unique(region_ids[order], return_index=True)
+        groups = np.split(order, starts[1:])
+        # The first row of each MSA in table order, as summarize_msas takes it
+        first_rows = np.array([rows.min() for rows in groups])
+        self.msa_names = table.strings('msa_name', first_rows)
+        self.positions = {str(region_id): i for i, region_id in enumerate(self.region_ids.tolist())}
+
+        self.features = {column: metric_values(column, index.columns[column][first_rows]) for column in FEATURE_COLUMNS}
+        feature_names = list(bundle.model_info['feature_names'])
+        self.points = bundle.clf_scaler.transform(pd.DataFrame(self.features)[feature_names])
+        self.tree = KDTree(self.points)
+
+        scores = index.columns['investment_score']
+        self.zip_counts = np.array([len(rows) for rows in groups])
+        self.scores = np.array([scores[rows].mean() for rows in groups])
+        self.min_scores = np.array([scores[rows].min() for rows in groups])
+        self.max_scores = np.array([scores[rows].max() for rows in groups])
+        state_codes = table.column('state.codes')
+        self.states = [sorted({index.states[code].decode('utf-8') for code in np.unique(state_codes[rows])})
+                       for rows in groups]
+        # MSAs spanning several states show up under each of them
+        self.state_masks = {}
+        for i, msa_states in enumerate(self.states):
+            for state in msa_states:
+                self.state_masks.setdefault(state, np.zeros(len(self.region_ids), dtype=bool))[i] = True
+
+    def __len__(self):
+        return len(self.region_ids)
+
+    def position(self, region_id):
+        """Position of an MSA by region id, or None"""
+        return self.positions.get(str(region_id))
+
+    def _eligible(self, states=None, min_score=None, max_score=None):
+        """Mask of MSAs passing the filters, or None when there are none"""
+        if not states and min_score is None and max_score is None:
+            return None
+        mask = np.ones(len(self), dtype=bool)
+        if states:
+            mask &= np.logical_or.reduce([self.state_masks.get(state, np.zeros(len(self), dtype=bool))
+                                          for state in states])
+        if min_score is not None:
+            mask &= self.scores >= min_score
+        if max_score is not None:
+            mask &= self.scores <= max_score
+        return mask
+
+    def nearest(self, position, k=10, states=None, min_score=None, max_score=None):
+        """
+        (positions, distances) of the k MSAs closest to the MSA at position,
+        nearest first, among those in the given states (any of their ZIPs)
+        and with a mean investment score in [min_score, max_score].
+        """
+        eligible = self._eligible(states, min_score, max_score)
+        available = len(self) - 1 if eligible is None else int(eligible.sum()) - int(eligible[position])
+        k = min(k, available)
+        if k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        point = self.points[position:position + 1]
+        if eligible is not None and eligible.sum() <= SCAN_MAX:
+            # Few candidates: computing their distances beats repeated tree queries
+            candidates = np.flatnonzero(eligible)
+            candidates = candidates[candidates != position]
+            distances = np.sqrt(((self.points[candidates] - point) ** 2).sum(axis=1))
+            order = np.lexsort((candidates, distances))[:k]
+            return candidates[order], distances[order]
+
+        # Ask the tree for more neighbours until enough of them pass the filters
+        fetch = k + 1
+        while True:
+            distances, positions = self.tree.query(point, k=min(fetch, len(self)))
+            distances, positions = distances[0], positions[0]
+            keep = positions != position
+            if eligible is not None:
+                keep &= eligible[positions]
+            if keep.sum() >= k or fetch >= len(self):
+                return positions[keep][:k], distances[keep][:k]
+            fetch *= 4
+
+    def records(self, positions, distances=None):
+        """JSON-ready MSAs with the fields /api/msi-analysis uses, counted over all of an MSA's states"""
+        return [{
+            'msi_name': str(self.region_ids[i]),
+            'msa_name': self.msa_names[i],
+            'states': self.states[i],
+            'zip_count': int(self.zip_counts[i]),
+            'investment_score': float(self.scores[i]),
+            'min_investment_score': float(self.min_scores[i]),
+            'max_investment_score': float(self.max_scores[i]),
+            'price_to_rent_ratio': self.features['price_to_rent'][i],
+            'market_heat': self.features['market_heat'][i],
+            'days_to_pending': self.features['days_pending'][i],
+            'price_cuts_percent': self.features['price_cuts_percent'][i],
+            'median_home_value': self.features['median_home_value'][i],
+            'median_rent': self.features['median_rent'][i],
+            **({} if distances is None else {'distance': float(distances[n])})
+        } for n, i in enumerate(positions)]
@@ -0,0 +1,155 @@
+import importlib
+import threading
+import time
+
+class LazyModule:
+    """Stand-in for a module that is only imported on first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+class LazyObject:
+    """Stand-in for an object that is only constructed on first attribute access"""
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+class StartupReport:
+    """Records how long each startup phase took, relative to process start"""
+
+    def __init__(self, started=None):
+        self.started = started if started is not None else time.perf_counter()
+        self.phases = {}
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def mark(self, phase):
+        with self.lock:
+            self.phases[phase] = round(time.perf_counter() - self.started, 4)
+            # A phase that passed on a retry is no longer an error
+            self.errors.pop(phase, None)
+
+    def fail(self, phase, error):
+        with self.lock:
+            self.errors[phase] = str(error)
+
+    def as_dict(self):
+        with self.lock:
+            return {'phases_seconds': dict(self.phases), 'errors': dict(self.errors)}
+
+class Warmup:
+    """
+    Runs startup tasks in order on a background thread and gates readiness.
+    Required tasks that fail are retried with exponential backoff until all
+    of them pass, so a worker started during an outage recovers by itself.
+    Tasks registered with required=False (e.g. docs) run after the first
+    attempt, and those that failed run again once the worker is ready.
+    """
+
+    def __init__(self, report, retry_backoff=1.0, max_backoff=30.0):
+        self.report = report
+        self.retry_backoff = retry_backoff
+        self.max_backoff = max_backoff
+        self.tasks = []
+        self.ready = threading.Event()
+        self.thread = None
+        self.lock = threading.Lock()
+        self._failed = []
+
+    def add(self, phase, fn, required=True):
+        self.tasks.append((phase, fn, required))
+
+    @property
+    def failed(self):
+        """Required phases whose last attempt failed and that are waiting for a retry"""
+        with self.lock:
+            return [phase for phase, _, _ in self._failed]
+
+    def _attempt(self, tasks):
+        failed = []
+        for task in tasks:
+            phase, fn, _ = task
+            try:
+                fn()
+                self.report.mark(phase)
+            except Exception as e:
+                failed.append(task)
+                self.report.fail(phase, e)
+        return failed
+
+    def _set_failed(self, failed):
+        with self.lock:
+            self._failed = failed
+        if not failed:
+            self.report.mark('ready')
+            self.ready.set()
+
+    def _first_pass(self):
+        self._set_failed(self._attempt([task for task in self.tasks if task[2]]))
+        return self._attempt([task for task in self.tasks if not task[2]])
+
+    def _retry(self, optional):
+        delay = self.retry_backoff
+        while self.failed:
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_backoff)
+            with self.lock:
+                failed = list(self._failed)
+            self._set_failed(self._attempt(failed))
+        # Optional tasks mostly fail because a required one did
+        self._attempt(optional)
+
+    def _run(self):
+        optional = self._first_pass()
+        if self.failed:
+            self._retry(optional)
+
+    def start(self, background=True):
+        if background:
+            self.thread = threading.Thread(target=self._run, name='warmup', daemon=True)
+            self.thread.start()
+            return
+        # The first attempt runs before returning; retries never block the caller
+        optional = self._first_pass()
+        if self.failed:
+            self.thread = threading.Thread(target=self._retry, args=(optional,), name='warmup', daemon=True)
+            self.thread.start()
+
+    def wait(self, timeout=None):
+        """Block until the required tasks are done; returns readiness"""
+        return self.ready.wait(timeout)
+
+class LazyDocsMiddleware:
+    """
+    WSGI middleware that serves the API docs from a separate app built on
+    first use (or by the warm-up), so the Swagger machinery is neither
+    imported nor set up before the API can answer health checks.
+    """
+
+    def __init__(self, wsgi_app, build_docs_app, prefixes):
+        self.wsgi_app = wsgi_app
+        self.docs = LazyObject(build_docs_app)
+        self.prefixes = tuple(prefixes)
+
+    def __call__(self, environ, start_response):
+        if environ.get('PATH_INFO', '').startswith(self.prefixes):
+            return self.docs.get()(environ, start_response)
+        return self.wsgi_app(environ, start_response)
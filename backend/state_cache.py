@@ -0,0 +1,72 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time. Callers that arrive while a
+    call for the same key is in flight wait for it and share its result
+    (or its exception) instead of repeating the work.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        """Return (result, shared), where shared means another caller did the work"""
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = self.calls[key] = Future()
+        if not leader:
+            return future.result(), True
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+class StateCache:
+    """
+    Computed per-state responses, grouped by generation (data version,
+    model version). Only the newest few generations are kept, so requests
+    still running on the previous model can finish against their own
+    entries while the new generation warms up.
+    """
+
+    def __init__(self, max_generations=2):
+        self.max_generations = max_generations
+        self.generations = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add_generation(self, generation):
+        """Register a generation; returns True the first time it is seen"""
+        with self.lock:
+            if generation in self.generations:
+                return False
+            self.generations[generation] = {}
+            while len(self.generations) > self.max_generations:
+                self.generations.popitem(last=False)
+            return True
+
+    def get(self, generation, state):
+        with self.lock:
+            return self.generations.get(generation, {}).get(state)
+
+    def put(self, generation, state, value):
+        with self.lock:
+            # Results for an evicted generation are dropped
+            if generation in self.generations:
+                self.generations[generation][state] = value
+
+    def stats(self):
+        with self.lock:
+            return {str(generation): len(entries) for generation, entries in self.generations.items()}
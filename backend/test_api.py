@@ -2,9 +2,16 @@ import requests
 import random
 import json
 import pandas as pd
+import numpy as np
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import argparse
 import logging
 import os
+import subprocess
+import sys
+import threading
+import time
 
 # Set up logging
 if not os.path.exists('logs'):
@@ -22,9 +29,12 @@ logging.basicConfig(
 # API Configuration
 BASE_URL = "http://localhost:5000/api"
 
+# Default request mix, as weights per endpoint
+DEFAULT_MIX = {'recommendations': 0.4, 'analysis': 0.5, 'msi-analysis': 0.1}
+
 def load_test_data():
     """Load available states and ZIP codes from processed data"""
-    df = pd.read_csv('data/processed_zip_data.csv')
+    df = pd.read_csv('data/processed_zip_data.csv', dtype={'zip_code': str})
     
     # Get available states
     states = sorted(df['state'].unique())
@@ -35,148 +45,152 @@ def load_test_data():
     
     return states, zip_codes
 
-# Load available states and ZIP codes
-AVAILABLE_STATES, AVAILABLE_ZIPS = load_test_data()
+def parse_mix(text):
+    """Parse 'recommendations=0.5,analysis=0.4,msi-analysis=0.1' into normalized weights"""
+    mix = {}
+    for part in text.split(','):
+        name, weight = part.split('=')
+        if name not in DEFAULT_MIX:
+            raise ValueError(f'Unknown endpoint {name}, expected one of {list(DEFAULT_MIX)}')
+        mix[name] = float(weight)
+    total = sum(mix.values())
+    return {name: weight / total for name, weight in mix.items()}
 
-def test_state_recommendations(state_code=None):
-    """Test the state recommendations endpoint"""
-    if state_code is None:
-        state_code = random.choice(AVAILABLE_STATES)
-    
-    url = f"{BASE_URL}/recommendations/{state_code}"
-    logging.info(f"\n{'='*50}\nTesting State Recommendations: {state_code}")
-    
-    try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        logging.info(f"Status Code: {response.status_code}")
-        
-        # Log summary statistics
-        recommendations = data.get('recommendations', [])
-        logging.info(f"Total Recommendations: {len(recommendations)}")
-        
-        if recommendations:
-            # Calculate average metrics
-            avg_home_value = sum(r['median_home_value'] for r in recommendations) / len(recommendations)
-            avg_rent = sum(r['median_rent'] for r in recommendations) / len(recommendations)
-            avg_investment_score = sum(r['investment_score'] for r in recommendations) / len(recommendations)
-            
-            logging.info(f"\nState Summary Statistics:")
-            logging.info(f"Average Home Value: ${avg_home_value:,.2f}")
-            logging.info(f"Average Rent: ${avg_rent:,.2f}")
-            logging.info(f"Average Investment Score: {avg_investment_score:.3f}")
-            
-            # Log top 3 recommendations
-            logging.info(f"\nTop 3 Recommendations:")
-            for i, rec in enumerate(recommendations[:3], 1):
-                logging.info(f"\nRank {i}:")
-                logging.info(f"ZIP Code: {rec['zip_code']}")
-                logging.info(f"City: {rec['city']}, {rec['state']}")
-                logging.info(f"Home Value: ${rec['median_home_value']:,.2f}")
-                logging.info(f"Monthly Rent: ${rec['median_rent']:,.2f}")
-                logging.info(f"Investment Score: {rec['investment_score']:.3f}")
-                logging.info(f"Market Heat: {rec['market_heat']:.1f}")
-        
-        return {
-            'status': 'success',
-            'state': state_code,
-            'total_recommendations': len(recommendations),
-            'sample_data': recommendations[:3] if recommendations else []
-        }
-        
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error testing state recommendations: {str(e)}")
-        return {
-            'status': 'error',
-            'state': state_code,
-            'error': str(e)
-        }
+class RequestPicker:
+    """
+    Draws requests that follow the real data: states are picked in
+    proportion to how many ZIP codes they have, ZIP codes uniformly.
+    """
 
-def test_zip_analysis(zip_code=None):
-    """Test the ZIP code analysis endpoint"""
-    if zip_code is None:
-        # Choose a random state and then a random ZIP from that state
-        state = random.choice(AVAILABLE_STATES)
-        zip_code = random.choice(AVAILABLE_ZIPS[state])
-    
-    url = f"{BASE_URL}/analysis/{zip_code}"
-    logging.info(f"\n{'='*50}\nTesting ZIP Analysis: {zip_code}")
-    
+    def __init__(self, states, zip_codes, mix, seed=None):
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.all_zips = [zip_code for state in states for zip_code in zip_codes[state]]
+        self.states = states
+        self.state_weights = [len(zip_codes[state]) for state in states]
+        self.endpoints = list(mix)
+        self.endpoint_weights = [mix[name] for name in self.endpoints]
+
+    def next(self):
+        with self.lock:
+            endpoint = self.rng.choices(self.endpoints, self.endpoint_weights)[0]
+            if endpoint == 'analysis':
+                return endpoint, self.rng.choice(self.all_zips)
+            return endpoint, self.rng.choices(self.states, self.state_weights)[0]
+
+# Key each successful response must contain
+EXPECTED_KEYS = {'recommendations': 'recommendations', 'analysis': 'scores', 'msi-analysis': 'msi_data'}
+
+_sessions = threading.local()
+
+def send_request(base_url, endpoint, argument, timeout):
+    """Issue one request on this thread's keep-alive session and time it"""
+    if not hasattr(_sessions, 'session'):
+        _sessions.session = requests.Session()
+    url = f"{base_url}/{endpoint}/{argument}"
+    started = time.perf_counter()
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        
-        logging.info(f"Status Code: {response.status_code}")
-        
-        # Log analysis results
-        logging.info(f"\nLocation: {data['city']}, {data['state']}")
-        logging.info(f"\nKey Metrics:")
-        logging.info(f"Median Home Value: ${data['metrics']['median_home_value']:,.2f}")
-        logging.info(f"Monthly Rent: ${data['metrics']['median_rent']:,.2f}")
-        logging.info(f"Days to Pending: {data['metrics']['days_pending']:.1f}")
-        logging.info(f"Price Cuts %: {data['metrics']['price_cuts_percent']:.1f}%")
-        logging.info(f"Market Heat: {data['metrics']['market_heat']:.1f}")
-        logging.info(f"Price-to-Rent Ratio: {data['metrics']['price_to_rent']:.2f}")
-        logging.info(f"\nScores:")
-        logging.info(f"Investment Score: {data['scores']['investment_score']:.3f}")
-        logging.info(f"Ranking Score: {data['scores']['ranking_score']:.3f}")
-        
-        return {
-            'status': 'success',
-            'zip_code': zip_code,
-            'data': data
-        }
-        
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Error testing ZIP analysis: {str(e)}")
+        response = _sessions.session.get(url, timeout=timeout)
+        latency = (time.perf_counter() - started) * 1000
+        ok = response.status_code == 200 and EXPECTED_KEYS[endpoint] in response.json()
+        return {'endpoint': endpoint, 'argument': argument, 'status': response.status_code,
+                'latency_ms': latency, 'ok': ok}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        latency = (time.perf_counter() - started) * 1000
+        return {'endpoint': endpoint, 'argument': argument, 'status': None,
+                'latency_ms': latency, 'ok': False, 'error': str(e)}
+
+def run_load(base_url, picker, concurrency, total_requests=None, duration=None, timeout=30):
+    """Drive the API with a fixed number of concurrent workers"""
+    results = []
+    results_lock = threading.Lock()
+    deadline = time.perf_counter() + duration if duration else None
+    issued = {'count': 0}
+
+    def worker():
+        while True:
+            if deadline is not None and time.perf_counter() >= deadline:
+                return
+            with results_lock:
+                if total_requests is not None and issued['count'] >= total_requests:
+                    return
+                issued['count'] += 1
+            endpoint, argument = picker.next()
+            result = send_request(base_url, endpoint, argument, timeout)
+            with results_lock:
+                results.append(result)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(worker)
+    elapsed = time.perf_counter() - started
+    return results, elapsed
+
+def summarize(results, elapsed):
+    """Throughput, latency percentiles and error rate, overall and per endpoint"""
+    def stats(rows):
+        latencies = np.array([row['latency_ms'] for row in rows])
+        errors = sum(1 for row in rows if not row['ok'])
         return {
-            'status': 'error',
-            'zip_code': zip_code,
-            'error': str(e)
+            'requests': len(rows),
+            'throughput_rps': len(rows) / elapsed if elapsed else 0.0,
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'max_ms': float(latencies.max()),
+            'error_rate': errors / len(rows),
+            'status_codes': {str(code): sum(1 for row in rows if row['status'] == code)
+                             for code in sorted({row['status'] for row in rows}, key=str)}
         }
 
-def run_random_tests(num_tests=5):
-    """Run a series of random tests on both endpoints"""
-    test_results = {
-        'timestamp': datetime.now().isoformat(),
-        'state_tests': [],
-        'zip_tests': []
-    }
-    
-    logging.info(f"\nRunning {num_tests} random tests for each endpoint...")
-    
-    # Test state recommendations
-    for _ in range(num_tests):
-        state = random.choice(AVAILABLE_STATES)
-        result = test_state_recommendations(state)
-        test_results['state_tests'].append(result)
-    
-    # Test ZIP analysis
-    for _ in range(num_tests):
-        state = random.choice(AVAILABLE_STATES)
-        zip_code = random.choice(AVAILABLE_ZIPS[state])
-        result = test_zip_analysis(zip_code)
-        test_results['zip_tests'].append(result)
-    
-    # Save results
-    results_dir = 'test_results'
-    if not os.path.exists(results_dir):
-        os.makedirs(results_dir)
-    
-    filename = os.path.join(results_dir, f'api_test_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
-    with open(filename, 'w') as f:
-        json.dump(test_results, f, indent=2)
-    
-    logging.info(f"\nTest results saved to {filename}")
-    return test_results
+    summary = {'elapsed_seconds': elapsed, 'overall': stats(results) if results else None, 'endpoints': {}}
+    for endpoint in sorted({row['endpoint'] for row in results}):
+        summary['endpoints'][endpoint] = stats([row for row in results if row['endpoint'] == endpoint])
+    return summary
+
+def log_summary(summary):
+    for name, stats in [('overall', summary['overall'])] + list(summary['endpoints'].items()):
+        logging.info(f"{name:16s} {stats['requests']:6d} req  {stats['throughput_rps']:8.1f} req/s  "
+                     f"p50 {stats['p50_ms']:8.1f} ms  p95 {stats['p95_ms']:8.1f} ms  "
+                     f"p99 {stats['p99_ms']:8.1f} ms  errors {stats['error_rate']:.2%}")
+
+def start_local_server(port, mongo_uri):
+    """Start app.py on a local port against a local Mongo and wait for /health"""
+    env = dict(os.environ, MONGO_URI=mongo_uri)
+    server = subprocess.Popen(
+        [sys.executable, '-c', f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"],
+        env=env
+    )
+    health_url = f"http://127.0.0.1:{port}/health"
+    for _ in range(120):
+        try:
+            if requests.get(health_url, timeout=1).status_code == 200:
+                return server
+        except requests.exceptions.RequestException:
+            pass
+        if server.poll() is not None:
+            raise RuntimeError('API server exited during startup')
+        time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError('API server did not become healthy')
 
 if __name__ == "__main__":
-    logging.info("Starting API Tests")
-    
+    parser = argparse.ArgumentParser(description='Concurrent load test for the API')
+    parser.add_argument('--base-url', default=BASE_URL, help='API base URL')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+    parser.add_argument('--requests', type=int, default=None, help='Total requests to send')
+    parser.add_argument('--duration', type=float, default=None, help='Seconds to run (default 30 if --requests is not set)')
+    parser.add_argument('--mix', default=None, help='Endpoint weights, e.g. recommendations=0.5,analysis=0.4,msi-analysis=0.1')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for the request sequence')
+    parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+    parser.add_argument('--start-server', action='store_true', help='Start app.py locally for the run')
+    parser.add_argument('--port', type=int, default=5050, help='Port for --start-server')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/capstone', help='Mongo URI for --start-server')
+    args = parser.parse_args()
+
     # First make sure we have data
+    AVAILABLE_STATES, AVAILABLE_ZIPS = load_test_data()
     if not AVAILABLE_STATES or not AVAILABLE_ZIPS:
         logging.error("No test data available. Please run data_preprocessing.py first.")
         exit(1)
@@ -184,14 +198,42 @@ if __name__ == "__main__":
     logging.info(f"Found {len(AVAILABLE_STATES)} states with data")
     logging.info(f"Total ZIP codes available: {sum(len(zips) for zips in AVAILABLE_ZIPS.values())}")
     
-    # Start the Flask server if it's not running
+    server = None
+    base_url = args.base_url
+    if args.start_server:
+        server = start_local_server(args.port, args.mongo_uri)
+        base_url = f"http://127.0.0.1:{args.port}/api"
+
     try:
-        requests.get(f"{BASE_URL}/recommendations/{AVAILABLE_STATES[0]}")
-    except requests.exceptions.ConnectionError:
-        logging.error("API server is not running. Please start app.py first.")
-        exit(1)
+        try:
+            requests.get(f"{base_url}/recommendations/{AVAILABLE_STATES[0]}", timeout=args.timeout)
+        except requests.exceptions.ConnectionError:
+            logging.error("API server is not running. Please start app.py first or pass --start-server.")
+            exit(1)
+
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+        duration = args.duration if args.duration or args.requests else 30
+        picker = RequestPicker(AVAILABLE_STATES, AVAILABLE_ZIPS, mix, args.seed)
+        logging.info(f"Running load test: concurrency={args.concurrency} mix={mix} "
+                     f"requests={args.requests} duration={duration}")
+        results, elapsed = run_load(base_url, picker, args.concurrency, args.requests, duration, args.timeout)
+        summary = summarize(results, elapsed)
+        summary['config'] = {'base_url': base_url, 'concurrency': args.concurrency, 'mix': mix,
+                             'requests': args.requests, 'duration': duration, 'seed': args.seed}
+        log_summary(summary)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    # Save results
+    results_dir = 'test_results'
+    if not os.path.exists(results_dir):
+        os.makedirs(results_dir)
     
-    # Run random tests
-    results = run_random_tests(num_tests=5)
+    filename = os.path.join(results_dir, f'load_test_results_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    with open(filename, 'w') as f:
+        json.dump(summary, f, indent=2)
     
+    logging.info(f"\nTest results saved to {filename}")
     logging.info("API Tests Complete")
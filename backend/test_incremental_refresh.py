@@ -0,0 +1,89 @@
+"""
+Checks that an incremental monthly refresh ends up with exactly the outputs
+of a full rebuild: processed CSV, state lookup, feature store and the
+MongoDB collections. Run from backend/, either directly or through pytest.
+"""
+import pandas as pd
+import filecmp
+import os
+import shutil
+import tempfile
+from database import Database
+from mongo_standin import InMemoryClient
+from feature_store import METRIC_FILES
+from data_preprocessing import process_and_map_data
+from incremental_refresh import incremental_refresh
+
+DATA_DIR = 'data'
+ZILLOW_DIR = 'zillow-data'
+
+def write_month(target_dir, drop_months=0, revisions=None):
+    """Copy the Zillow files, optionally dropping the newest months or revising latest values"""
+    os.makedirs(target_dir, exist_ok=True)
+    for filename in METRIC_FILES.values():
+        df = pd.read_csv(os.path.join(ZILLOW_DIR, filename))
+        date_cols = sorted(col for col in df.columns if col.startswith('20'))
+        if drop_months:
+            df = df.drop(columns=date_cols[-drop_months:])
+        for region_id, factor in (revisions or {}).get(filename, {}).items():
+            latest = sorted(col for col in df.columns if col.startswith('20'))[-1]
+            df.loc[df['RegionID'] == region_id, latest] *= factor
+        df.to_csv(os.path.join(target_dir, filename), index=False)
+
+def collection_docs(db, name, key):
+    docs = getattr(db, name).find({}, {'_id': 0})
+    return sorted(docs, key=lambda doc: doc[key])
+
+def assert_same_outputs(incremental_dir, incremental_db, full_dir, full_db):
+    for filename in ['processed_zip_data.csv', 'state_lookup.json']:
+        assert filecmp.cmp(os.path.join(incremental_dir, filename), os.path.join(full_dir, filename),
+                           shallow=False), f'{filename} differs from a full rebuild'
+    store = os.path.join(incremental_dir, 'feature_store')
+    for filename in os.listdir(store):
+        assert filecmp.cmp(os.path.join(store, filename), os.path.join(full_dir, 'feature_store', filename),
+                           shallow=False), f'feature_store/{filename} differs from a full rebuild'
+    for name, key in [('zip_data', 'zip_code'), ('state_lookup', 'state'), ('msa_lookup', 'state')]:
+        assert collection_docs(incremental_db, name, key) == collection_docs(full_db, name, key), \
+            f'{name} differs from a full rebuild'
+
+def full_rebuild(zillow_dir, output_dir):
+    db = Database(client=InMemoryClient())
+    process_and_map_data(DATA_DIR, zillow_dir, output_dir, db)
+    return db
+
+def test_incremental_matches_full_rebuild():
+    work_dir = tempfile.mkdtemp(prefix='incremental_refresh_')
+    try:
+        previous_dir = os.path.join(work_dir, 'previous')
+        current_dir = os.path.join(work_dir, 'current')
+        revised_dir = os.path.join(work_dir, 'revised')
+        incremental_dir = os.path.join(work_dir, 'incremental')
+
+        # Last month's build, then this month's files with one more date column
+        write_month(previous_dir, drop_months=1)
+        write_month(current_dir)
+        db = full_rebuild(previous_dir, incremental_dir)
+        report = incremental_refresh(DATA_DIR, current_dir, incremental_dir, db)
+        assert report['mode'] == 'incremental', report
+        assert set(report['new_columns']) == set(METRIC_FILES.values())
+        assert report['changed_regions']
+        assert_same_outputs(incremental_dir, db, os.path.join(work_dir, 'full'),
+                            full_rebuild(current_dir, os.path.join(work_dir, 'full')))
+
+        # A revision of two MSAs' latest home values touches only their ZIP codes
+        zip_data = pd.read_csv(os.path.join(incremental_dir, 'processed_zip_data.csv'), dtype={'zip_code': str})
+        revised = sorted(int(region_id) for region_id in zip_data['region_id'].unique()[:2])
+        write_month(revised_dir, revisions={METRIC_FILES['median_home_value']: {region_id: 1.05 for region_id in revised}})
+        report = incremental_refresh(DATA_DIR, revised_dir, incremental_dir, db)
+        assert report['mode'] == 'incremental', report
+        assert report['new_columns'] == {}
+        assert report['changed_regions'] == revised, report
+        assert report['affected_zips'] == int(zip_data['region_id'].isin(revised).sum())
+        assert_same_outputs(incremental_dir, db, os.path.join(work_dir, 'full_revised'),
+                            full_rebuild(revised_dir, os.path.join(work_dir, 'full_revised')))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_incremental_matches_full_rebuild()
+    print("Incremental refresh matches a full rebuild")
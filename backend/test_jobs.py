@@ -0,0 +1,84 @@
+"""
+Checks that a reprocess job run by an API started from backend/ finds its
+inputs, and that the job keeps its kind locked when the API process dies
+while it runs. The job works on a copy of backend/ with Mongo unreachable,
+so the checked-in data is never touched. Run from backend/, either
+directly or through pytest.
+"""
+import pandas as pd
+import glob
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import jobs
+
+# An API worker started from backend/ that queues one job and then hangs until killed
+API_SCRIPT = """
+import time
+import jobs
+manager = jobs.JobManager(job_dir='logs/jobs')
+print(manager.submit('reprocess', {'full': True})['id'], flush=True)
+time.sleep(600)
+"""
+
+def copy_backend(target):
+    os.makedirs(os.path.join(target, 'data'))
+    for path in glob.glob('*.py'):
+        shutil.copy(path, target)
+    for filename in ['ZIP_CBSA_122024.xlsx', 'processed_zip_data.csv']:
+        shutil.copy(os.path.join('data', filename), os.path.join(target, 'data'))
+    shutil.copytree('zillow-data', os.path.join(target, 'zillow-data'))
+
+def wait_for(condition, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        value = condition()
+        if value:
+            return value
+        time.sleep(0.2)
+    raise AssertionError('timed out')
+
+def test_reprocess_outlives_its_api_process():
+    work_dir = tempfile.mkdtemp(prefix='jobs_')
+    api = None
+    try:
+        backend_dir = os.path.join(work_dir, 'backend')
+        copy_backend(backend_dir)
+        job_dir = os.path.join(backend_dir, 'logs', 'jobs')
+        env = {name: value for name, value in os.environ.items() if name not in ('DATA_DIR', 'ZILLOW_DIR')}
+        env.update(MONGO_URI='mongodb://127.0.0.1:1/capstone', MONGO_SERVER_SELECTION_TIMEOUT_MS='200')
+        api = subprocess.Popen([sys.executable, '-c', API_SCRIPT], cwd=backend_dir, env=env,
+                               stdout=subprocess.PIPE, text=True)
+        job_id = api.stdout.readline().strip()
+        manager = jobs.JobManager(job_dir=job_dir)
+        job = wait_for(lambda: (manager.status(job_id) or {}).get('pid') and manager.status(job_id), 30)
+
+        # The API process dies; the job process carries on and still holds the lock
+        api.send_signal(signal.SIGKILL)
+        api.wait()
+        assert jobs.JobManager(job_dir=job_dir).status(job_id)['state'] == 'running'
+        try:
+            manager.submit('reprocess')
+            assert False, 'expected RuntimeError'
+        except RuntimeError as e:
+            assert job_id in str(e)
+
+        wait_for(lambda: not jobs._pid_alive(job['pid']), 300)
+        job = jobs.JobManager(job_dir=job_dir).status(job_id)
+        log = manager.read_log(job_id, 0)[0]
+        assert job['state'] == 'succeeded', log
+        expected = pd.read_csv(os.path.join('data', 'processed_zip_data.csv'), dtype={'zip_code': str})
+        assert job['result'] == {'mode': 'full', 'affected_zips': len(expected)}
+        assert os.path.exists(os.path.join(backend_dir, 'data', 'feature_store'))
+    finally:
+        if api is not None and api.poll() is None:
+            api.kill()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_reprocess_outlives_its_api_process()
+    print("A reprocess job started from backend/ finds its inputs and outlives its API process")
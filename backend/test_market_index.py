@@ -0,0 +1,85 @@
+"""
+Checks /api/screen query parsing and that MarketIndex.screen returns what
+a plain pandas filter over the processed data would. The index is built
+from data/processed_zip_data.csv into a temporary shared-table directory.
+Run from backend/, either directly or through pytest.
+"""
+import numpy as np
+import pandas as pd
+import shutil
+import tempfile
+from compact_records import metric_dtype
+from market_index import MarketIndex, parse_screen_query
+from model_registry import ModelBundle, get_active_version
+from shared_table import attach_table
+
+def load_zip_data():
+    return pd.read_csv('data/processed_zip_data.csv', dtype={'zip_code': str})
+
+def build_index(zip_data, base_dir):
+    """Market index over zip_data, scored with the active model version"""
+    bundle = ModelBundle.load(get_active_version() or 'legacy')
+    return MarketIndex(attach_table('test', bundle, lambda: zip_data, base_dir=base_dir)), bundle
+
+def column(zip_data, name):
+    # The index stores each column in its compact dtype and compares in that precision
+    return zip_data[name].to_numpy(dtype=metric_dtype(name))
+
+def test_parse_screen_query():
+    query = parse_screen_query('price_to_rent<15&market_heat%3E%3D70&state=ca,%20tx&sort=market_heat'
+                               '&order=asc&limit=20&offset=40&_profile=1')
+    assert query == {
+        'filters': [('price_to_rent', '<', 15.0), ('market_heat', '>=', 70.0)],
+        'states': ['CA', 'TX'], 'msa': None, 'sort': 'market_heat',
+        'descending': False, 'limit': 20, 'offset': 40
+    }
+    assert parse_screen_query('')['filters'] == []
+    for bad in ['price_to_rent<nan', 'market_heat>inf', 'market_heat>-Infinity', 'price_to_rent<cheap',
+                'rent<10', 'price_to_rent=15', 'sort=city', 'order=up', 'limit=0', 'limit=1001',
+                'offset=-1', 'price_to_rent']:
+        try:
+            parse_screen_query(bad)
+            assert False, f'expected ValueError for {bad!r}'
+        except ValueError:
+            pass
+
+def test_screen_matches_pandas():
+    zip_data = load_zip_data()
+    work_dir = tempfile.mkdtemp(prefix='market_index_')
+    try:
+        index, _ = build_index(zip_data, work_dir)
+        mask = ((column(zip_data, 'price_to_rent') < np.float32(15)) &
+                (column(zip_data, 'market_heat') >= np.float32(50)) &
+                zip_data['state'].isin(['CA', 'TX']).to_numpy())
+        total, rows = index.screen([('price_to_rent', '<', 15), ('market_heat', '>=', 50)], states=['CA', 'TX'],
+                                   sort='ranking_score', limit=25)
+        assert total == int(mask.sum()) and 0 < len(rows) <= 25
+
+        # Highest ranking score first, ties by ZIP code
+        expected = zip_data[mask].assign(ranking_score=index.columns['ranking_score'][mask])
+        expected = expected.sort_values(['ranking_score', 'zip_code'], ascending=[False, True])
+        records = index.records(rows)
+        assert [record['zip_code'] for record in records] == expected['zip_code'].head(25).tolist()
+        assert all(record['state'] in ('CA', 'TX') and record['price_to_rent'] < 15 for record in records)
+
+        # Paging continues where the first page stopped
+        _, next_rows = index.screen([('price_to_rent', '<', 15), ('market_heat', '>=', 50)], states=['CA', 'TX'],
+                                    sort='ranking_score', limit=25, offset=25)
+        assert [record['zip_code'] for record in index.records(next_rows)] == \
+            expected['zip_code'].iloc[25:50].tolist()
+
+        # An MSA filter, by name in any case, keeps only that MSA's ZIP codes
+        msa_name = zip_data['msa_name'].iloc[0]
+        total, rows = index.screen(msa=msa_name.upper(), limit=1000)
+        assert total == int((zip_data['msa_name'] == msa_name).sum())
+        assert {record['msa_name'] for record in index.records(rows)} == {msa_name}
+
+        # No filters: every ZIP code
+        assert index.screen(limit=1)[0] == len(zip_data)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_parse_screen_query()
+    test_screen_matches_pandas()
+    print("Screen queries parse as expected and MarketIndex.screen matches pandas")
@@ -0,0 +1,143 @@
+"""
+Checks the deadline and last-known-good behaviour of ResilientDatabase
+against the fault-injecting Mongo stand-in, that the warm-up retries a
+phase that failed during an outage, and that a worker restarted during
+an outage serves from its on-disk snapshot. Run from backend/, either
+directly or through pytest.
+"""
+import pandas as pd
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from database import Database
+from mongo_standin import FaultInjectingClient
+from resilient_db import ResilientDatabase, DatabaseUnavailable
+from startup import StartupReport, Warmup
+
+DEADLINE = 0.2
+
+def load_database():
+    zip_data = pd.read_csv('data/processed_zip_data.csv', dtype={'zip_code': str})
+    state_data = {state: zip_data[zip_data['state'] == state].to_dict('records')
+                  for state in zip_data['state'].unique()}
+    client = FaultInjectingClient()
+    db = Database(client=client)
+    db.initialize_collections(zip_data, state_data)
+    return client.faults, db, zip_data
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    return fn(*args), time.perf_counter() - started
+
+def test_serves_stale_data_within_deadline():
+    faults, database, zip_data = load_database()
+    ages = []
+    db = ResilientDatabase(database, on_stale=ages.append, deadline=DEADLINE, cooldown=1.0, snapshot_path=None)
+    zip_code = zip_data['zip_code'].iloc[0]
+    fresh = db.get_zip_info(zip_code)
+    assert fresh['zip_code'] == zip_code
+
+    # A hung server: the snapshot answers once the deadline passes
+    faults.hang()
+    value, elapsed = timed(db.get_zip_info, zip_code)
+    assert value == fresh and len(ages) == 1
+    assert elapsed < DEADLINE + 0.1, elapsed
+
+    # While the database is marked unhealthy, snapshot reads do not wait at all
+    value, elapsed = timed(db.get_zip_info, zip_code)
+    assert value == fresh and len(ages) == 2
+    assert elapsed < 0.05, elapsed
+
+    # Nothing to fall back to: fail fast instead of hanging
+    other_zip = zip_data['zip_code'].iloc[1]
+    started = time.perf_counter()
+    try:
+        db.get_zip_info(other_zip)
+        assert False, 'expected DatabaseUnavailable'
+    except DatabaseUnavailable:
+        assert time.perf_counter() - started < DEADLINE + 0.1
+
+    # Once the server is back, the background refresh brings the database back into use
+    faults.release()
+    deadline = time.time() + 2
+    while not db.status()['healthy'] and time.time() < deadline:
+        time.sleep(0.01)
+    assert db.status()['healthy']
+    assert db.get_zip_info(other_zip)['zip_code'] == other_zip
+    assert len(ages) == 2
+
+def test_retries_transient_failures():
+    faults, database, zip_data = load_database()
+    db = ResilientDatabase(database, deadline=1.0, retries=5, backoff=0.001, snapshot_path=None)
+    faults.failure_rate = 0.3
+    states = sorted(zip_data['state'].unique())
+    for state in states:
+        records = db.get_state_records(state)
+        assert len(records) == int((zip_data['state'] == state).sum())
+    assert db.status()['stale_reads'] == 0
+    assert faults.calls > len(states)
+
+def test_warmup_retries_failed_phases():
+    attempts = []
+    def flaky():
+        attempts.append(time.perf_counter())
+        if len(attempts) < 3:
+            raise ConnectionError('Connection refused')
+    warmup = Warmup(StartupReport(), retry_backoff=0.01)
+    warmup.add('database_connected', flaky)
+    warmup.start(background=False)
+    assert not warmup.ready.is_set() and warmup.failed == ['database_connected']
+    assert warmup.wait(2)
+    assert warmup.failed == [] and len(attempts) == 3
+    assert warmup.report.as_dict()['errors'] == {}
+
+# A worker started with Mongo unreachable, answering one state from the snapshot path
+RESTART_SCRIPT = """
+import json, sys
+import app
+app.warmup.wait(30)
+response = app.app.test_client().get('/api/recommendations/' + sys.argv[1])
+print(json.dumps({'status': response.status_code, 'ready': app.warmup.ready.is_set(),
+                  'count': len((response.get_json() or {}).get('recommendations', [])),
+                  'database': app.db.status()}))
+"""
+
+def test_restart_during_outage_serves_snapshot():
+    _, database, zip_data = load_database()
+    state = zip_data['state'].value_counts().index[-1]
+    work_dir = tempfile.mkdtemp(prefix='resilient_db_')
+    try:
+        # What a worker keeps from serving the state before the outage
+        snapshot_path = os.path.join(work_dir, 'snapshot.pkl')
+        db = ResilientDatabase(database, snapshot_path=None)
+        db.snapshot_path = snapshot_path
+        db.get_data_version()
+        db.get_states()
+        db.get_state_records(state)
+        db.flush_snapshot()
+
+        env = dict(os.environ, MONGO_URI='mongodb://127.0.0.1:1/capstone', MONGO_SERVER_SELECTION_TIMEOUT_MS='200',
+                   DB_SNAPSHOT_PATH=snapshot_path, SHARED_TABLE_DIR=os.path.join(work_dir, 'tables'),
+                   STATE_WARMUP_WORKERS='0')
+        output = subprocess.run([sys.executable, '-c', RESTART_SCRIPT, state], env=env, capture_output=True,
+                                text=True, timeout=120)
+        assert output.returncode == 0, output.stderr[-2000:]
+        result = json.loads(output.stdout.strip().splitlines()[-1])
+        assert result['ready'], result
+        assert result['status'] == 200, result
+        assert result['count'] == int((zip_data['state'] == state).sum())
+        assert not result['database']['healthy'] and result['database']['stale_reads'] > 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_serves_stale_data_within_deadline()
+    test_retries_transient_failures()
+    test_warmup_retries_failed_phases()
+    test_restart_during_outage_serves_snapshot()
+    print("ResilientDatabase serves stale data within its deadline and retries transient failures, "
+          "the warm-up retries failed phases and a restart during an outage serves the snapshot")
@@ -0,0 +1,107 @@
+"""
+Checks state-sharded serving: ShardMap assignment, merging per-shard
+screen pages in the router, and that each shard answers its own states
+and sends the rest away with 421. The shards run as separate processes
+against the in-memory Mongo stand-in. Run from backend/, either directly
+or through pytest.
+"""
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from router import merge_screens
+from sharding import ShardMap, parse_pins
+
+# One API process against the stand-in: status of every state, one 421 body and a screen page
+SHARD_SCRIPT = """
+import json, os, sys
+import app
+from benchmark import load_standin_database
+from resilient_db import ResilientDatabase
+db, zip_data = load_standin_database()
+app.db = ResilientDatabase(db, snapshot_path=None)
+app.warmup.start(background=False)
+client = app.app.test_client()
+statuses, misdirected = {}, None
+for state in sorted(zip_data['state'].unique()):
+    response = client.get('/api/recommendations/' + state)
+    statuses[state] = response.status_code
+    if response.status_code == 421 and misdirected is None:
+        misdirected = dict(response.get_json(), state=state)
+print(json.dumps({'statuses': statuses, 'misdirected': misdirected,
+                  'screen': client.get('/api/screen?' + sys.argv[1]).get_json()}))
+"""
+
+SCREEN_QUERY = 'market_heat%3E40&sort=market_heat&order=desc&limit=30&offset=10'
+
+def run_shard(query, work_dir, **env):
+    env = dict(os.environ, WARMUP_ON_IMPORT='0', STATE_WARMUP_WORKERS='0',
+               SHARED_TABLE_DIR=os.path.join(work_dir, 'tables'), **env)
+    output = subprocess.run([sys.executable, '-c', SHARD_SCRIPT, query], env=env, capture_output=True, text=True,
+                            timeout=300)
+    assert output.returncode == 0, output.stderr[-2000:]
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def test_shard_map():
+    shard_map = ShardMap(3, parse_pins('ca=0, FL=1'))
+    assert shard_map.pins == {'CA': 0, 'FL': 1}
+    assert shard_map.shard_for_state('ca') == 0 and shard_map.shard_for_state('FL') == 1
+    # Unpinned states all hash onto the one shard nothing is pinned to
+    assert {shard_map.shard_for_state(state) for state in ['TX', 'NY', 'MA', 'WA']} == {2}
+    assert ShardMap(4).shard_for_state('TX') == ShardMap(4).shard_for_state('tx')
+    assert shard_map.states_for(2, ['CA', 'TX', 'FL']) == ['TX']
+    for bad in [(0, None), (2, {'CA': 2})]:
+        try:
+            ShardMap(*bad)
+            assert False, f'expected ValueError for {bad}'
+        except ValueError:
+            pass
+
+def test_merge_screens():
+    query = {'sort': 'market_heat', 'descending': True, 'limit': 3, 'offset': 1}
+    bodies = [
+        {'total': 10, 'query': query, 'data_version': 'd', 'model_version': 'm',
+         'results': [{'zip_code': '10001', 'market_heat': 90}, {'zip_code': '10002', 'market_heat': 70},
+                     {'zip_code': '10005', 'market_heat': 60}, {'zip_code': '10009', 'market_heat': 10}]},
+        {'total': 5, 'query': query, 'data_version': 'd', 'model_version': 'm',
+         'results': [{'zip_code': '02001', 'market_heat': 80}, {'zip_code': '02002', 'market_heat': 70}]}
+    ]
+    merged = merge_screens(bodies, offset=1, limit=3)
+    assert merged['total'] == 15
+    # Ties on the sort field go to the lower ZIP code
+    assert [row['zip_code'] for row in merged['results']] == ['02001', '02002', '10002']
+    assert merged['query'] == query and merged['data_version'] == 'd' and merged['model_version'] == 'm'
+
+    ascending = dict(query, descending=False)
+    merged = merge_screens([dict(body, query=ascending, results=body['results'][::-1]) for body in bodies], 0, 2)
+    assert [row['zip_code'] for row in merged['results']] == ['10009', '10005']
+
+def test_sharded_serving():
+    work_dir = tempfile.mkdtemp(prefix='router_')
+    try:
+        shard_map = ShardMap(2)
+        single = run_shard(SCREEN_QUERY, work_dir)
+        assert set(single['statuses'].values()) == {200}
+
+        shards = [run_shard(SCREEN_QUERY + '&_scatter=1', work_dir, SHARD_COUNT='2', SHARD_ID=str(shard))
+                  for shard in range(2)]
+        for shard, result in enumerate(shards):
+            for state, status in result['statuses'].items():
+                assert status == (200 if shard_map.shard_for_state(state) == shard else 421), (shard, state)
+            misdirected = result['misdirected']
+            assert misdirected['shard'] == shard_map.shard_for_state(misdirected['state']) != shard
+
+        # The router's merge of the shards' pages is the page a single process serves
+        merged = merge_screens([result['screen'] for result in shards], offset=10, limit=30)
+        assert merged['total'] == single['screen']['total']
+        assert merged['results'] == single['screen']['results']
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_shard_map()
+    test_merge_screens()
+    test_sharded_serving()
+    print("Shards answer their own states, send the rest away and merge into the unsharded screen")
@@ -0,0 +1,49 @@
+"""
+Checks the ranking of /api/search typeahead suggestions on a handful of
+ZIP codes, and that every ZIP code of the processed data finds itself
+first. Run from backend/, either directly or through pytest.
+"""
+import pandas as pd
+from search_index import SearchIndex
+
+ZIPS = pd.DataFrame({
+    'zip_code': ['02139', '02140', '02141', '75001', '76101', '76102', '10001'],
+    'city': ['Cambridge', 'Cambridge', 'Cambridge', 'Addison', 'Fort Worth', 'Fort Worth', 'New York'],
+    'state': ['MA', 'MA', 'MA', 'TX', 'TX', 'TX', 'NY'],
+    'region_id': [394404, 394404, 394404, 394514, 394514, 394514, 394913],
+    'msa_name': ['Boston, MA', 'Boston, MA', 'Boston, MA', 'Dallas-Fort Worth, TX', 'Dallas-Fort Worth, TX',
+                 'Dallas-Fort Worth, TX', 'New York, NY']
+})
+
+def labels(index, query, limit=10):
+    return [(result['type'], result['label']) for result in index.search(query, limit)]
+
+def test_search_ranking():
+    index = SearchIndex(ZIPS, data_version='test')
+    # ZIP prefixes list ZIP codes in ascending order
+    assert labels(index, '021') == [('zip', '02139 (Cambridge, MA)'), ('zip', '02140 (Cambridge, MA)'),
+                                    ('zip', '02141 (Cambridge, MA)')]
+    assert labels(index, '021', limit=2) == labels(index, '021')[:2]
+    assert labels(index, '02139') == [('zip', '02139 (Cambridge, MA)')]
+    # Cities and MSAs are matched case-insensitively, one suggestion per city and state
+    assert labels(index, 'CAM') == [('city', 'Cambridge, MA')]
+    # A full-name match outranks a match on a later word of a bigger MSA
+    assert labels(index, 'fort') == [('city', 'Fort Worth, TX'), ('msa', 'Dallas-Fort Worth, TX')]
+    assert labels(index, 'worth') == [('city', 'Fort Worth, TX'), ('msa', 'Dallas-Fort Worth, TX')]
+    # Hyphens and commas are typed as spaces
+    assert labels(index, 'dallas fort') == [('msa', 'Dallas-Fort Worth, TX')]
+    assert labels(index, 'New-York') == [('city', 'New York, NY'), ('msa', 'New York, NY')]
+    msa = index.search('boston')[0]
+    assert msa['region_id'] == '394404' and msa['states'] == ['MA'] and msa['zip_count'] == 3
+    assert labels(index, 'zzz') == [] and labels(index, '   ') == []
+
+def test_every_zip_finds_itself():
+    zip_data = pd.read_csv('data/processed_zip_data.csv', dtype={'zip_code': str})
+    index = SearchIndex(zip_data)
+    for zip_code in zip_data['zip_code']:
+        assert index.search(zip_code, 1)[0]['zip_code'] == zip_code
+
+if __name__ == "__main__":
+    test_search_ranking()
+    test_every_zip_finds_itself()
+    print("Search suggestions rank as expected and every ZIP code finds itself")
@@ -0,0 +1,63 @@
+"""
+Checks axis parsing, grid construction and the response surface behind
+/api/analysis/<zip>/sensitivity, scoring rows of the processed data with
+the active model version. Run from backend/, either directly or through
+pytest.
+"""
+import numpy as np
+import pandas as pd
+from model_registry import ModelBundle, get_active_version
+from sensitivity import FEATURE_COLUMNS, build_grid, parse_axis, response_surface, score_grid
+
+def test_parse_axis():
+    feature, changes = parse_axis('median_rent:-10:10:5')
+    assert feature == 'median_rent' and np.allclose(changes, [-0.1, -0.05, 0, 0.05, 0.1])
+    feature, changes = parse_axis('days_pending:-20,0,15.5')
+    assert feature == 'days_pending' and np.allclose(changes, [-0.2, 0, 0.155])
+    for bad in ['price_to_rent:-10:10:5', 'rent:0', 'median_rent', 'median_rent:', 'median_rent:-10:10:0',
+                'median_rent:-10:10:102', 'median_rent:-100,0', 'median_rent:a,b', 'median_rent:nan,0',
+                'median_rent:0:inf:3', 'median_rent:1:2']:
+        try:
+            parse_axis(bad)
+            assert False, f'expected ValueError for {bad!r}'
+        except ValueError:
+            pass
+
+def test_build_grid():
+    base = {'median_home_value': 300000.0, 'median_rent': 2000.0, 'days_pending': 30.0,
+            'price_cuts_percent': 10.0, 'market_heat': 50.0, 'price_to_rent': 12.5}
+    grid = build_grid(base, [parse_axis('median_home_value:-10,0,10'), parse_axis('median_rent:0,25')])
+    assert list(grid.columns) == FEATURE_COLUMNS and len(grid) == 6
+    # First axis varies slowest
+    assert grid['median_home_value'].tolist() == [270000.0, 270000.0, 300000.0, 300000.0, 330000.0, 330000.0]
+    assert grid['median_rent'].tolist() == [2000.0, 2500.0] * 3
+    assert (grid['days_pending'] == 30.0).all()
+    # price_to_rent follows the varied home value and rent
+    assert grid['price_to_rent'].tolist() == [11.25, 9.0, 12.5, 10.0, 13.75, 11.0]
+
+def test_response_surface():
+    bundle = ModelBundle.load(get_active_version() or 'legacy')
+    zip_data = pd.read_csv('data/processed_zip_data.csv', dtype={'zip_code': str})
+    base = zip_data.iloc[0]
+    baseline, surface = response_surface(base, [parse_axis('market_heat:-20:20:5'), parse_axis('median_rent:0,10')],
+                                         bundle)
+    investment, ranking = score_grid(bundle, zip_data.iloc[[0]][FEATURE_COLUMNS].reset_index(drop=True))
+    assert baseline == {'investment_score': float(investment[0]), 'ranking_score': float(ranking[0])}
+
+    assert [axis['feature'] for axis in surface['axes']] == ['market_heat', 'median_rent']
+    assert surface['axes'][0]['changes_percent'] == [-20.0, -10.0, 0.0, 10.0, 20.0]
+    assert np.allclose(surface['axes'][1]['values'], [base['median_rent'], base['median_rent'] * 1.1])
+    assert np.array(surface['investment_score']).shape == (5, 2)
+    assert np.array(surface['ranking_score']).shape == (5, 2)
+    # Each grid point scores like the same row scored on its own
+    grid = build_grid(base, [parse_axis('market_heat:-20:20:5'), parse_axis('median_rent:0,10')])
+    investment, ranking = score_grid(bundle, grid.iloc[[7]].reset_index(drop=True))
+    assert surface['investment_score'][3][1] == float(investment[0])
+    assert surface['ranking_score'][3][1] == float(ranking[0])
+    assert surface['price_to_rent'][3][1] == grid['price_to_rent'].iloc[7]
+
+if __name__ == "__main__":
+    test_parse_axis()
+    test_build_grid()
+    test_response_surface()
+    print("Sensitivity axes parse, grids are laid out as documented and surfaces score like single rows")
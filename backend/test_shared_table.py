@@ -0,0 +1,72 @@
+"""
+Checks that pruning leaves recently published tables alone, so workers
+still attaching to them can map them, and that a table that does not fit
+in the shared table directory is published under the fallback directory
+instead. Run from backend/, either directly or through pytest.
+"""
+import errno
+import os
+import shutil
+import tempfile
+import time
+import shared_table
+from shared_table import attach_table, prune_tables
+from test_market_index import load_zip_data
+from model_registry import ModelBundle, get_active_version
+
+def make_table(base_dir, name, age):
+    path = os.path.join(base_dir, name)
+    os.makedirs(path)
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        f.write('{}')
+    open(path + '.lock', 'w').close()
+    published = time.time() - age
+    os.utime(path, (published, published))
+    return path
+
+def test_prune_keeps_young_tables():
+    base_dir = tempfile.mkdtemp(prefix='shared_table_')
+    try:
+        old = [make_table(base_dir, f'old{i}', 3600 + i) for i in range(3)]
+        young = [make_table(base_dir, f'young{i}', 10 + i) for i in range(3)]
+        prune_tables(base_dir, keep=2, min_age=300)
+        # The two newest are kept anyway; of the rest only those older than min_age go
+        assert all(os.path.exists(path) for path in young)
+        assert not any(os.path.exists(path) or os.path.exists(path + '.lock') for path in old)
+
+        prune_tables(base_dir, keep=2, min_age=0)
+        assert sorted(os.listdir(base_dir)) == ['young0', 'young0.lock', 'young1', 'young1.lock']
+    finally:
+        shutil.rmtree(base_dir, ignore_errors=True)
+
+def test_full_directory_falls_back():
+    work_dir = tempfile.mkdtemp(prefix='shared_table_')
+    publish_table, fallback_dir = shared_table.publish_table, shared_table.SHARED_TABLE_FALLBACK_DIR
+    shm_dir = os.path.join(work_dir, 'shm')
+
+    def publish_or_fill_up(arrays, path, manifest):
+        if path.startswith(shm_dir):
+            os.makedirs(f'{path}.tmp{os.getpid()}')
+            raise OSError(errno.ENOSPC, 'No space left on device')
+        publish_table(arrays, path, manifest)
+
+    try:
+        shared_table.publish_table = publish_or_fill_up
+        shared_table.SHARED_TABLE_FALLBACK_DIR = os.path.join(work_dir, 'disk')
+        zip_data = load_zip_data()
+        bundle = ModelBundle.load(get_active_version() or 'legacy')
+        table = attach_table('test', bundle, lambda: zip_data, base_dir=shm_dir)
+        assert os.path.dirname(table.path) == shared_table.SHARED_TABLE_FALLBACK_DIR
+        assert len(table) == len(zip_data) and table.zip_codes([0]) == [zip_data['zip_code'][0]]
+        # No partial table is left behind, and later workers find the fallback copy without building
+        assert [name for name in os.listdir(shm_dir) if not name.endswith('.lock')] == []
+        shared_table.publish_table = None
+        assert attach_table('test', bundle, lambda: zip_data, base_dir=shm_dir).path == table.path
+    finally:
+        shared_table.publish_table, shared_table.SHARED_TABLE_FALLBACK_DIR = publish_table, fallback_dir
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_prune_keeps_young_tables()
+    test_full_directory_falls_back()
+    print("Young tables survive pruning and full directories fall back to disk")
@@ -0,0 +1,86 @@
+"""
+Checks SimilarMarkets.nearest against a brute-force search over the MSA
+points, with and without state and score filters, both when the filtered
+MSAs are scanned directly and when they are found through the KD-tree.
+The index is built from data/processed_zip_data.csv into a temporary
+shared-table directory. Run from backend/, either directly or through
+pytest.
+"""
+import numpy as np
+import shutil
+import tempfile
+import similar_markets
+from similar_markets import SimilarMarkets
+from test_market_index import build_index, load_zip_data
+
+def brute_force(similar, position, k, eligible):
+    """(positions, distances) of the k closest eligible MSAs, ties by position"""
+    candidates = np.flatnonzero(eligible)
+    candidates = candidates[candidates != position]
+    distances = np.sqrt(((similar.points[candidates] - similar.points[position]) ** 2).sum(axis=1))
+    order = np.lexsort((candidates, distances))[:k]
+    return candidates[order], distances[order]
+
+def check_nearest(similar, zip_data, position, k, states=None, min_score=None, max_score=None):
+    region_states = zip_data.groupby('region_id')['state'].agg(set)
+    eligible = np.array([(not states or bool(region_states[region_id] & set(states))) and
+                         (min_score is None or score >= min_score) and (max_score is None or score <= max_score)
+                         for region_id, score in zip(similar.region_ids, similar.scores)])
+    positions, distances = similar.nearest(position, k=k, states=states, min_score=min_score, max_score=max_score)
+    expected_positions, expected_distances = brute_force(similar, position, k, eligible)
+    assert len(positions) == len(expected_positions) == min(k, int(eligible.sum()) - int(eligible[position]))
+    assert np.allclose(distances, expected_distances)
+    # The tree may order equally distant MSAs differently, so compare distances and check every hit passes
+    assert eligible[positions].all() and position not in positions
+    assert np.allclose(np.sqrt(((similar.points[positions] - similar.points[position]) ** 2).sum(axis=1)), distances)
+    return positions
+
+def test_points_follow_first_row():
+    zip_data = load_zip_data()
+    work_dir = tempfile.mkdtemp(prefix='similar_markets_')
+    try:
+        index, bundle = build_index(zip_data, work_dir)
+        similar = SimilarMarkets(index, bundle)
+        first_rows = zip_data.drop_duplicates('region_id').set_index('region_id')
+        assert len(similar) == len(first_rows)
+        feature_names = list(bundle.model_info['feature_names'])
+        for position in [0, len(similar) // 2, len(similar) - 1]:
+            row = first_rows.loc[[similar.region_ids[position]], feature_names]
+            assert np.allclose(similar.points[position], bundle.clf_scaler.transform(row)[0], atol=1e-3)
+            assert similar.position(str(similar.region_ids[position])) == position
+        assert similar.position('not-a-region') is None
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def test_nearest_matches_brute_force():
+    zip_data = load_zip_data()
+    work_dir = tempfile.mkdtemp(prefix='similar_markets_')
+    scan_max = similar_markets.SCAN_MAX
+    try:
+        index, bundle = build_index(zip_data, work_dir)
+        similar = SimilarMarkets(index, bundle)
+        median_score = float(np.median(similar.scores))
+        position = int(np.flatnonzero(similar.state_masks['CA'])[0])
+        queries = [{}, {'states': ['TX']}, {'states': ['CA', 'NY']}, {'min_score': median_score},
+                   {'max_score': median_score, 'states': ['CA', 'TX', 'FL']},
+                   {'min_score': float(similar.scores.max()) + 1}, {'states': ['ZZ']}]
+        for scan in [True, False]:
+            # SCAN_MAX of 0 sends every filtered query through the tree
+            similar_markets.SCAN_MAX = scan_max if scan else 0
+            for query in queries:
+                for k in [1, 10, 100]:
+                    check_nearest(similar, zip_data, position, k, **query)
+
+        assert len(similar.nearest(position, k=10, min_score=float(similar.scores.max()) + 1)[0]) == 0
+        positions, distances = similar.nearest(position, k=5, states=['TX'])
+        records = similar.records(positions, distances)
+        assert [record['distance'] for record in records] == distances.tolist()
+        assert all('TX' in record['states'] for record in records)
+    finally:
+        similar_markets.SCAN_MAX = scan_max
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    test_points_follow_first_row()
+    test_nearest_matches_brute_force()
+    print("Nearest MSAs match a brute-force search with and without filters")
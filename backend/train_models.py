@@ -1,10 +1,39 @@
 import pandas as pd
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier, RandomForestRegressor
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import train_test_split, KFold, StratifiedKFold, ParameterGrid
 from sklearn.preprocessing import StandardScaler
+from concurrent.futures import ProcessPoolExecutor
 import joblib
+import argparse
+import hashlib
+import json
 import os
+import time
+from model_registry import publish_version
+
+# Hyperparameter grids searched by --search, kept around the conservative defaults
+PARAM_GRIDS = {
+    'classifier': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [3, 5, 8],
+        'min_samples_split': [2, 5],
+        'min_samples_leaf': [1, 2, 4]
+    },
+    'ranker': {
+        'n_estimators': [50, 100, 200],
+        'max_depth': [3, 5, 8],
+        'min_samples_split': [2, 5],
+        'min_samples_leaf': [1, 2, 4]
+    }
+}
+
+DEFAULT_PARAMS = {
+    'n_estimators': 50,
+    'max_depth': 5,
+    'min_samples_split': 5,
+    'min_samples_leaf': 2
+}
 
 def load_and_preprocess_data():
     """
@@ -107,7 +136,7 @@ def prepare_features_and_target(data):
     
     return X, y_clf, y_reg
 
-def train_investment_classifier(X_train, y_train):
+def train_investment_classifier(X_train, y_train, params=None, random_state=42):
     """
     Trains model to classify if a zip code is good for investment
     Based on price-to-rent ratio, market heat, and price stability
@@ -119,17 +148,14 @@ def train_investment_classifier(X_train, y_train):
     
     # Train with more conservative parameters to prevent overfitting
     clf = RandomForestClassifier(
-        n_estimators=50,  # Reduced from 100
-        max_depth=5,      # Reduced from 10
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42
+        **(params or DEFAULT_PARAMS),
+        random_state=random_state
     )
     clf.fit(X_train_scaled, y_train)
     
     return clf, scaler
 
-def train_ranking_model(X_train, y_train):
+def train_ranking_model(X_train, y_train, params=None, random_state=42):
     """
     Trains model to score/rank zip codes within each state
     Based on combined investment metrics
@@ -141,39 +167,19 @@ def train_ranking_model(X_train, y_train):
     
     # Train with more conservative parameters
     ranker = RandomForestRegressor(
-        n_estimators=50,
-        max_depth=5,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42
+        **(params or DEFAULT_PARAMS),
+        random_state=random_state
     )
     ranker.fit(X_train_scaled, y_train)
     
     return ranker, scaler
 
-def train_and_save_models():
-    """Train both models and save them"""
-    # Load and prepare data
-    data = load_and_preprocess_data()
-    X, y_clf, y_reg = prepare_features_and_target(data)
-    
-    # Split data into train/test sets
-    X_train, X_test, y_clf_train, y_clf_test, y_reg_train, y_reg_test = train_test_split(
-        X, y_clf, y_reg, test_size=0.2, random_state=42
-    )
-    
-    # Train classification model
-    clf, clf_scaler = train_investment_classifier(X_train, y_clf_train)
-    X_test_scaled = clf_scaler.transform(X_test)
-    clf_score = clf.score(X_test_scaled, y_clf_test)
-    print(f"Classification Model Accuracy: {clf_score:.2f}")
-    
-    # Train ranking model
-    ranker, rank_scaler = train_ranking_model(X_train, y_reg_train)
-    X_test_scaled = rank_scaler.transform(X_test)
-    rank_score = ranker.score(X_test_scaled, y_reg_test)
-    print(f"Ranking Model R² Score: {rank_score:.2f}")
-    
+def split_data(X, y_clf, y_reg, seed=42):
+    """Split data into train/test sets"""
+    return train_test_split(X, y_clf, y_reg, test_size=0.2, random_state=seed)
+
+def save_models(clf, ranker, clf_scaler, rank_scaler, X, X_test, y_clf_test, y_reg_test):
+    """Save models, scalers, model info and the held-out test data"""
     # Create model directory if it doesn't exist
     os.makedirs('model', exist_ok=True)
     
@@ -194,6 +200,15 @@ def train_and_save_models():
     }
     joblib.dump(model_info, 'model/model_info.joblib')
     
+    # Publish the same artifacts as a new registry version for hot reload
+    version = publish_version({
+        'classifier': clf,
+        'ranker': ranker,
+        'clf_scaler': clf_scaler,
+        'rank_scaler': rank_scaler,
+        'model_info': model_info
+    }, model_dir='model')
+    
     # Save test data for evaluation
     test_data = pd.DataFrame({
         'X_test': [X_test.to_dict()],
@@ -201,6 +216,163 @@ def train_and_save_models():
         'y_reg_test': [y_reg_test.to_dict()]
     })
     joblib.dump(test_data, 'model/test_data.joblib')
+    return version
+
+def train_and_save_models():
+    """Train both models and save them, returning the published version"""
+    # Load and prepare data
+    data = load_and_preprocess_data()
+    X, y_clf, y_reg = prepare_features_and_target(data)
+    
+    # Split data into train/test sets
+    X_train, X_test, y_clf_train, y_clf_test, y_reg_train, y_reg_test = split_data(X, y_clf, y_reg)
+    
+    # Train classification model
+    clf, clf_scaler = train_investment_classifier(X_train, y_clf_train)
+    X_test_scaled = clf_scaler.transform(X_test)
+    clf_score = clf.score(X_test_scaled, y_clf_test)
+    print(f"Classification Model Accuracy: {clf_score:.2f}")
+    
+    # Train ranking model
+    ranker, rank_scaler = train_ranking_model(X_train, y_reg_train)
+    X_test_scaled = rank_scaler.transform(X_test)
+    rank_score = ranker.score(X_test_scaled, y_reg_test)
+    print(f"Ranking Model R² Score: {rank_score:.2f}")
+    
+    return save_models(clf, ranker, clf_scaler, rank_scaler, X, X_test, y_clf_test, y_reg_test)
+
+def load_cached_features(cache_dir='model/cache'):
+    """
+    Load the feature matrix and targets, reusing a cached copy when the
+    Zillow source files have not changed since it was built
+    """
+    data_dir = os.path.join(os.path.dirname(__file__), 'zillow-data')
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(data_dir)):
+        with open(os.path.join(data_dir, name), 'rb') as f:
+            digest.update(name.encode())
+            digest.update(f.read())
+    cache_path = os.path.join(cache_dir, f'features_{digest.hexdigest()[:16]}.joblib')
+    
+    if os.path.exists(cache_path):
+        print(f"Using cached features from {cache_path}")
+        return cache_path
+    
+    data = load_and_preprocess_data()
+    X, y_clf, y_reg = prepare_features_and_target(data)
+    os.makedirs(cache_dir, exist_ok=True)
+    joblib.dump({'X': X, 'y_clf': y_clf, 'y_reg': y_reg}, cache_path)
+    print(f"Cached features to {cache_path}")
+    return cache_path
+
+# Per-process training data, set up once by the pool initializer
+_search_data = {}
+
+def _init_search_worker(cache_path, seed):
+    """Load the cached features and the training split once per worker process"""
+    cached = joblib.load(cache_path)
+    X_train, _, y_clf_train, _, y_reg_train, _ = split_data(
+        cached['X'], cached['y_clf'], cached['y_reg'], seed
+    )
+    _search_data.update({
+        'X': X_train.reset_index(drop=True),
+        'classifier': y_clf_train.reset_index(drop=True),
+        'ranker': y_reg_train.reset_index(drop=True)
+    })
+
+def _evaluate_candidate(task):
+    """Fit one model on one cross-validation fold and score it on the held-out fold"""
+    model_kind, params, train_idx, val_idx, seed = task
+    X, y = _search_data['X'], _search_data[model_kind]
+    train_fn = train_investment_classifier if model_kind == 'classifier' else train_ranking_model
+    model, scaler = train_fn(X.iloc[train_idx], y.iloc[train_idx], params, random_state=seed)
+    score = model.score(scaler.transform(X.iloc[val_idx]), y.iloc[val_idx])
+    return model_kind, json.dumps(params, sort_keys=True), float(score)
+
+def search_and_save_models(folds=5, workers=None, seed=42, progress=None):
+    """
+    Run a cross-validated hyperparameter search for both models concurrently
+    on a process pool, then refit and save the best candidates.
+    progress, if given, is called as progress(stage, done, total).
+    """
+    start_time = time.time()
+    cache_path = load_cached_features()
+    cached = joblib.load(cache_path)
+    X, y_clf, y_reg = cached['X'], cached['y_clf'], cached['y_reg']
+    X_train, X_test, y_clf_train, y_clf_test, y_reg_train, y_reg_test = split_data(X, y_clf, y_reg, seed)
+    
+    # Folds are computed once here so every candidate sees the same splits
+    splitters = {
+        'classifier': StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed),
+        'ranker': KFold(n_splits=folds, shuffle=True, random_state=seed)
+    }
+    targets = {'classifier': y_clf_train, 'ranker': y_reg_train}
+    tasks = []
+    for model_kind, grid in PARAM_GRIDS.items():
+        fold_indices = list(splitters[model_kind].split(X_train, targets[model_kind]))
+        for params in ParameterGrid(grid):
+            for train_idx, val_idx in fold_indices:
+                tasks.append((model_kind, params, train_idx, val_idx, seed))
+    
+    workers = workers or os.cpu_count() or 1
+    print(f"Evaluating {len(tasks)} fits for both models on {workers} workers...")
+    fold_scores = {model_kind: {} for model_kind in PARAM_GRIDS}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                             initargs=(cache_path, seed)) as pool:
+        for done, (model_kind, params_key, score) in enumerate(pool.map(_evaluate_candidate, tasks, chunksize=4), 1):
+            fold_scores[model_kind].setdefault(params_key, []).append(score)
+            if progress is not None:
+                progress('search', done, len(tasks))
+    
+    # Rank candidates by mean cross-validated score
+    report = {'seed': seed, 'folds': folds, 'workers': workers, 'models': {}}
+    best_params = {}
+    for model_kind, scores in fold_scores.items():
+        candidates = sorted(
+            ({'params': json.loads(key), 'mean_score': float(np.mean(values)), 'std_score': float(np.std(values))}
+             for key, values in scores.items()),
+            key=lambda candidate: candidate['mean_score'],
+            reverse=True
+        )
+        best_params[model_kind] = candidates[0]['params']
+        report['models'][model_kind] = {
+            'metric': 'accuracy' if model_kind == 'classifier' else 'r2',
+            'best_params': candidates[0]['params'],
+            'best_cv_score': candidates[0]['mean_score'],
+            'candidates': candidates
+        }
+    
+    # Refit the best candidates on the full training split
+    if progress is not None:
+        progress('refit', 0, 1)
+    clf, clf_scaler = train_investment_classifier(X_train, y_clf_train, best_params['classifier'], random_state=seed)
+    clf_score = clf.score(clf_scaler.transform(X_test), y_clf_test)
+    print(f"Classification Model Accuracy: {clf_score:.2f} with {best_params['classifier']}")
+    
+    ranker, rank_scaler = train_ranking_model(X_train, y_reg_train, best_params['ranker'], random_state=seed)
+    rank_score = ranker.score(rank_scaler.transform(X_test), y_reg_test)
+    print(f"Ranking Model R² Score: {rank_score:.2f} with {best_params['ranker']}")
+    
+    report['model_version'] = save_models(clf, ranker, clf_scaler, rank_scaler, X, X_test, y_clf_test, y_reg_test)
+    
+    report['models']['classifier']['test_score'] = float(clf_score)
+    report['models']['ranker']['test_score'] = float(rank_score)
+    report['elapsed_seconds'] = round(time.time() - start_time, 2)
+    os.makedirs('model/results', exist_ok=True)
+    with open('model/results/search_report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Search report saved to model/results/search_report.json ({report['elapsed_seconds']}s)")
+    return report
 
 if __name__ == '__main__':
-    train_and_save_models()
+    parser = argparse.ArgumentParser(description='Train the investment classifier and ZIP ranker')
+    parser.add_argument('--search', action='store_true', help='Run a cross-validated hyperparameter search')
+    parser.add_argument('--folds', type=int, default=5, help='Cross-validation folds for --search')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for --search (default: all cores)')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for splits and models')
+    args = parser.parse_args()
+    
+    if args.search:
+        search_and_save_models(folds=args.folds, workers=args.workers, seed=args.seed)
+    else:
+        train_and_save_models()